@@ -8,7 +8,16 @@ This package implements a hybrid LangGraph AI agent that provides:
 - Efficient caching and optimization
 """
 
-from .agent import NutritionAgent
-from .models.state import NutritionAgentState
+__all__ = ["NutritionAgent", "NutritionAgentState"]
 
-__all__ = ["NutritionAgent", "NutritionAgentState"]
\ No newline at end of file
+
+def __getattr__(name):
+    # Imported on first access so that importing ai_agent.api (the router)
+    # doesn't load langgraph and langchain
+    if name == "NutritionAgent":
+        from .agent import NutritionAgent
+        return NutritionAgent
+    if name == "NutritionAgentState":
+        from .models.state import NutritionAgentState
+        return NutritionAgentState
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -11,17 +11,32 @@ Implements the hybrid single agent + selective delegation pattern:
 import asyncio
 import json
 import logging
+import os
+import re
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Any, AsyncIterator
+from typing import Dict, Optional, Any, AsyncIterator
 
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.prebuilt import ToolNode
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, RemoveMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 
 from .models.state import NutritionAgentState, QueryIntent, QueryType
 from .services.data_service import NutritionDataService
+from .services.checkpointer import MongoCheckpointSaver
+from .services.tool_cache import end_turn, start_turn, turn_cache_hits
+from .services.answer_cache import CACHEABLE_INTENTS, answer_cache, is_cacheable_question, profile_partition
+from .services.context_manager import (
+    CONTEXT_TOKEN_BUDGET,
+    apply_updates,
+    compact_tool_messages,
+    estimate_message_tokens,
+    estimate_tokens,
+    split_for_summary,
+    transcript,
+    usage_tokens
+)
 from .tools.nutrition_tools import (
     get_user_nutrition_progress,
     get_available_dining_foods,
@@ -41,6 +56,10 @@ from .tools.weight_tools import (
 
 logger = logging.getLogger(__name__)
 
+# Limits for the tools node: each tool call, and the whole turn (from analyze_query)
+TOOL_TIMEOUT_SECONDS = float(os.getenv("AGENT_TOOL_TIMEOUT_SECONDS", "10"))
+TURN_DEADLINE_SECONDS = float(os.getenv("AGENT_TURN_DEADLINE_SECONDS", "30"))
+
 
 class NutritionAgent:
     """
@@ -51,13 +70,14 @@ class NutritionAgent:
     - Smart data retrieval from MongoDB
     - Personalized responses based on user data
     - Real-time streaming
-    - Conversation memory
+    - Conversation memory (persisted in MongoDB, shared by all workers)
     """
     
     def __init__(self, db_client, openai_api_key: str):
         """Initialize the nutrition agent."""
         self.db_client = db_client
         self.data_service = NutritionDataService(db_client)
+        self.data_service.conversation_store.ensure_indexes()
         
         # Set data service for tools
         set_nutrition_data_service(self.data_service)
@@ -68,7 +88,8 @@ class NutritionAgent:
             api_key=openai_api_key,
             model="gpt-4o-mini",
             temperature=0.7,
-            streaming=True
+            streaming=True,
+            stream_usage=True  # report token usage on streamed responses
         )
         
         # Initialize tools
@@ -85,6 +106,11 @@ class NutritionAgent:
             get_weight_goal_analysis
         ]
         
+        self.tools_by_name = {tool.name: tool for tool in self.tools}
+        
+        # Fire-and-forget work (answer cache fills); referenced so it isn't garbage collected
+        self._background_tasks = set()
+        
         # Create LLM with tools
         self.llm_with_tools = self.llm.bind_tools(self.tools)
         
@@ -99,12 +125,14 @@ class NutritionAgent:
         
         # Add nodes
         graph.add_node("analyze_query", self._analyze_query)
+        graph.add_node("manage_context", self._manage_context)
         graph.add_node("call_model", self._call_model)
-        graph.add_node("tools", ToolNode(self.tools))
+        graph.add_node("tools", self._run_tools)
         
         # Define flow
         graph.add_edge(START, "analyze_query")
-        graph.add_edge("analyze_query", "call_model")
+        graph.add_edge("analyze_query", "manage_context")
+        graph.add_edge("manage_context", "call_model")
         
         # Conditional edges for tool calling
         graph.add_conditional_edges(
@@ -115,11 +143,12 @@ class NutritionAgent:
                 "end": END
             }
         )
-        graph.add_edge("tools", "call_model")
+        graph.add_edge("tools", "manage_context")
         
         # Add memory
-        memory = MemorySaver()
-        return graph.compile(checkpointer=memory)
+        self.checkpointer = MongoCheckpointSaver(self.data_service.db)
+        self.checkpointer.ensure_indexes()
+        return graph.compile(checkpointer=self.checkpointer)
     
     async def _analyze_query(self, state: NutritionAgentState) -> NutritionAgentState:
         """Analyze the user's query to understand intent."""
@@ -227,6 +256,101 @@ class NutritionAgent:
             return 'snack'
         return None
     
+    async def _run_tools(self, state: NutritionAgentState, config: RunnableConfig) -> Dict[str, Any]:
+        """
+        Run the tool calls of the last model message concurrently.
+        
+        Each call gets TOOL_TIMEOUT_SECONDS, capped by what is left of the
+        turn deadline. A call that times out or fails still gets a result
+        saying so, so the model can answer with the data that did arrive.
+        Per-tool latency is appended to execution_path ("tool:<name>:<ms>ms").
+        """
+        
+        tool_calls = state["messages"][-1].tool_calls
+        start_time = state.get("start_time") or datetime.now()
+        remaining = TURN_DEADLINE_SECONDS - (datetime.now() - start_time).total_seconds()
+        timeout = max(0.0, min(TOOL_TIMEOUT_SECONDS, remaining))
+        
+        async def run(call: Dict[str, Any]):
+            name = call["name"]
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                tool = self.tools_by_name.get(name)
+                if tool is None:
+                    raise ValueError(f"Unknown tool {name}")
+                if timeout <= 0:
+                    raise asyncio.TimeoutError()
+                output = await asyncio.wait_for(tool.ainvoke(call["args"], config), timeout)
+                content = output if isinstance(output, str) else json.dumps(output, default=str)
+            except asyncio.TimeoutError:
+                status = "timeout"
+                content = json.dumps({
+                    "error": f"{name} timed out after {timeout:.0f}s",
+                    "partial": True,
+                    "note": "Answer with the other results; offer to check this again."
+                })
+            except Exception as e:
+                status = "error"
+                logger.error(f"Tool {name} failed: {e}")
+                content = json.dumps({"error": f"{name} failed", "partial": True})
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            message = ToolMessage(
+                content=content,
+                name=name,
+                tool_call_id=call["id"],
+                status="success" if status == "ok" else "error"
+            )
+            path_entry = f"tool:{name}:{elapsed_ms:.0f}ms" + ("" if status == "ok" else f":{status}")
+            return message, path_entry
+        
+        results = await asyncio.gather(*(run(call) for call in tool_calls))
+        return {
+            "messages": [message for message, _ in results],
+            "tools_called": state.get("tools_called", []) + [call["name"] for call in tool_calls],
+            "execution_path": state.get("execution_path", []) + [entry for _, entry in results]
+        }
+    
+    async def _manage_context(self, state: NutritionAgentState) -> Dict[str, Any]:
+        """Keep the prompt within the token budget before each model call."""
+        
+        messages = state.get("messages", [])
+        updates = compact_tool_messages(messages)
+        messages = apply_updates(messages, updates)
+        summary = state.get("conversation_summary")
+        tokens_used = state.get("total_tokens_used", 0)
+        
+        prompt_tokens = estimate_message_tokens(messages) + estimate_tokens(summary or "")
+        older, recent = split_for_summary(messages)
+        if prompt_tokens > CONTEXT_TOKEN_BUDGET and older:
+            try:
+                summary_response = await self.llm.ainvoke([
+                    SystemMessage(content=(
+                        "Summarize this conversation between a college student and their nutrition "
+                        "assistant in under 150 words. Keep goals, preferences, restrictions, numbers "
+                        "and any advice already given; drop small talk."
+                    )),
+                    HumanMessage(content=(
+                        (f"Summary so far: {summary}\n\n" if summary else "") + transcript(older)
+                    ))
+                ])
+                summary = summary_response.content
+                tokens_used += usage_tokens(summary_response)
+                updates = [message for message in updates if message.id not in {m.id for m in older}]
+                updates += [RemoveMessage(id=message.id) for message in older]
+                prompt_tokens = estimate_message_tokens(recent) + estimate_tokens(summary)
+                logger.info(f"Summarized {len(older)} older messages for user {state.get('user_id')}")
+            except Exception as e:
+                # Over budget is slower and costlier, not wrong; try again next call
+                logger.warning(f"Context summarization failed: {e}")
+        
+        return {
+            "messages": updates,
+            "conversation_summary": summary,
+            "context_tokens": prompt_tokens,
+            "total_tokens_used": tokens_used
+        }
+    
     async def _call_model(self, state: NutritionAgentState) -> NutritionAgentState:
         """Call the LLM with context and tools."""
         
@@ -241,7 +365,9 @@ class NutritionAgent:
         
         return {
             **state,
-            "messages": [response]
+            "messages": [response],
+            "total_tokens_used": state.get("total_tokens_used", 0) + usage_tokens(response),
+            "cache_hits": turn_cache_hits()
         }
     
     async def _build_system_prompt(self, state: NutritionAgentState) -> str:
@@ -283,6 +409,13 @@ class NutritionAgent:
         Never recommend foods that conflict with their dietary restrictions.
         """
         
+        # Carry over what earlier, summarized turns established
+        if state.get("conversation_summary"):
+            base_prompt += f"""
+            
+        Earlier in this conversation: {state["conversation_summary"]}
+        """
+        
         # Add query-specific context
         if state.get("query_intent"):
             intent = state["query_intent"]
@@ -319,20 +452,37 @@ class NutritionAgent:
             session_id: Optional session identifier for conversation memory
             
         Yields:
-            Streaming response chunks
+            Streaming response chunks. A "round_start" chunk precedes each
+            model round; the answer is the "response" text after the last one.
         """
         
+        # Data fetched during this turn is memoized until it ends
+        turn_cache = start_turn()
         try:
-            # Create session config
+            # Create session config; threads are scoped to the user so a
+            # session ID can't be used to read someone else's conversation
             config = {
                 "configurable": {
-                    "thread_id": session_id or f"user_{user_id}"
+                    "thread_id": f"{user_id}:{session_id}" if session_id else f"user_{user_id}"
                 }
             }
             
             # Load user profile for personalization
             user_profile = await self.data_service.get_user_profile(user_id)
             
+            # Generic questions are answered from the answer cache when possible
+            cache_partition = None
+            if (self._classify_intent(message).type in CACHEABLE_INTENTS
+                    and is_cacheable_question(message)):
+                cache_partition = profile_partition(user_profile)
+                cached = answer_cache.lookup(message, cache_partition)
+                if cached:
+                    async for chunk in self._replay_cached_answer(
+                        message, user_id, config, cached[0], cached[1], turn_cache.hits
+                    ):
+                        yield chunk
+                    return
+            
             # Prepare initial state
             initial_state = {
                 "messages": [HumanMessage(content=message)],
@@ -349,17 +499,44 @@ class NutritionAgent:
                 "total_tokens_used": 0
             }
             
-            # Stream the agent execution
-            async for chunk in self.agent.astream(initial_state, config=config):
-                yield self._format_chunk(chunk)
+            # Stream LLM tokens and tool calls as they happen
+            response_parts = []
+            final_state = {}
+            async for event in self.agent.astream_events(initial_state, config=config, version="v2"):
+                if event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                    output = event["data"].get("output")
+                    final_state = output if isinstance(output, dict) else {}
+                if self._is_model_event(event, "on_chat_model_start"):
+                    # Only the last model round is the answer; earlier rounds led to tool calls.
+                    # Consumers collecting "response" text reset on the same boundary.
+                    response_parts = []
+                    yield {"type": "round_start", "content": "", "node": "call_model"}
+                chunk = self._format_event(event)
+                if chunk:
+                    if chunk["type"] == "response":
+                        response_parts.append(chunk["content"])
+                    yield chunk
             
             # Save conversation to database
-            if chunk and "messages" in chunk and len(chunk["messages"]) > 0:
-                agent_response = chunk["messages"][-1].content
+            agent_response = "".join(response_parts)
+            if agent_response and cache_partition is not None and not final_state.get("tools_called"):
+                # Answered without the user's data, so other users can get it too. Later
+                # turns also see the thread history, which may hold personal details, so
+                # their answer is regenerated from the question alone before it is shared.
+                if self._is_first_turn(final_state):
+                    answer_cache.store(message, cache_partition, agent_response)
+                else:
+                    self._run_in_background(self._store_clean_answer(message, cache_partition, user_profile))
+            if agent_response:
                 await self.data_service.save_conversation_exchange(
                     user_id=user_id,
                     user_message=message,
-                    agent_response=agent_response
+                    agent_response=agent_response,
+                    metadata={
+                        "total_tokens_used": final_state.get("total_tokens_used", 0),
+                        "context_tokens": final_state.get("context_tokens", 0),
+                        "cache_hits": turn_cache.hits
+                    }
                 )
         
         except Exception as e:
@@ -369,47 +546,131 @@ class NutritionAgent:
                 "content": "I'm having trouble right now. Please try again in a moment.",
                 "error": str(e)
             }
+        finally:
+            end_turn()
+    
+    async def _replay_cached_answer(
+        self,
+        message: str,
+        user_id: str,
+        config: Dict[str, Any],
+        answer: str,
+        similarity: float,
+        cache_hits: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a cached answer in the same chunk format as a model answer.
+        
+        The exchange is still added to the conversation thread, so follow-up
+        questions have it as context, and saved to the conversation history.
+        """
+        for piece in re.findall(r"(?:\S+\s*){1,4}", answer):
+            yield {
+                "type": "response",
+                "content": piece,
+                "node": "answer_cache"
+            }
+        
+        try:
+            await self.agent.aupdate_state(
+                config,
+                {"messages": [HumanMessage(content=message), AIMessage(content=answer)], "user_id": user_id},
+                as_node="call_model"
+            )
+        except Exception as e:
+            logger.warning(f"Failed to add cached answer to thread for user {user_id}: {e}")
+        
+        await self.data_service.save_conversation_exchange(
+            user_id=user_id,
+            user_message=message,
+            agent_response=answer,
+            metadata={
+                "total_tokens_used": 0,
+                "context_tokens": 0,
+                "cache_hits": cache_hits,
+                "answer_cache_similarity": round(similarity, 3)
+            }
+        )
+    
+    @staticmethod
+    def _is_first_turn(state: Dict[str, Any]) -> bool:
+        """Whether the model saw only this turn's question (fresh thread, nothing summarized)."""
+        messages = state.get("messages", [])
+        return (not state.get("conversation_summary")
+                and sum(1 for message in messages if isinstance(message, HumanMessage)) == 1)
+    
+    def _run_in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
     
-    def _format_chunk(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
-        """Format agent chunk for streaming response."""
+    async def _store_clean_answer(self, message: str, partition: str, user_profile: Optional[Dict[str, Any]]):
+        """Answer a cacheable question from the system prompt and the question alone, and cache it."""
+        try:
+            system_prompt = await self._build_system_prompt({"user_profile": user_profile})
+            response = await self.llm.ainvoke([SystemMessage(content=system_prompt), HumanMessage(content=message)])
+            if isinstance(response.content, str) and response.content:
+                answer_cache.store(message, partition, response.content)
+        except Exception as e:
+            logger.warning(f"Failed to generate a shareable answer for the answer cache: {e}")
+    
+    @staticmethod
+    def _is_model_event(event: Dict[str, Any], kind: str) -> bool:
+        """Whether an event of this kind comes from the LLM call in call_model."""
+        return (event["event"] == kind
+                and event.get("metadata", {}).get("langgraph_node") == "call_model")
+    
+    def _format_event(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Format a LangGraph stream event for the streaming response.
         
-        # Extract the node that was executed
-        node_name = list(chunk.keys())[0] if chunk else "unknown"
-        node_data = chunk.get(node_name, {})
+        Returns:
+            A "response" chunk per LLM token delta, "tool_start"/"tool_end"
+            chunks around each tool call, "thinking" while the query is
+            analyzed, or None for events the client doesn't need
+        """
+        kind = event["event"]
         
-        if node_name == "call_model" and "messages" in node_data:
-            message = node_data["messages"][-1]
-            if hasattr(message, 'content') and message.content:
+        if self._is_model_event(event, "on_chat_model_stream"):
+            content = event["data"]["chunk"].content
+            # Tool call deltas have no text content
+            if content and isinstance(content, str):
                 return {
                     "type": "response",
-                    "content": message.content,
-                    "node": node_name
+                    "content": content,
+                    "node": "call_model"
                 }
         
-        elif node_name == "tools":
+        elif kind == "on_tool_start":
             return {
-                "type": "tool_execution",
+                "type": "tool_start",
                 "content": "Getting your data...",
-                "node": node_name
+                "tool": event["name"],
+                "node": "tools"
             }
         
-        elif node_name == "analyze_query":
+        elif kind == "on_tool_end":
+            return {
+                "type": "tool_end",
+                "content": "",
+                "tool": event["name"],
+                "node": "tools"
+            }
+        
+        elif kind == "on_chain_start" and event["name"] == "analyze_query":
             return {
                 "type": "thinking",
                 "content": "Understanding your question...",
-                "node": node_name
+                "node": "analyze_query"
             }
         
-        return {
-            "type": "processing",
-            "content": "",
-            "node": node_name
-        }
+        return None
     
     async def get_conversation_history(
         self, 
         user_id: str, 
-        limit: int = 10
-    ) -> List[Dict[str, Any]]:
-        """Get user's conversation history."""
-        return await self.data_service.get_conversation_history(user_id, limit)
\ No newline at end of file
+        limit: int = 10,
+        before: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get one page of the user's conversation history (see NutritionDataService)."""
+        return await self.data_service.get_conversation_history(user_id, limit, before)
\ No newline at end of file
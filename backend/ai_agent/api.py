@@ -7,15 +7,20 @@ Provides chat interface and conversation management for the LangGraph agent.
 import asyncio
 import json
 import logging
-from typing import Optional, Dict, Any
+from typing import TYPE_CHECKING, Callable, Optional, Dict, Any
 from datetime import datetime
 
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from .agent import NutritionAgent
-from .models.state import QueryType
+from lazy_init import LazyInit
+
+# The agent module (langgraph, langchain) is only imported when the agent is
+# built, so registering this router is cheap. Endpoints take the agent
+# untyped for the same reason.
+if TYPE_CHECKING:
+    from .agent import NutritionAgent
 
 logger = logging.getLogger(__name__)
 
@@ -26,24 +31,13 @@ class ChatRequest(BaseModel):
 
 # Authentication dependency
 def get_current_user_id(request: Request) -> str:
-    """Extract user ID from authentication."""
+    """Extract user ID from authentication (token claims, confirmed via the cached user)."""
     # Import here to avoid circular imports
-    from auth_util import get_current_user
-    import os
-    from pymongo import MongoClient
-    
-    # Get database connection
-    MONGODB_URI = os.getenv("MONGODB_URI")
-    if not MONGODB_URI:
-        raise HTTPException(status_code=500, detail="Database not configured")
-    
-    client = MongoClient(MONGODB_URI)
-    db = client["nutritionapp"]
-    users_collection = db["users"]
+    from auth_util import get_current_user_id as get_token_user_id
     
     try:
-        user = get_current_user(request, users_collection)
-        return str(user["_id"])
+        # The agent's users collection confirms the account still exists
+        return get_token_user_id(request, get_agent().data_service.users)
     except HTTPException:
         raise
     except Exception as e:
@@ -57,21 +51,67 @@ class ChatResponse(BaseModel):
 
 class ConversationHistoryResponse(BaseModel):
     conversations: list = Field(..., description="List of recent conversations")
-    total: int = Field(..., description="Total number of conversations")
+    total: int = Field(..., description="Number of conversations in this page")
+    next_cursor: Optional[str] = Field(None, description="Pass as `before` to get the next page; null on the last page")
 
-# Global agent instance - will be initialized by main.py
-nutrition_agent: Optional[NutritionAgent] = None
+# Global agent, built on first use by the factory main.py configures
+_agent_loader: Optional[LazyInit] = None
 
-def get_agent() -> NutritionAgent:
-    """Dependency to get the initialized agent."""
-    if nutrition_agent is None:
+def configure_agent(factory: Callable[[], "NutritionAgent"]):
+    """Set how the agent is built; nothing is imported or built until it is needed."""
+    global _agent_loader
+    _agent_loader = LazyInit("ai_agent", factory)
+
+def get_agent() -> "NutritionAgent":
+    """
+    Dependency to get the agent, building it on first use.
+    
+    Sync on purpose: FastAPI runs it in the threadpool, so the first build
+    doesn't block the event loop.
+    """
+    if _agent_loader is None:
         raise HTTPException(status_code=500, detail="AI agent not initialized")
-    return nutrition_agent
+    try:
+        return _agent_loader.get()
+    except Exception as e:
+        logger.error(f"Failed to initialize AI agent: {e}")
+        raise HTTPException(status_code=503, detail="AI agent temporarily unavailable")
 
-def set_agent(agent: NutritionAgent):
+def set_agent(agent: "NutritionAgent"):
     """Set the global agent instance."""
-    global nutrition_agent
-    nutrition_agent = agent
+    global _agent_loader
+    if _agent_loader is None:
+        _agent_loader = LazyInit("ai_agent", lambda: agent)
+    _agent_loader.set(agent)
+
+def shutdown_agent():
+    """Save buffered conversation exchanges (no-op if the agent was never built)."""
+    if _agent_loader is not None and _agent_loader.loaded:
+        _agent_loader.get().data_service.conversation_store.close()
+
+def delete_user_agent_data(db, user_id: str):
+    """
+    Delete a user's agent threads and conversation history (account deletion).
+
+    Goes through the built agent when there is one, so its checkpoint cache
+    and write buffer forget the user too.
+    """
+    from .services.checkpointer import MongoCheckpointSaver
+    from .services.conversation_store import ConversationStore
+
+    if _agent_loader is not None and _agent_loader.loaded:
+        agent = _agent_loader.get()
+        checkpointer, conversation_store = agent.checkpointer, agent.data_service.conversation_store
+    else:
+        checkpointer, conversation_store = MongoCheckpointSaver(db), ConversationStore(db)
+    threads = checkpointer.delete_user_threads(user_id)
+    conversations = conversation_store.delete_user(user_id)
+    logger.info(f"Deleted {threads} agent checkpoints and {conversations} conversations of user {user_id}")
+
+def prewarm_agent():
+    """Build the agent in the background so the first chat doesn't wait for it."""
+    if _agent_loader is not None and not _agent_loader.loaded:
+        _agent_loader.prewarm()
 
 # Create router
 router = APIRouter(prefix="/api/ai", tags=["AI Agent"])
@@ -80,12 +120,16 @@ router = APIRouter(prefix="/api/ai", tags=["AI Agent"])
 async def chat_with_agent(
     request: ChatRequest,
     user_id: str = Depends(get_current_user_id),
-    agent: NutritionAgent = Depends(get_agent)
+    agent=Depends(get_agent)
 ) -> StreamingResponse:
     """
     Chat with the AI nutrition agent with streaming responses.
     
-    Returns a streaming response with real-time agent output.
+    Returns Server-Sent Events with real-time agent output: one "response"
+    frame per LLM token delta, "tool_start"/"tool_end" frames around tool
+    calls, a "round_start" frame before each model round (text streamed
+    before a tool call is not part of the answer) and a final "complete"
+    frame with the full response, as saved to the conversation history.
     """
     try:
         async def generate_response():
@@ -106,9 +150,13 @@ async def chat_with_agent(
                         "session_id": session_id,
                         "timestamp": datetime.now().isoformat()
                     }
+                    if chunk.get("tool"):
+                        chunk_data["tool"] = chunk["tool"]
                     
-                    # Store chunks for final response
-                    if chunk.get("type") == "response" and chunk.get("content"):
+                    # Store chunks for final response; only the last model round is the answer
+                    if chunk.get("type") == "round_start":
+                        response_chunks = []
+                    elif chunk.get("type") == "response" and chunk.get("content"):
                         response_chunks.append(chunk.get("content"))
                     
                     yield f"data: {json.dumps(chunk_data)}\n\n"
@@ -117,7 +165,7 @@ async def chat_with_agent(
                 final_chunk = {
                     "type": "complete",
                     "session_id": session_id,
-                    "full_response": " ".join(response_chunks),
+                    "full_response": "".join(response_chunks),
                     "timestamp": datetime.now().isoformat()
                 }
                 yield f"data: {json.dumps(final_chunk)}\n\n"
@@ -133,13 +181,14 @@ async def chat_with_agent(
                 }
                 yield f"data: {json.dumps(error_chunk)}\n\n"
         
+        # Each frame is sent as soon as it is yielded; tell proxies not to buffer
         return StreamingResponse(
             generate_response(),
-            media_type="text/plain",
+            media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
-                "Content-Type": "text/event-stream"
+                "X-Accel-Buffering": "no"
             }
         )
         
@@ -151,7 +200,7 @@ async def chat_with_agent(
 async def simple_chat(
     request: ChatRequest,
     user_id: str = Depends(get_current_user_id),
-    agent: NutritionAgent = Depends(get_agent)
+    agent=Depends(get_agent)
 ) -> ChatResponse:
     """
     Simple non-streaming chat endpoint for basic integrations.
@@ -171,15 +220,17 @@ async def simple_chat(
             user_id=user_id,
             session_id=session_id
         ):
-            if chunk.get("type") == "response" and chunk.get("content"):
+            if chunk.get("type") == "round_start":
+                response_parts = []
+            elif chunk.get("type") == "response" and chunk.get("content"):
                 response_parts.append(chunk.get("content"))
-            elif chunk.get("type") == "tool_execution":
-                tools_used.append(chunk.get("node", "unknown_tool"))
+            elif chunk.get("type") == "tool_start":
+                tools_used.append(chunk.get("tool", "unknown_tool"))
             elif chunk.get("type") == "thinking":
                 # Could extract query type from agent state here
                 pass
         
-        full_response = " ".join(response_parts) if response_parts else "I'm sorry, I couldn't process your request right now."
+        full_response = "".join(response_parts) if response_parts else "I'm sorry, I couldn't process your request right now."
         
         return ChatResponse(
             response=full_response,
@@ -194,51 +245,50 @@ async def simple_chat(
 
 @router.get("/conversations", response_model=ConversationHistoryResponse)
 async def get_conversation_history(
-    limit: int = 10,
+    limit: int = Query(10, ge=1, le=100),
+    before: Optional[str] = None,
     user_id: str = Depends(get_current_user_id),
-    agent: NutritionAgent = Depends(get_agent)
+    agent=Depends(get_agent)
 ) -> ConversationHistoryResponse:
     """
-    Get user's conversation history with the AI agent.
+    Get user's conversation history with the AI agent, newest first.
+
+    Pages are keyset-paged: pass the previous response's next_cursor as
+    `before` to get the next, older page.
     """
     try:
-        conversations = await agent.get_conversation_history(user_id, limit)
+        page = await agent.get_conversation_history(user_id, limit, before)
         
         return ConversationHistoryResponse(
-            conversations=conversations,
-            total=len(conversations)
+            conversations=page["conversations"],
+            total=len(page["conversations"]),
+            next_cursor=page["next_cursor"]
         )
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching conversation history: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch conversations: {str(e)}")
 
 @router.get("/health")
-async def health_check(agent: NutritionAgent = Depends(get_agent)) -> Dict[str, Any]:
+async def health_check() -> Dict[str, Any]:
     """
     Health check endpoint for the AI agent.
+    
+    Doesn't build the agent: a worker that hasn't served a chat yet reports
+    agent_initialized false and is still healthy.
     """
     try:
-        # Test basic agent functionality
-        test_state = {
-            "messages": [],
-            "user_id": "health_check",
-            "tools_called": [],
-            "execution_path": [],
-            "mongodb_queries": [],
-            "response_style": "casual",
-            "requires_streaming": False,
-            "proactive_suggestions": [],
-            "fallback_mode": False,
-            "cache_hits": 0,
-            "total_tokens_used": 0
-        }
+        if _agent_loader is None:
+            raise RuntimeError("AI agent not configured")
         
+        loaded = _agent_loader.loaded
         return {
             "status": "healthy",
-            "agent_initialized": True,
+            "agent_initialized": loaded,
             "model": "gpt-4o-mini",
-            "tools_available": len(agent.tools),
+            "tools_available": len(_agent_loader.get().tools) if loaded else None,
             "timestamp": datetime.now().isoformat()
         }
         
@@ -251,10 +301,12 @@ async def health_check(agent: NutritionAgent = Depends(get_agent)) -> Dict[str,
         }
 
 @router.get("/capabilities")
-async def get_capabilities(agent: NutritionAgent = Depends(get_agent)) -> Dict[str, Any]:
+async def get_capabilities(agent=Depends(get_agent)) -> Dict[str, Any]:
     """
     Get information about the agent's capabilities and available tools.
     """
+    from .models.state import QueryType
+    
     try:
         tool_descriptions = []
         for tool in agent.tools:
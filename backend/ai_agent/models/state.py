@@ -79,10 +79,14 @@ class NutritionAgentState(TypedDict):
     error_context: Optional[str]            # Any errors encountered
     fallback_mode: bool                     # Whether using fallback responses
     
+    # Context management
+    conversation_summary: Optional[str]     # Summary of turns dropped from messages
+    context_tokens: int                     # Estimated prompt tokens of the last model call
+    
     # Performance tracking
     start_time: Optional[datetime]          # Request start time
     cache_hits: int                        # Number of cache hits
-    total_tokens_used: int                 # Token usage tracking
+    total_tokens_used: int                 # Tokens used by LLM calls this turn
 
 
 class UserProfileData(TypedDict):
@@ -0,0 +1,197 @@
+"""
+Answer cache for generic nutrition questions.
+
+Questions the intent classifier files under GENERAL or EDUCATION ("is rice
+healthy", "what does fiber do") don't need the user's data, and many users
+ask the same ones in slightly different words. Answers to them are kept
+for ANSWER_CACHE_TTL_HOURS and replayed without calling the model.
+
+A question is looked up by its normalized text first, then by similarity
+of a local lexical embedding (word, word-pair and character-trigram
+features, cosine similarity); no embedding API or model is involved.
+Two questions with different negations or numbers never match, so "is
+rice healthy" doesn't answer "is rice not healthy".
+
+The system prompt includes the user's goal, activity level and diet, so
+answers are only shared between users with the same three values. Only
+answers the model gave without thread history are stored: after the first
+turn of a thread the agent asks again with just the question, so nothing
+the user said earlier ends up in another user's answer.
+
+Entries live in memory per worker, least recently used first out once
+ANSWER_CACHE_SIZE is reached. Hits, misses and stores are counted in
+metrics (agent_answer_cache_*).
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import metrics
+
+from ..models.state import QueryType
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "500"))
+ANSWER_CACHE_TTL_HOURS = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "24"))
+ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.9"))
+
+CACHEABLE_INTENTS = {QueryType.GENERAL, QueryType.EDUCATION}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Dropped before matching: they don't change what is being asked
+FILLER_WORDS = {"hi", "hey", "hello", "please", "thanks", "thank", "um", "uh", "so", "just", "ok", "okay"}
+
+# Kept but weighted down, so content words decide the similarity
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "was", "be", "do", "does", "to", "of", "in", "on", "for", "and", "or",
+    "it", "i", "you", "what", "how", "why", "can", "should", "much", "many", "there", "with", "per"
+}
+
+NEGATIONS = {"not", "no", "never", "without", "dont", "doesnt", "isnt", "arent", "cant", "avoid", "less", "un"}
+
+# Messages that only make sense after an earlier turn
+FOLLOW_UP_RE = re.compile(r"^(and|also|what about|how about|same)\b|\b(it|that|this|those|these|them)\b")
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase words without punctuation or filler ("Hey, is rice healthy?" -> "is rice healthy")."""
+    words = _WORD_RE.findall(text.lower().replace("'", ""))
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+def embed(question: str) -> Dict[str, float]:
+    """
+    Sparse lexical embedding of a normalized question.
+
+    Returns:
+        Feature -> weight, L2-normalized (cosine similarity is a dot product)
+    """
+    words = question.split()
+    features: Dict[str, float] = {}
+    for word in words:
+        weight = 0.3 if word in STOP_WORDS else 1.0
+        features[f"w:{word}"] = features.get(f"w:{word}", 0.0) + weight
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            key = f"c:{padded[i:i + 3]}"
+            features[key] = features.get(key, 0.0) + 0.25 * weight
+    for first, second in zip(words, words[1:]):
+        key = f"b:{first} {second}"
+        features[key] = features.get(key, 0.0) + 0.5
+    norm = math.sqrt(sum(value * value for value in features.values())) or 1.0
+    return {key: value / norm for key, value in features.items()}
+
+
+def similarity(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(key, 0.0) for key, value in a.items())
+
+
+def _guard(question: str) -> Tuple[frozenset, frozenset]:
+    """Negations and numbers, which must be identical for two questions to match."""
+    words = question.split()
+    negations = frozenset(w for w in words if w in NEGATIONS or (w.startswith("un") and len(w) > 5))
+    numbers = frozenset(w for w in words if w.isdigit())
+    return negations, numbers
+
+
+def is_cacheable_question(message: str) -> bool:
+    """Whether a message stands on its own (not a follow-up) and is short enough to be a generic question."""
+    question = normalize_question(message)
+    return 2 <= len(question.split()) <= 30 and not FOLLOW_UP_RE.search(question)
+
+
+def profile_partition(user_profile: Optional[Dict[str, Any]]) -> str:
+    """The profile values the system prompt includes; answers are shared only within one partition."""
+    profile = (user_profile or {}).get("profile") or {}
+    return "|".join(str(profile.get(key) or "").lower()
+                    for key in ("weight_goal_type", "activity_level", "diet_type"))
+
+
+class AnswerCache:
+    """Answers by (partition, question), with exact and similarity lookup."""
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL_HOURS * 3600,
+                 min_similarity: float = ANSWER_CACHE_MIN_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, message: str, partition: str) -> Optional[Tuple[str, float]]:
+        """
+        Cached answer to a question.
+
+        Returns:
+            (answer, similarity) with similarity 1.0 for a normalized-text
+            match, or None on a miss
+        """
+        with metrics.timed("agent_answer_cache_lookup_ms"):
+            result = self._lookup(normalize_question(message), partition)
+        metrics.counter("agent_answer_cache_hits" if result else "agent_answer_cache_misses").inc()
+        return result
+
+    def _lookup(self, question: str, partition: str) -> Optional[Tuple[str, float]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((partition, question))
+            if entry and entry["expires_at"] > now:
+                self._entries.move_to_end((partition, question))
+                return entry["answer"], 1.0
+
+            vector, guard = embed(question), _guard(question)
+            best_key, best_score = None, self.min_similarity
+            for key, entry in list(self._entries.items()):
+                if entry["expires_at"] <= now:
+                    self._remove(key)
+                    continue
+                if key[0] != partition or entry["guard"] != guard:
+                    continue
+                score = similarity(vector, entry["vector"])
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key]["answer"], best_score
+
+    def store(self, message: str, partition: str, answer: str):
+        question = normalize_question(message)
+        with self._lock:
+            if (partition, question) not in self._entries:
+                metrics.gauge("agent_answer_cache_entries").inc()
+            self._entries[(partition, question)] = {
+                "answer": answer,
+                "vector": embed(question),
+                "guard": _guard(question),
+                "expires_at": time.monotonic() + self.ttl_seconds
+            }
+            self._entries.move_to_end((partition, question))
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        metrics.counter("agent_answer_cache_stores").inc()
+
+    def _remove(self, key: Tuple[str, str]):
+        del self._entries[key]
+        metrics.gauge("agent_answer_cache_entries").dec()
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,326 @@
+"""
+MongoDB checkpointer for the LangGraph agent.
+
+Conversation state is stored in the agent_checkpoints collection (plus
+agent_checkpoint_writes for pending task writes), so every uvicorn worker
+sees the same threads and they survive restarts. To keep storage and memory
+bounded:
+
+- only the latest checkpoint of a thread and its parent are kept; older
+  ones are deleted when a new checkpoint is written
+- the stored message history is capped at CHECKPOINT_MAX_MESSAGES, cut at a
+  user message so tool calls and their results stay together
+- idle threads expire after CHECKPOINT_TTL_HOURS (TTL index)
+- a small LRU of serialized checkpoints serves repeat reads; a cached entry
+  is only used when it is still the thread's latest checkpoint, so another
+  worker's writes are never shadowed
+"""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTS_COLLECTION = "agent_checkpoints"
+CHECKPOINT_WRITES_COLLECTION = "agent_checkpoint_writes"
+
+CHECKPOINT_TTL_HOURS = float(os.getenv("CHECKPOINT_TTL_HOURS", "72"))
+CHECKPOINT_MAX_MESSAGES = int(os.getenv("CHECKPOINT_MAX_MESSAGES", "40"))
+CHECKPOINT_CACHE_SIZE = int(os.getenv("CHECKPOINT_CACHE_SIZE", "256"))
+
+
+def trim_messages(messages: List[Any], max_messages: int) -> List[Any]:
+    """
+    Keep the most recent messages, starting at a user message.
+
+    Returns:
+        At most max_messages messages, unless the current turn alone is
+        longer, in which case the turn is kept whole
+    """
+    if len(messages) <= max_messages:
+        return messages
+    human = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+    if not human:
+        return messages
+    start = next((i for i in human if i >= len(messages) - max_messages), human[-1])
+    return messages[start:]
+
+
+class MongoCheckpointSaver(BaseCheckpointSaver):
+    """LangGraph checkpoint saver backed by MongoDB with a read-through LRU."""
+
+    def __init__(self, db, ttl_hours: float = CHECKPOINT_TTL_HOURS,
+                 max_messages: int = CHECKPOINT_MAX_MESSAGES, cache_size: int = CHECKPOINT_CACHE_SIZE):
+        super().__init__()
+        self.checkpoints = db[CHECKPOINTS_COLLECTION]
+        self.writes = db[CHECKPOINT_WRITES_COLLECTION]
+        self.ttl = timedelta(hours=ttl_hours)
+        self.max_messages = max_messages
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def ensure_indexes(self):
+        """Create lookup and TTL indexes (safe to call on every startup)."""
+        try:
+            key = [("thread_id", ASCENDING), ("checkpoint_ns", ASCENDING), ("checkpoint_id", DESCENDING)]
+            self.checkpoints.create_index(key, unique=True, name="thread_checkpoint_idx")
+            self.checkpoints.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+            self.writes.create_index(key + [("task_id", ASCENDING), ("idx", ASCENDING)],
+                                     unique=True, name="thread_checkpoint_task_idx")
+            self.writes.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+        except Exception as e:
+            logger.error(f"Failed to create checkpoint indexes: {e}")
+
+    # --- cache ---
+
+    def _cache_get(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def _cache_put(self, key: Tuple[str, str], entry: Dict[str, Any]):
+        with self._cache_lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_drop(self, thread_id: str):
+        with self._cache_lock:
+            for key in [key for key in self._cache if key[0] == thread_id]:
+                del self._cache[key]
+
+    # --- serialization ---
+
+    def _entry_from_doc(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        writes = self.writes.find(
+            {"thread_id": doc["thread_id"], "checkpoint_ns": doc["checkpoint_ns"],
+             "checkpoint_id": doc["checkpoint_id"]}
+        ).sort([("task_id", ASCENDING), ("idx", ASCENDING)])
+        return {
+            "thread_id": doc["thread_id"],
+            "checkpoint_ns": doc["checkpoint_ns"],
+            "checkpoint_id": doc["checkpoint_id"],
+            "parent_checkpoint_id": doc.get("parent_checkpoint_id"),
+            "checkpoint": (doc["type"], doc["checkpoint"]),
+            "metadata": (doc["metadata_type"], doc["metadata"]),
+            "writes": [(w["task_id"], w["idx"], w["channel"], (w["type"], w["value"])) for w in writes]
+        }
+
+    def _tuple_from_entry(self, entry: Dict[str, Any]) -> CheckpointTuple:
+        def config_for(checkpoint_id):
+            return {"configurable": {
+                "thread_id": entry["thread_id"],
+                "checkpoint_ns": entry["checkpoint_ns"],
+                "checkpoint_id": checkpoint_id
+            }}
+
+        return CheckpointTuple(
+            config=config_for(entry["checkpoint_id"]),
+            checkpoint=self.serde.loads_typed(entry["checkpoint"]),
+            metadata=self.serde.loads_typed(entry["metadata"]),
+            parent_config=config_for(entry["parent_checkpoint_id"]) if entry["parent_checkpoint_id"] else None,
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed(value))
+                for task_id, _, channel, value in sorted(entry["writes"], key=lambda w: (w[0], w[1]))
+            ]
+        )
+
+    # --- BaseCheckpointSaver ---
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        query = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}
+        if checkpoint_id:
+            query["checkpoint_id"] = checkpoint_id
+
+        # Cheap index-only lookup of the current checkpoint id; the blob is
+        # only fetched when the cache doesn't have it
+        latest = self.checkpoints.find_one(query, {"_id": 0, "checkpoint_id": 1},
+                                           sort=[("checkpoint_id", DESCENDING)])
+        if not latest:
+            return None
+        key = (thread_id, checkpoint_ns)
+        entry = self._cache_get(key)
+        if entry is None or entry["checkpoint_id"] != latest["checkpoint_id"]:
+            doc = self.checkpoints.find_one({**query, "checkpoint_id": latest["checkpoint_id"]})
+            if not doc:
+                return None
+            entry = self._entry_from_doc(doc)
+            if not checkpoint_id:
+                self._cache_put(key, entry)
+        return self._tuple_from_entry(entry)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        query: Dict[str, Any] = {}
+        if config:
+            query["thread_id"] = config["configurable"]["thread_id"]
+            if "checkpoint_ns" in config["configurable"]:
+                query["checkpoint_ns"] = config["configurable"]["checkpoint_ns"]
+            checkpoint_id = get_checkpoint_id(config)
+            if checkpoint_id:
+                query["checkpoint_id"] = checkpoint_id
+        if before and get_checkpoint_id(before):
+            query["checkpoint_id"] = {"$lt": get_checkpoint_id(before)}
+
+        returned = 0
+        for doc in self.checkpoints.find(query).sort([("checkpoint_id", DESCENDING)]):
+            checkpoint_tuple = self._tuple_from_entry(self._entry_from_doc(doc))
+            if filter and any(checkpoint_tuple.metadata.get(k) != v for k, v in filter.items()):
+                continue
+            yield checkpoint_tuple
+            returned += 1
+            if limit is not None and returned >= limit:
+                break
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+
+        channel_values = checkpoint.get("channel_values") or {}
+        messages = channel_values.get("messages")
+        if isinstance(messages, list) and len(messages) > self.max_messages:
+            checkpoint = {**checkpoint, "channel_values": {
+                **channel_values, "messages": trim_messages(messages, self.max_messages)
+            }}
+
+        entry = {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"],
+            "parent_checkpoint_id": parent_checkpoint_id,
+            "checkpoint": self.serde.dumps_typed(checkpoint),
+            "metadata": self.serde.dumps_typed(metadata),
+            "writes": []
+        }
+        key = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}
+        self.checkpoints.replace_one(key, {
+            **key,
+            "parent_checkpoint_id": parent_checkpoint_id,
+            "type": entry["checkpoint"][0],
+            "checkpoint": entry["checkpoint"][1],
+            "metadata_type": entry["metadata"][0],
+            "metadata": entry["metadata"][1],
+            "expires_at": datetime.utcnow() + self.ttl
+        }, upsert=True)
+        self._cache_put((thread_id, checkpoint_ns), entry)
+
+        # Only the new checkpoint and its parent are ever read again
+        if parent_checkpoint_id:
+            older = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                     "checkpoint_id": {"$lt": parent_checkpoint_id}}
+            self.checkpoints.delete_many(older)
+            self.writes.delete_many(older)
+
+        return {"configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"]
+        }}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        expires_at = datetime.utcnow() + self.ttl
+
+        stored = []
+        operations = []
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            type_, data = self.serde.dumps_typed(value)
+            stored.append((task_id, idx, channel, (type_, data)))
+            key = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+                   "task_id": task_id, "idx": idx}
+            operations.append(ReplaceOne(key, {
+                **key, "channel": channel, "type": type_, "value": data, "task_path": task_path,
+                "expires_at": expires_at
+            }, upsert=True))
+        if operations:
+            self.writes.bulk_write(operations, ordered=False)
+
+        with self._cache_lock:
+            entry = self._cache.get((thread_id, checkpoint_ns))
+            if entry is not None and entry["checkpoint_id"] == checkpoint_id:
+                replaced = {(w[0], w[1]) for w in stored}
+                entry["writes"] = [w for w in entry["writes"] if (w[0], w[1]) not in replaced] + stored
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.checkpoints.delete_many({"thread_id": thread_id})
+        self.writes.delete_many({"thread_id": thread_id})
+        self._cache_drop(thread_id)
+
+    def delete_user_threads(self, user_id: str) -> int:
+        """
+        Delete every thread of a user (account deletion).
+
+        Threads are named "<user_id>:<session_id>", or "user_<user_id>"
+        without a session.
+
+        Returns:
+            Number of checkpoints deleted
+        """
+        query = {"$or": [
+            {"thread_id": {"$regex": f"^{re.escape(user_id)}:"}},
+            {"thread_id": f"user_{user_id}"}
+        ]}
+        thread_ids = self.checkpoints.distinct("thread_id", query)
+        deleted = self.checkpoints.delete_many(query).deleted_count
+        self.writes.delete_many(query)
+        for thread_id in thread_ids:
+            self._cache_drop(thread_id)
+        return deleted
+
+    # --- async (pymongo is synchronous; run on the default executor) ---
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await self._run(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None,
+                    limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        items = await self._run(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await self._run(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        return await self._run(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await self._run(self.delete_thread, thread_id)
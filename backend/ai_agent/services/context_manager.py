@@ -0,0 +1,184 @@
+"""
+Context budgeting for the agent's LLM calls.
+
+Tool results are JSON dumps of whole query results (a day's menu from
+get_available_dining_foods is hundreds of foods), and the thread history
+grows with every turn. Before each model call the agent:
+
+- compacts tool results of the current turn: long lists are cut to their
+  first TOOL_OUTPUT_MAX_ITEMS entries (with a count of what was left out),
+  long strings are shortened, and the whole result is capped at
+  TOOL_OUTPUT_MAX_CHARS
+- replaces tool results of earlier turns with a one-line digest; the
+  model's answer from that turn already says what mattered
+- summarizes turns older than the last CONTEXT_KEEP_TURNS when the prompt
+  is still over CONTEXT_TOKEN_BUDGET
+
+Token counts are estimates (about four characters per token), which is
+enough for budgeting and costs nothing per message.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "2"))
+TOOL_OUTPUT_MAX_CHARS = int(os.getenv("TOOL_OUTPUT_MAX_CHARS", "4000"))
+TOOL_OUTPUT_MAX_ITEMS = int(os.getenv("TOOL_OUTPUT_MAX_ITEMS", "25"))
+TOOL_OUTPUT_MAX_STRING = 300
+
+# Marks tool results that were already compacted, so they aren't reprocessed
+COMPACTED = "compacted"
+DIGESTED = "digested"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return json.dumps(content, default=str)
+
+
+def estimate_message_tokens(messages: List[BaseMessage]) -> int:
+    """Estimated prompt tokens of a message list (content, tool calls and per-message overhead)."""
+    total = 0
+    for message in messages:
+        total += estimate_tokens(message_text(message)) + 4
+        for call in getattr(message, "tool_calls", None) or []:
+            total += estimate_tokens(json.dumps(call.get("args", {}), default=str)) + 4
+    return total
+
+
+def _shrink(value: Any, max_items: int) -> Any:
+    if isinstance(value, list):
+        items = [_shrink(item, max_items) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"... {len(value) - max_items} more not shown")
+        return items
+    if isinstance(value, dict):
+        return {key: _shrink(item, max_items) for key, item in value.items()}
+    if isinstance(value, str) and len(value) > TOOL_OUTPUT_MAX_STRING:
+        return value[:TOOL_OUTPUT_MAX_STRING] + "..."
+    return value
+
+
+def compact_tool_output(content: str) -> str:
+    """Shortened tool result for the current turn."""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        data = None
+    compacted = content
+    if data is not None:
+        # Fewer list entries until it fits, so the result stays valid JSON
+        max_items = TOOL_OUTPUT_MAX_ITEMS
+        while True:
+            compacted = json.dumps(_shrink(data, max_items), default=str, separators=(",", ":"))
+            if len(compacted) <= TOOL_OUTPUT_MAX_CHARS or max_items <= 3:
+                break
+            max_items = max(3, max_items // 2)
+    if len(compacted) > TOOL_OUTPUT_MAX_CHARS:
+        compacted = compacted[:TOOL_OUTPUT_MAX_CHARS] + "... [truncated]"
+    return compacted
+
+
+def digest_tool_output(name: str, content: str) -> str:
+    """One-line description of an earlier turn's tool result."""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return f"[{name} result from an earlier turn, {len(content)} characters, omitted]"
+    if isinstance(data, dict):
+        parts = []
+        for key, value in data.items():
+            if isinstance(value, list):
+                parts.append(f"{key}: {len(value)} items")
+            elif isinstance(value, (str, int, float, bool)) and len(str(value)) <= 40:
+                parts.append(f"{key}: {value}")
+        summary = "; ".join(parts[:8])
+    elif isinstance(data, list):
+        summary = f"{len(data)} items"
+    else:
+        summary = str(data)[:80]
+    return f"[{name} result from an earlier turn, omitted. {summary}]"
+
+
+def turn_starts(messages: List[BaseMessage]) -> List[int]:
+    """Indexes of the user messages that start each turn."""
+    return [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+
+
+def compact_tool_messages(messages: List[BaseMessage]) -> List[ToolMessage]:
+    """
+    Replacement ToolMessages (same IDs) for tool results that need compacting.
+
+    Results of the current turn are compacted, results of earlier turns are
+    replaced by a digest.
+
+    Returns:
+        Updated messages to write back to the state; the add_messages
+        reducer replaces messages by ID
+    """
+    starts = turn_starts(messages)
+    current_turn = starts[-1] if starts else 0
+    updates = []
+    for i, message in enumerate(messages):
+        if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+            continue
+        state = message.additional_kwargs.get("context")
+        if i < current_turn and state != DIGESTED:
+            content, state = digest_tool_output(message.name or "tool", message.content), DIGESTED
+        elif i >= current_turn and state is None:
+            content, state = compact_tool_output(message.content), COMPACTED
+        else:
+            continue
+        updates.append(message.model_copy(update={
+            "content": content,
+            "additional_kwargs": {**message.additional_kwargs, "context": state}
+        }))
+    return updates
+
+
+def apply_updates(messages: List[BaseMessage], updates: List[BaseMessage]) -> List[BaseMessage]:
+    """The message list as it will look once `updates` are merged by ID."""
+    by_id = {message.id: message for message in updates}
+    return [by_id.get(message.id, message) for message in messages]
+
+
+def split_for_summary(messages: List[BaseMessage], keep_turns: int = CONTEXT_KEEP_TURNS
+                      ) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+    """
+    Split messages into (older turns to summarize, recent turns to keep).
+
+    Returns:
+        Nothing to summarize if there are no more than keep_turns turns
+    """
+    starts = turn_starts(messages)
+    if len(starts) <= keep_turns:
+        return [], messages
+    cut = starts[-keep_turns] if keep_turns else len(messages)
+    return messages[:cut], messages[cut:]
+
+
+def transcript(messages: List[BaseMessage]) -> str:
+    """Plain-text transcript of user and assistant messages for summarization."""
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {message_text(message)}")
+        elif message.type == "ai" and message.content:
+            lines.append(f"Assistant: {message_text(message)}")
+    return "\n".join(lines)
+
+
+def usage_tokens(message: BaseMessage) -> int:
+    """Total tokens reported by the provider for an LLM response, 0 if unknown."""
+    usage: Dict[str, Any] = getattr(message, "usage_metadata", None) or {}
+    return int(usage.get("total_tokens", 0))
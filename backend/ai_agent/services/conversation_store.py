@@ -0,0 +1,237 @@
+"""
+Conversation history storage for the AI agent.
+
+Every chat exchange is saved to the conversations collection and read back
+by /api/ai/conversations, newest first. To keep both sides cheap as the
+collection grows:
+
+- reads use the (user_id, timestamp, _id) index and keyset paging: a page
+  ends with an opaque cursor, and the next page starts strictly after it,
+  so deep pages cost the same as the first one (no skip)
+- exchanges expire after CONVERSATION_TTL_DAYS (TTL index on expires_at,
+  0 keeps them forever)
+- writes never wait on MongoDB: exchanges are buffered in memory and a
+  background thread inserts them in batches of CONVERSATION_WRITE_BATCH_SIZE
+  at least every CONVERSATION_FLUSH_SECONDS. A user's pending exchanges are
+  flushed before their history is read, so they always see their latest
+  message. If MongoDB falls behind, the oldest buffered exchanges are
+  dropped beyond CONVERSATION_MAX_PENDING.
+
+Saved, failed and dropped writes are counted in metrics
+(conversation_writes_*).
+"""
+
+import base64
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CONVERSATIONS_COLLECTION = "conversations"
+
+CONVERSATION_TTL_DAYS = float(os.getenv("CONVERSATION_TTL_DAYS", "180"))
+CONVERSATION_WRITE_BATCH_SIZE = int(os.getenv("CONVERSATION_WRITE_BATCH_SIZE", "50"))
+CONVERSATION_FLUSH_SECONDS = float(os.getenv("CONVERSATION_FLUSH_SECONDS", "1.0"))
+CONVERSATION_MAX_PENDING = int(os.getenv("CONVERSATION_MAX_PENDING", "10000"))
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(conversation: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past a conversation (its timestamp and _id)."""
+    raw = f"{conversation['timestamp'].isoformat()}|{conversation['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """
+    Parse a cursor made by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, conversation_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(conversation_id)
+    except Exception:
+        raise ValueError("Invalid conversation cursor")
+
+
+def serialize_conversation(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-friendly copy of a stored exchange (string id, ISO timestamp, no internal fields)."""
+    result = {key: value for key, value in conversation.items() if key not in ("_id", "expires_at")}
+    result["id"] = str(conversation["_id"])
+    result["timestamp"] = conversation["timestamp"].isoformat()
+    return result
+
+
+class ConversationStore:
+    """Conversation exchanges with batched background writes and keyset-paged reads."""
+
+    def __init__(self, db, ttl_days: float = CONVERSATION_TTL_DAYS,
+                 batch_size: int = CONVERSATION_WRITE_BATCH_SIZE,
+                 flush_seconds: float = CONVERSATION_FLUSH_SECONDS,
+                 max_pending: int = CONVERSATION_MAX_PENDING):
+        self.collection = db[CONVERSATIONS_COLLECTION]
+        self.ttl = timedelta(days=ttl_days) if ttl_days > 0 else None
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        # Serializes inserts between the flusher thread and explicit flush() calls
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def ensure_indexes(self):
+        """Create the history and TTL indexes (safe to call on every startup)."""
+        try:
+            self.collection.create_index(
+                [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+                name="user_timestamp_idx"
+            )
+            self.collection.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+        except Exception as e:
+            logger.error(f"Failed to create conversation indexes: {e}")
+
+    # --- writes ---
+
+    def add(self, user_id: str, user_message: str, agent_response: str,
+            metadata: Optional[Dict[str, Any]] = None):
+        """Queue an exchange for saving; returns immediately."""
+        conversation = {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "user_message": user_message,
+            "agent_response": agent_response,
+            "timestamp": datetime.now(),
+            "metadata": metadata or {}
+        }
+        if self.ttl:
+            conversation["expires_at"] = datetime.utcnow() + self.ttl
+
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                metrics.counter("conversation_writes_dropped").inc()
+                logger.warning("Conversation write buffer full, dropped the oldest exchange")
+            else:
+                metrics.gauge("conversation_writes_pending").inc()
+            self._pending.append(conversation)
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._flush_loop, name="conversation-writer", daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                # Give the batch up to flush_seconds to fill
+                self._cond.wait_for(lambda: len(self._pending) >= self.batch_size or self._closed,
+                                    timeout=self.flush_seconds)
+            self.flush()
+
+    def flush(self):
+        """Insert every buffered exchange now (blocking)."""
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                if not batch:
+                    return
+                metrics.gauge("conversation_writes_pending").dec(len(batch))
+                try:
+                    with metrics.timed("conversation_write_batch_ms"):
+                        self.collection.insert_many(batch, ordered=False)
+                    metrics.counter("conversation_writes_saved").inc(len(batch))
+                except Exception as e:
+                    metrics.counter("conversation_writes_failed").inc(len(batch))
+                    logger.error(f"Error saving {len(batch)} conversation exchanges: {e}")
+
+    def has_pending(self, user_id: str) -> bool:
+        with self._cond:
+            return any(conversation["user_id"] == user_id for conversation in self._pending)
+
+    def delete_user(self, user_id: str) -> int:
+        """
+        Delete a user's saved and buffered exchanges (account deletion).
+
+        Returns:
+            Number of saved exchanges deleted
+        """
+        # Holding the flush lock keeps a batch being inserted right now from
+        # landing after the delete
+        with self._flush_lock:
+            with self._cond:
+                kept = deque(c for c in self._pending if c["user_id"] != user_id)
+                dropped = len(self._pending) - len(kept)
+                self._pending = kept
+            if dropped:
+                metrics.gauge("conversation_writes_pending").dec(dropped)
+            return self.collection.delete_many({"user_id": user_id}).deleted_count
+
+    def close(self, timeout: float = 5.0):
+        """Stop the writer thread after saving whatever is still buffered."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    # --- reads ---
+
+    def get_page(self, user_id: str, limit: int = 10,
+                 before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of a user's exchanges, newest first.
+
+        Args:
+            user_id: Owner of the conversations
+            limit: Page size (capped at MAX_PAGE_SIZE)
+            before: Cursor from the previous page, None for the newest page
+
+        Returns:
+            (serialized exchanges, cursor for the next page or None on the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query: Dict[str, Any] = {"user_id": user_id}
+        if before:
+            timestamp, conversation_id = decode_cursor(before)
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": conversation_id}}
+            ]
+
+        # Also waits for a batch the writer thread is inserting right now
+        with self._flush_lock:
+            pending = self.has_pending(user_id)
+        if pending:
+            self.flush()
+
+        conversations = list(
+            self.collection.find(query, {"expires_at": 0})
+            .sort([("timestamp", DESCENDING), ("_id", DESCENDING)])
+            .limit(limit + 1)
+        )
+        next_cursor = encode_cursor(conversations[limit - 1]) if len(conversations) > limit else None
+        return [serialize_conversation(c) for c in conversations[:limit]], next_cursor
@@ -6,12 +6,19 @@ working with the existing MongoDB collections: users, foods, plates, weight_log.
 """
 
 import asyncio
-from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Union
 from bson import ObjectId
 import logging
 from collections import defaultdict
 
+from food_catalog import find_menu_foods, get_foods_by_ids
+from food_search import search_foods
+from allergens import exclude_allergens_query
+from user_targets import get_targets
+
+from .conversation_store import ConversationStore
+from .tool_cache import MENU_CACHE_TTL_SECONDS, memoized
+
 logger = logging.getLogger(__name__)
 
 
@@ -26,17 +33,30 @@ class NutritionDataService:
         self.plates = self.db["plates"]
         self.weight_log = self.db["weight_log"]
         # Conversations collection for AI chat history
-        self.conversations = self.db["conversations"]
+        self.conversation_store = ConversationStore(self.db)
+        self.conversations = self.conversation_store.collection
+    
+    async def _run(self, func, *args):
+        """Run a blocking pymongo call on the default executor so concurrent tools don't serialize."""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
     
+    @memoized()
     async def get_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Get user profile from users collection."""
+        """Get user profile from users collection, with the user's cached daily targets."""
         try:
-            user = self.users.find_one({"_id": ObjectId(user_id)})
+            user = await self._run(self.users.find_one, {"_id": ObjectId(user_id)})
             if user:
+                try:
+                    targets = await self._run(get_targets, self.users, user)
+                except Exception as e:
+                    # Incomplete or malformed profile data; tools fall back when targets are missing
+                    logger.warning(f"Could not compute targets for user {user_id}: {e}")
+                    targets = None
                 return {
                     "user_id": str(user["_id"]),
                     "email": user.get("email"),
                     "profile": user.get("profile", {}),
+                    "targets": targets,
                     "name": user.get("profile", {}).get("name", "")
                 }
             return None
@@ -44,6 +64,7 @@ class NutritionDataService:
             logger.error(f"Error fetching user profile: {e}")
             return None
     
+    @memoized()
     async def get_user_plates(
         self, 
         user_id: str, 
@@ -52,10 +73,10 @@ class NutritionDataService:
     ) -> List[Dict[str, Any]]:
         """Get user's plates (meals) for date range."""
         try:
-            plates = list(self.plates.find({
+            plates = await self._run(lambda: list(self.plates.find({
                 "user_id": user_id,
                 "date": {"$gte": start_date, "$lte": end_date}
-            }))
+            })))
             
             # Convert ObjectId to string for JSON serialization
             for plate in plates:
@@ -66,15 +87,18 @@ class NutritionDataService:
             logger.error(f"Error fetching user plates: {e}")
             return []
     
+    @memoized(ttl_seconds=MENU_CACHE_TTL_SECONDS)
     async def get_foods_by_date(
         self, 
         date: str,
         dining_hall: Optional[str] = None,
-        meal_type: Optional[str] = None
+        meal_type: Optional[str] = None,
+        exclude_allergens: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
         """Get available foods from foods collection for specific date."""
         try:
             query = {"date": date}
+            query.update(exclude_allergens_query(exclude_allergens or []))
             
             if dining_hall:
                 query["dining_hall"] = dining_hall
@@ -82,7 +106,7 @@ class NutritionDataService:
                 # Handle case-insensitive meal type matching
                 query["meal_name"] = {"$regex": f"^{meal_type}$", "$options": "i"}
             
-            foods = list(self.foods.find(query))
+            foods = await self._run(find_menu_foods, self.db, query)
             
             # Convert ObjectId to string
             for food in foods:
@@ -93,6 +117,7 @@ class NutritionDataService:
             logger.error(f"Error fetching foods by date: {e}")
             return []
     
+    @memoized()
     async def get_weight_logs(
         self, 
         user_id: str, 
@@ -101,10 +126,10 @@ class NutritionDataService:
     ) -> List[Dict[str, Any]]:
         """Get user's weight logs for date range."""
         try:
-            logs = list(self.weight_log.find({
+            logs = await self._run(lambda: list(self.weight_log.find({
                 "user_id": user_id,
                 "date": {"$gte": start_date, "$lte": end_date}
-            }).sort("date", 1))  # Sort by date ascending
+            }).sort("date", 1)))  # Sort by date ascending
             
             return logs
         except Exception as e:
@@ -116,47 +141,12 @@ class NutritionDataService:
         plates: List[Dict[str, Any]]
     ) -> Dict[str, float]:
         """Calculate total nutrition from plates and foods data."""
-        total_nutrition = {
-            "calories": 0.0,
-            "protein": 0.0,
-            "carbs": 0.0,
-            "fat": 0.0,
-            "fiber": 0.0
-        }
+        total_nutrition = self._empty_nutrition()
         
         try:
-            # Get all unique food IDs from plates
-            food_ids = []
-            for plate in plates:
-                for item in plate.get("items", []):
-                    food_id = item.get("food_id")
-                    if food_id:
-                        food_ids.append(food_id)
-            
-            # Get nutrition data for all foods
-            foods_data = await self._get_foods_nutrition_data(food_ids)
-            
-            # Calculate totals
-            for plate in plates:
-                for item in plate.get("items", []):
-                    food_id = item.get("food_id")
-                    quantity = item.get("quantity", 1.0)
-                    
-                    # Check for custom macros first
-                    if item.get("custom_macros"):
-                        custom = item["custom_macros"]
-                        total_nutrition["calories"] += custom.get("calories", 0) * quantity
-                        total_nutrition["protein"] += custom.get("protein", 0) * quantity
-                        total_nutrition["carbs"] += custom.get("carbs", 0) * quantity
-                        total_nutrition["fat"] += custom.get("totalFat", 0) * quantity
-                    elif food_id in foods_data:
-                        # Use food database nutrition
-                        food_nutrition = foods_data[food_id]
-                        total_nutrition["calories"] += food_nutrition.get("calories", 0) * quantity
-                        total_nutrition["protein"] += food_nutrition.get("protein", 0) * quantity
-                        total_nutrition["carbs"] += food_nutrition.get("carbs", 0) * quantity
-                        total_nutrition["fat"] += food_nutrition.get("fat", 0) * quantity
-                        total_nutrition["fiber"] += food_nutrition.get("fiber", 0) * quantity
+            for plate_nutrition in await self.calculate_nutrition_by_plate(plates):
+                for key, value in plate_nutrition.items():
+                    total_nutrition[key] += value
             
             return total_nutrition
             
@@ -164,32 +154,69 @@ class NutritionDataService:
             logger.error(f"Error calculating nutrition from plates: {e}")
             return total_nutrition
     
+    async def calculate_nutrition_by_plate(
+        self,
+        plates: List[Dict[str, Any]]
+    ) -> List[Dict[str, float]]:
+        """
+        Nutrition of each plate, in the order given.
+        
+        The foods of all plates are resolved in one batch lookup.
+        """
+        food_ids = {
+            item.get("food_id")
+            for plate in plates
+            for item in plate.get("items", [])
+            if item.get("food_id") and not item.get("custom_macros")
+        }
+        foods_data = await self._get_foods_nutrition_data(sorted(food_ids)) if food_ids else {}
+        return [self._plate_nutrition(plate, foods_data) for plate in plates]
+    
+    @staticmethod
+    def _empty_nutrition() -> Dict[str, float]:
+        return {
+            "calories": 0.0,
+            "protein": 0.0,
+            "carbs": 0.0,
+            "fat": 0.0,
+            "fiber": 0.0
+        }
+    
+    def _plate_nutrition(
+        self,
+        plate: Dict[str, Any],
+        foods_data: Dict[str, Dict[str, float]]
+    ) -> Dict[str, float]:
+        """Nutrition of one plate from already fetched food nutrition data."""
+        nutrition = self._empty_nutrition()
+        for item in plate.get("items", []):
+            food_id = item.get("food_id")
+            quantity = item.get("quantity", 1.0)
+            
+            # Check for custom macros first
+            if item.get("custom_macros"):
+                custom = item["custom_macros"]
+                nutrition["calories"] += custom.get("calories", 0) * quantity
+                nutrition["protein"] += custom.get("protein", 0) * quantity
+                nutrition["carbs"] += custom.get("carbs", 0) * quantity
+                nutrition["fat"] += custom.get("totalFat", 0) * quantity
+            elif food_id in foods_data:
+                # Use food database nutrition
+                food_nutrition = foods_data[food_id]
+                for key in nutrition:
+                    nutrition[key] += food_nutrition.get(key, 0) * quantity
+        return nutrition
+    
+    @memoized(ttl_seconds=MENU_CACHE_TTL_SECONDS)
     async def _get_foods_nutrition_data(self, food_ids: List[str]) -> Dict[str, Dict[str, float]]:
         """Get nutrition data for multiple foods."""
         nutrition_data = {}
         
         try:
-            # Separate ObjectIds and string IDs
-            object_ids = []
-            string_ids = []
-            
-            for food_id in food_ids:
-                try:
-                    object_ids.append(ObjectId(food_id))
-                except:
-                    string_ids.append(food_id)
-            
-            # Query with ObjectIds
-            if object_ids:
-                foods = self.foods.find({"_id": {"$in": object_ids}})
-                for food in foods:
-                    nutrition_data[str(food["_id"])] = self._extract_nutrition(food)
-            
-            # Query with string IDs
-            if string_ids:
-                foods = self.foods.find({"_id": {"$in": string_ids}})
-                for food in foods:
-                    nutrition_data[food["_id"]] = self._extract_nutrition(food)
+            # Resolves both catalog IDs and legacy foods IDs in bulk
+            foods_map = await self._run(get_foods_by_ids, self.db, food_ids, {"nutrients": 1})
+            for food_id, food in foods_map.items():
+                nutrition_data[food_id] = self._extract_nutrition(food)
             
         except Exception as e:
             logger.error(f"Error fetching foods nutrition data: {e}")
@@ -221,26 +248,19 @@ class NutritionDataService:
             "fiber": safe_float(nutrients.get("fiber", nutrients.get("Dietary Fiber", 0)))
         }
     
+    @memoized(ttl_seconds=MENU_CACHE_TTL_SECONDS)
     async def search_foods(
         self, 
         query: str, 
         date: Optional[str] = None,
-        limit: int = 20
+        limit: int = 20,
+        exclude_allergens: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
-        """Search foods by name/description."""
+        """Search foods by name/description, best matches first."""
         try:
-            search_query = {
-                "$or": [
-                    {"name": {"$regex": query, "$options": "i"}},
-                    {"description": {"$regex": query, "$options": "i"}},
-                    {"ingredients": {"$regex": query, "$options": "i"}}
-                ]
-            }
-            
-            if date:
-                search_query["date"] = date
-            
-            foods = list(self.foods.find(search_query).limit(limit))
+            foods = await self._run(lambda: search_foods(
+                self.db, query, date=date, limit=limit, exclude_allergens=exclude_allergens
+            ))
             
             # Convert ObjectId to string
             for food in foods:
@@ -255,18 +275,33 @@ class NutritionDataService:
     async def get_conversation_history(
         self, 
         user_id: str, 
-        limit: int = 10
-    ) -> List[Dict[str, Any]]:
-        """Get recent conversation history for user."""
+        limit: int = 10,
+        before: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get one page of the user's conversation history, newest first.
+
+        Args:
+            user_id: User's ID
+            limit: Page size
+            before: Cursor returned with the previous page
+
+        Returns:
+            {"conversations": [...], "next_cursor": str or None}
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
         try:
-            conversations = list(self.conversations.find({
-                "user_id": user_id
-            }).sort("timestamp", -1).limit(limit))
-            
-            return conversations
+            conversations, next_cursor = await self._run(
+                self.conversation_store.get_page, user_id, limit, before
+            )
+            return {"conversations": conversations, "next_cursor": next_cursor}
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error fetching conversation history: {e}")
-            return []
+            return {"conversations": [], "next_cursor": None}
     
     async def save_conversation_exchange(
         self, 
@@ -275,15 +310,9 @@ class NutritionDataService:
         agent_response: str,
         metadata: Optional[Dict[str, Any]] = None
     ) -> bool:
-        """Save a conversation exchange."""
+        """Queue a conversation exchange; it is written in the background, off the response path."""
         try:
-            self.conversations.insert_one({
-                "user_id": user_id,
-                "user_message": user_message,
-                "agent_response": agent_response,
-                "timestamp": datetime.now(),
-                "metadata": metadata or {}
-            })
+            self.conversation_store.add(user_id, user_message, agent_response, metadata)
             return True
         except Exception as e:
             logger.error(f"Error saving conversation: {e}")
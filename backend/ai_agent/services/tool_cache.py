@@ -0,0 +1,139 @@
+"""
+Memoization for agent tools and data service calls.
+
+One agent turn often asks for the same data several times: every tool
+fetches the user profile, get_personalized_meal_suggestions calls other
+tools that fetch the profile and plates again, and the model sometimes
+calls the same tool twice. Functions decorated with @memoized remember
+their results for the rest of the turn, keyed by their arguments.
+
+Slow-changing data (menus, food nutrients) can additionally be shared
+across turns and users for a short TTL.
+
+A turn is opened with start_turn() in NutritionAgent.chat; outside a turn
+only the TTL cache applies. Results are deep-copied in and out of the
+cache so callers can mutate what they get.
+"""
+
+import copy
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_SIZE = int(os.getenv("AGENT_SHARED_CACHE_SIZE", "256"))
+MENU_CACHE_TTL_SECONDS = float(os.getenv("AGENT_MENU_CACHE_TTL_SECONDS", "300"))
+
+
+class TurnCache:
+    """Results memoized during one agent turn."""
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+
+_current_turn: ContextVar[Optional[TurnCache]] = ContextVar("agent_turn_cache", default=None)
+
+_shared: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+_shared_lock = threading.Lock()
+
+
+def start_turn() -> TurnCache:
+    """
+    Open a turn cache for the current context.
+
+    Tasks started afterwards (graph nodes, tool calls) inherit it.
+    """
+    cache = TurnCache()
+    _current_turn.set(cache)
+    return cache
+
+
+def end_turn():
+    _current_turn.set(None)
+
+
+def turn_cache_hits() -> int:
+    """Cache hits so far in the current turn (0 outside a turn)."""
+    cache = _current_turn.get()
+    return cache.hits if cache else 0
+
+
+def _make_key(name: str, args: tuple, kwargs: Dict[str, Any]) -> str:
+    # Bound methods: the instance is part of the key through its id (default=str)
+    return name + json.dumps([args, sorted(kwargs.items())], default=str, separators=(",", ":"))
+
+
+def _shared_get(key: str):
+    with _shared_lock:
+        cached = _shared.get(key)
+        if cached is None:
+            return None
+        if cached[0] < time.monotonic():
+            del _shared[key]
+            return None
+        _shared.move_to_end(key)
+        return cached
+
+
+def _shared_put(key: str, value: Any, ttl_seconds: float):
+    with _shared_lock:
+        _shared[key] = (time.monotonic() + ttl_seconds, value)
+        _shared.move_to_end(key)
+        while len(_shared) > SHARED_CACHE_SIZE:
+            _shared.popitem(last=False)
+
+
+def clear_shared_cache():
+    with _shared_lock:
+        _shared.clear()
+
+
+def memoized(ttl_seconds: float = 0):
+    """
+    Memoize an async function for the current turn.
+
+    Args:
+        ttl_seconds: Also share results across turns for this long (0 = per
+            turn only). Empty results are never shared, so a failed lookup
+            is retried on the next turn.
+    """
+    def decorator(func):
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            turn = _current_turn.get()
+            key = _make_key(name, args, kwargs)
+
+            if turn is not None and key in turn.values:
+                turn.hits += 1
+                return copy.deepcopy(turn.values[key])
+            if ttl_seconds:
+                cached = _shared_get(key)
+                if cached is not None:
+                    if turn is not None:
+                        turn.hits += 1
+                        turn.values[key] = cached[1]
+                    return copy.deepcopy(cached[1])
+
+            result = await func(*args, **kwargs)
+            stored = copy.deepcopy(result)
+            if turn is not None:
+                turn.misses += 1
+                turn.values[key] = stored
+            if ttl_seconds and result:
+                _shared_put(key, stored, ttl_seconds)
+            return result
+
+        return wrapper
+    return decorator
@@ -11,6 +11,11 @@ from typing import Dict, List, Optional, Any
 from langchain_core.tools import tool
 from bson import ObjectId
 
+from allergens import normalize_allergens, profile_allergens
+from user_targets import compute_targets
+
+from ..services.tool_cache import memoized
+
 # Global data service - will be set by the agent
 data_service = None
 
@@ -20,6 +25,7 @@ def set_data_service(service):
 
 
 @tool
+@memoized()
 async def get_user_nutrition_progress(
     user_id: str,
     days: int = 1,
@@ -62,13 +68,13 @@ async def get_user_nutrition_progress(
     progress_percentage = None
     if include_goals:
         user_profile = await data_service.get_user_profile(user_id)
-        if user_profile and user_profile.get("profile"):
-            profile_data = user_profile["profile"]
+        if user_profile and user_profile.get("targets"):
+            targets = user_profile["targets"]
             goals = {
-                "calories": profile_data.get("calorie_target", 2000),
-                "protein": profile_data.get("protein_target", 150),
-                "carbs": profile_data.get("carb_target", 250),
-                "fat": profile_data.get("fat_target", 65)
+                "calories": targets["daily_calories"],
+                "protein": targets["protein_grams"],
+                "carbs": targets["carb_grams"],
+                "fat": targets["fat_grams"]
             }
             
             # Calculate progress percentages
@@ -93,6 +99,7 @@ async def get_user_nutrition_progress(
 
 
 @tool
+@memoized()
 async def get_available_dining_foods(
     date: str,
     meal_type: Optional[str] = None,
@@ -116,48 +123,33 @@ async def get_available_dining_foods(
     if not data_service:
         return {"error": "Data service not available"}
     
-    # If user_id provided, get their dietary preferences
-    if user_id and not dietary_filters:
+    # If user_id provided, get their dietary preferences and allergens
+    excluded_allergens = normalize_allergens(dietary_filters or [])
+    if user_id:
         user_profile = await data_service.get_user_profile(user_id)
         if user_profile and user_profile.get("profile"):
+            excluded_allergens = profile_allergens(user_profile["profile"], excluded_allergens)
             diet_type = user_profile["profile"].get("diet_type")
-            if diet_type:
+            if diet_type and not dietary_filters:
                 dietary_filters = [diet_type]
     
-    # Get foods for the date
+    # Get foods for the date; allergen restrictions ("gluten-free", "dairy-free", ...)
+    # are filtered in the database on the precomputed allergen flags
     foods = await data_service.get_foods_by_date(
         date=date,
         dining_hall=dining_hall,
-        meal_type=meal_type
+        meal_type=meal_type,
+        exclude_allergens=excluded_allergens
     )
     
-    # Apply dietary filters if provided
-    if dietary_filters:
+    # Apply vegetarian/vegan filters if provided
+    required_labels = [f.lower() for f in dietary_filters or [] if f.lower() in ("vegetarian", "vegan")]
+    if required_labels:
         filtered_foods = []
         for food in foods:
-            food_labels = food.get("labels", [])
-            food_tags = food.get("tags", [])
-            allergens = food.get("allergens", [])
-            
-            # Simple dietary filter logic
-            include_food = True
-            for filter_term in dietary_filters:
-                filter_lower = filter_term.lower()
-                if filter_lower in ["vegetarian", "vegan"]:
-                    # Check both labels and tags (case insensitive)
-                    food_labels_lower = [label.lower() for label in food_labels]
-                    food_tags_lower = [tag.lower() for tag in food_tags]
-                    if filter_lower not in food_labels_lower and filter_lower not in food_tags_lower:
-                        include_food = False
-                        break
-                elif filter_lower in ["gluten-free", "dairy-free"]:
-                    # Check if allergen is present
-                    allergen_check = "gluten" if "gluten" in filter_lower else "dairy"
-                    if any(allergen_check in allergen.lower() for allergen in allergens):
-                        include_food = False
-                        break
-            
-            if include_food:
+            # Check both labels and tags (case insensitive)
+            food_labels = {label.lower() for label in food.get("labels", []) + food.get("tags", [])}
+            if all(label in food_labels for label in required_labels):
                 filtered_foods.append(food)
         
         foods = filtered_foods
@@ -193,12 +185,59 @@ async def get_available_dining_foods(
         "filtered_by": {
             "meal_type": meal_type,
             "dining_hall": dining_hall,
-            "dietary_filters": dietary_filters or []
+            "dietary_filters": dietary_filters or [],
+            "excluded_allergens": excluded_allergens
         }
     }
 
 
+def _trend_direction(values: List[float]) -> str:
+    """Least-squares slope over the days, as a direction relative to the mean."""
+    count = len(values)
+    mean = sum(values) / count if count else 0
+    if count < 3 or mean <= 0:
+        return "not enough data"
+    mean_x = (count - 1) / 2
+    slope = (sum((x - mean_x) * (y - mean) for x, y in enumerate(values))
+             / sum((x - mean_x) ** 2 for x in range(count)))
+    # Change across the whole window, relative to the average day
+    change = slope * (count - 1) / mean
+    if change > 0.1:
+        return "increasing"
+    if change < -0.1:
+        return "decreasing"
+    return "steady"
+
+
+def nutrition_trends(daily_totals: Dict[str, Dict[str, float]]) -> Dict[str, Any]:
+    """
+    Day-by-day nutrition summary of a meal history window.
+    
+    Args:
+        daily_totals: Nutrition totals keyed by date (YYYY-MM-DD), days with logged meals only
+        
+    Returns:
+        Daily totals in date order, daily averages, per-nutrient trend
+        direction and the highest/lowest calorie days
+    """
+    if not daily_totals:
+        return {}
+    dates = sorted(daily_totals)
+    nutrients = list(daily_totals[dates[0]])
+    daily = [{"date": date, **{key: round(daily_totals[date][key], 1) for key in nutrients}} for date in dates]
+    return {
+        "daily_totals": daily,
+        "daily_average": {
+            key: round(sum(day[key] for day in daily) / len(daily), 1) for key in nutrients
+        },
+        "trend": {key: _trend_direction([day[key] for day in daily]) for key in nutrients},
+        "highest_calorie_day": max(daily, key=lambda day: day["calories"])["date"],
+        "lowest_calorie_day": min(daily, key=lambda day: day["calories"])["date"]
+    }
+
+
 @tool
+@memoized()
 async def get_user_meal_history(
     user_id: str,
     days: int = 7,
@@ -228,12 +267,16 @@ async def get_user_meal_history(
         end_date=end_date.strftime("%Y-%m-%d")
     )
     
+    # Nutrition of every plate, with all foods of the window fetched at once
+    plate_nutrition = await data_service.calculate_nutrition_by_plate(plates) if include_nutrition else []
+    
     # Process meals
     meals = []
     food_frequency = {}
     dining_hall_frequency = {}
+    daily_totals = {}
     
-    for plate in plates:
+    for index, plate in enumerate(plates):
         meal_data = {
             "plate_id": plate.get("_id"),
             "date": plate.get("date"),
@@ -250,9 +293,11 @@ async def get_user_meal_history(
             food_frequency[food_name] = food_frequency.get(food_name, 0) + 1
         
         if include_nutrition:
-            # Calculate nutrition for this plate
-            plate_nutrition = await data_service.calculate_nutrition_from_plates([plate])
-            meal_data["nutrition"] = plate_nutrition
+            nutrition = plate_nutrition[index]
+            meal_data["nutrition"] = {key: round(value, 1) for key, value in nutrition.items()}
+            day = daily_totals.setdefault(plate.get("date"), {key: 0.0 for key in nutrition})
+            for key, value in nutrition.items():
+                day[key] += value
         
         meals.append(meal_data)
     
@@ -272,7 +317,7 @@ async def get_user_meal_history(
                 "dining_hall": hall,
                 "visits": count
             } for hall, count in dining_hall_preferences],
-            "nutrition_trends": {} if include_nutrition else None
+            "nutrition_trends": nutrition_trends(daily_totals) if include_nutrition else None
         },
         "total_meals": len(plates),
         "days_analyzed": days
@@ -280,6 +325,7 @@ async def get_user_meal_history(
 
 
 @tool
+@memoized()
 async def search_foods_by_criteria(
     query: str,
     date: Optional[str] = None,
@@ -303,8 +349,11 @@ async def search_foods_by_criteria(
     if not data_service:
         return {"error": "Data service not available"}
     
-    # Search foods
-    foods = await data_service.search_foods(query, date, limit * 2)  # Get more for filtering
+    # Search foods; allergen restrictions are filtered in the database
+    foods = await data_service.search_foods(
+        query, date, limit * 2,  # Get more for filtering
+        exclude_allergens=normalize_allergens(dietary_restrictions or [])
+    )
     
     # Apply nutrition requirements filter
     if nutrition_requirements:
@@ -331,26 +380,13 @@ async def search_foods_by_criteria(
         
         foods = filtered_foods
     
-    # Apply dietary restrictions
-    if dietary_restrictions:
+    # Apply vegetarian/vegan restrictions
+    required_labels = [r.lower() for r in dietary_restrictions or [] if r.lower() in ("vegetarian", "vegan")]
+    if required_labels:
         filtered_foods = []
         for food in foods:
-            tags = [tag.lower() for tag in food.get("tags", [])]
-            allergens = [allergen.lower() for allergen in food.get("allergens", [])]
-            
-            meets_restrictions = True
-            for restriction in dietary_restrictions:
-                restriction_lower = restriction.lower()
-                if restriction_lower in ["vegetarian", "vegan"]:
-                    if restriction_lower not in tags:
-                        meets_restrictions = False
-                        break
-                elif "gluten-free" in restriction_lower:
-                    if any("gluten" in allergen for allergen in allergens):
-                        meets_restrictions = False
-                        break
-            
-            if meets_restrictions:
+            food_labels = {label.lower() for label in food.get("labels", []) + food.get("tags", [])}
+            if all(label in food_labels for label in required_labels):
                 filtered_foods.append(food)
         
         foods = filtered_foods
@@ -386,6 +422,7 @@ async def search_foods_by_criteria(
 
 
 @tool
+@memoized()
 async def analyze_nutrition_gaps(
     user_id: str,
     analysis_period: int = 7
@@ -409,11 +446,11 @@ async def analyze_nutrition_gaps(
         return {"error": "User profile not found"}
     
     # Get nutrition progress for analysis period
-    nutrition_data = await get_user_nutrition_progress(
-        user_id=user_id,
-        days=analysis_period,
-        include_goals=True
-    )
+    nutrition_data = await get_user_nutrition_progress.ainvoke({
+        "user_id": user_id,
+        "days": analysis_period,
+        "include_goals": True
+    })
     
     if "error" in nutrition_data:
         return nutrition_data
@@ -463,6 +500,7 @@ async def analyze_nutrition_gaps(
 
 
 @tool
+@memoized()
 async def get_personalized_meal_suggestions(
     user_id: str,
     meal_type: str,
@@ -493,16 +531,16 @@ async def get_personalized_meal_suggestions(
     dietary_preferences = profile_data.get("diet_type", "")
     
     # Get available foods for the date
-    available_foods = await get_available_dining_foods(
-        date=date,
-        meal_type=meal_type
-    )
+    available_foods = await get_available_dining_foods.ainvoke({
+        "date": date,
+        "meal_type": meal_type
+    })
     
     if "error" in available_foods:
         return available_foods
     
     # Get nutrition gaps
-    nutrition_gaps = await analyze_nutrition_gaps(user_id, 7)
+    nutrition_gaps = await analyze_nutrition_gaps.ainvoke({"user_id": user_id, "analysis_period": 7})
     priority_nutrients = nutrition_gaps.get("priority_nutrients", [])
     
     # Generate suggestions based on available foods and user needs
@@ -578,7 +616,16 @@ async def get_personalized_meal_suggestions(
     }
 
 
+# Goal names the agent uses -> profile weight_goal_type
+GOAL_TYPES = {
+    "weight_loss": "lose",
+    "weight_gain": "gain",
+    "maintenance": "maintain"
+}
+
+
 @tool
+@memoized()
 async def calculate_nutrition_targets(
     user_id: str,
     goal_type: Optional[str] = None
@@ -602,84 +649,47 @@ async def calculate_nutrition_targets(
         return {"error": "User profile not found"}
     
     profile_data = user_profile.get("profile", {})
-    
-    # Extract user data with defaults
-    age = profile_data.get("age", 25)
-    sex = profile_data.get("sex", "unknown")
-    weight = profile_data.get("current_weight", 70)  # kg
-    height = profile_data.get("height", 175)  # cm
-    activity_level = profile_data.get("activity_level", "moderate")
     current_goal = goal_type or profile_data.get("weight_goal_type", "maintenance")
     
-    # Calculate BMR using Mifflin-St Jeor equation
-    if sex.lower() == "male":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
+    # The user's own targets are cached on the user document; only a
+    # different goal ("what if I wanted to lose weight?") needs a new calculation
+    profile_goal = GOAL_TYPES.get(goal_type) if goal_type else None
+    if profile_goal and profile_goal != profile_data.get("weight_goal_type"):
+        what_if = {**profile_data, "weight_goal_type": profile_goal}
+        if profile_goal != "maintain" and not profile_data.get("weight_goal_rate"):
+            what_if["weight_goal_rate"] = "moderate"  # 1 lb/week
+        targets = compute_targets(what_if)
     else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    
-    # Activity multipliers
-    activity_multipliers = {
-        "sedentary": 1.2,
-        "light": 1.375,
-        "moderate": 1.55,
-        "active": 1.725,
-        "very_active": 1.9
-    }
+        targets = user_profile["targets"]
+    if not targets:
+        return {"error": "Targets can't be calculated until the profile has a valid weight, height, birthday and sex"}
     
-    activity_mult = activity_multipliers.get(activity_level, 1.55)
-    maintenance_calories = bmr * activity_mult
-    
-    # Adjust for goals
-    if current_goal == "weight_loss":
-        daily_calories = maintenance_calories - 500  # 1 lb/week loss
-        protein_ratio = 0.35  # Higher protein for weight loss
-        carb_ratio = 0.35
-        fat_ratio = 0.30
-    elif current_goal == "weight_gain":
-        daily_calories = maintenance_calories + 300  # Slower bulk
-        protein_ratio = 0.25
-        carb_ratio = 0.45
-        fat_ratio = 0.30
-    else:  # maintenance
-        daily_calories = maintenance_calories
-        protein_ratio = 0.25
-        carb_ratio = 0.45
-        fat_ratio = 0.30
-    
-    # Calculate macro targets
-    protein_calories = daily_calories * protein_ratio
-    carb_calories = daily_calories * carb_ratio
-    fat_calories = daily_calories * fat_ratio
-    
-    protein_grams = protein_calories / 4  # 4 cal/g
-    carb_grams = carb_calories / 4  # 4 cal/g
-    fat_grams = fat_calories / 9  # 9 cal/g
+    daily_calories = targets["daily_calories"]
+    macro_percentages = targets["macro_percentages"]
     
     return {
         "targets": {
-            "daily_calories": round(daily_calories),
-            "protein": round(protein_grams),
-            "carbs": round(carb_grams),
-            "fat": round(fat_grams)
+            "daily_calories": daily_calories,
+            "protein": targets["protein_grams"],
+            "carbs": targets["carb_grams"],
+            "fat": targets["fat_grams"]
         },
         "based_on": {
-            "age": age,
-            "sex": sex,
-            "weight": weight,
-            "height": height,
-            "activity_level": activity_level,
-            "goal": current_goal,
-            "bmr": round(bmr),
-            "maintenance_calories": round(maintenance_calories)
+            "age": targets["age"],
+            "sex": profile_data.get("sex"),
+            "weight": profile_data.get("weight"),  # lbs
+            "height": profile_data.get("height"),  # inches
+            "activity_level": profile_data.get("activity_level"),
+            "goal": current_goal
         },
         "macro_ratios": {
-            "protein_percent": round(protein_ratio * 100),
-            "carb_percent": round(carb_ratio * 100),
-            "fat_percent": round(fat_ratio * 100)
+            "protein_percent": round(macro_percentages["protein"]),
+            "carb_percent": round(macro_percentages["carbs"]),
+            "fat_percent": round(macro_percentages["fat"])
         },
         "recommendations": [
-            f"Aim for {round(protein_grams)} grams of protein daily",
-            f"Target {round(daily_calories)} calories per day for {current_goal}",
+            f"Aim for {targets['protein_grams']} grams of protein daily",
+            f"Target {daily_calories} calories per day for {current_goal}",
             "Focus on whole foods and consistent meal timing"
         ]
     }
\ No newline at end of file
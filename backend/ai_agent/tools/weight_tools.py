@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from langchain_core.tools import tool
 
+from ..services.tool_cache import memoized
+
 # Global data service - will be set by the agent
 data_service = None
 
@@ -18,6 +20,7 @@ def set_data_service(service):
 
 
 @tool
+@memoized()
 async def get_weight_progress(
     user_id: str,
     days: int = 30,
@@ -144,6 +147,7 @@ async def get_weight_progress(
 
 
 @tool
+@memoized()
 async def analyze_weight_patterns(
     user_id: str,
     analysis_period: int = 90
@@ -276,6 +280,7 @@ async def analyze_weight_patterns(
 
 
 @tool
+@memoized()
 async def get_weight_goal_analysis(
     user_id: str
 ) -> Dict[str, Any]:
@@ -305,7 +310,7 @@ async def get_weight_goal_analysis(
     current_weight = profile_data.get("current_weight")
     
     # Get recent weight progress
-    weight_progress = await get_weight_progress(user_id, 30, True)
+    weight_progress = await get_weight_progress.ainvoke({"user_id": user_id, "days": 30, "include_trends": True})
     
     if "error" in weight_progress:
         return weight_progress
@@ -0,0 +1,134 @@
+"""
+Allergen flags derived at ingest time.
+
+Every food gets an `allergens` array of normalized allergen IDs (the same
+IDs the profile settings use: milk, eggs, fish, shellfish, tree_nuts,
+peanuts, wheat, soybeans, gluten, lactose, sesame) computed once from its
+name and ingredient list when it is stored. The field is indexed, so
+"foods safe for this user" is a database filter ({"allergens": {"$nin": [...]}})
+instead of string matching per food per request.
+
+Matching is conservative: a keyword anywhere in the name or ingredients sets
+the flag. The only thing labels are used for is clearing animal-product
+flags on foods labelled Vegan ("almond milk", "coconut cream").
+
+migrate_allergens.py backfills the flags on foods stored before they existed.
+"""
+import re
+from typing import Any, Dict, Iterable, List
+
+ALLERGEN_KEYWORDS = {
+    "milk": ["milk", "cheese", "butter", "buttermilk", "cream", "yogurt", "yoghurt", "whey", "casein",
+             "caseinate", "dairy", "lactose", "ghee", "parmesan", "mozzarella", "cheddar", "ricotta", "queso"],
+    "eggs": ["egg", "mayonnaise", "mayo", "albumen", "meringue", "aioli"],
+    "fish": ["fish", "salmon", "tuna", "tilapia", "cod", "codfish", "halibut", "anchovy", "anchovies", "pollock",
+             "trout", "swai", "mahi", "catfish", "sardine"],
+    "shellfish": ["shellfish", "shrimp", "prawn", "crab", "lobster", "clam", "mussel", "oyster", "scallop",
+                  "crawfish", "crayfish"],
+    "tree_nuts": ["almond", "cashew", "walnut", "pecan", "pistachio", "hazelnut", "macadamia",
+                  "brazil nut", "pine nut", "praline"],
+    "peanuts": ["peanut"],
+    "wheat": ["wheat", "flour", "semolina", "durum", "farina", "bread", "breadcrumb", "pasta", "couscous",
+              "seitan", "spelt", "bulgur"],
+    "soybeans": ["soy", "soya", "soybean", "tofu", "edamame", "tempeh", "miso"],
+    "gluten": ["gluten", "wheat", "flour", "semolina", "durum", "farina", "bread", "breadcrumb", "pasta",
+               "couscous", "seitan", "spelt", "bulgur", "barley", "rye", "malt", "triticale"],
+    "lactose": ["milk", "cheese", "butter", "buttermilk", "cream", "yogurt", "yoghurt", "whey", "lactose",
+                "ricotta", "queso"],
+    "sesame": ["sesame", "tahini"],
+}
+
+ALLERGEN_IDS = tuple(ALLERGEN_KEYWORDS)
+
+# Flags that a Vegan label rules out
+ANIMAL_ALLERGENS = {"milk", "eggs", "fish", "shellfish", "lactose"}
+
+# Other spellings of allergen IDs used in profiles and restriction filters
+ALLERGEN_ALIASES = {
+    "dairy": ["milk"],
+    "dairy-free": ["milk"],
+    "lactose-free": ["lactose"],
+    "egg": ["eggs"],
+    "egg-free": ["eggs"],
+    "nuts": ["tree_nuts", "peanuts"],
+    "nut-free": ["tree_nuts", "peanuts"],
+    "tree nuts": ["tree_nuts"],
+    "peanut": ["peanuts"],
+    "soy": ["soybeans"],
+    "soy-free": ["soybeans"],
+    "gluten-free": ["gluten"],
+    "wheat-free": ["wheat"],
+}
+
+# "Peanut butter", "almond milk", "coconut cream"... are not dairy; keep only the first word
+_PLANT_BASED_DAIRY = re.compile(
+    r"\b(peanut|almond|cashew|sunflower|soy|oat|rice|coconut|apple|cocoa|shea)\s+(?:butter|milk|cream)s?\b"
+)
+
+# One regex per allergen: any keyword as a whole word, optionally plural
+_PATTERNS = {
+    allergen: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")(?:e?s)?\b")
+    for allergen, keywords in ALLERGEN_KEYWORDS.items()
+}
+
+
+def derive_allergens(food: Dict[str, Any]) -> List[str]:
+    """
+    Allergen IDs present in a food, from its name, description and ingredients.
+
+    Returns:
+        Sorted list of allergen IDs
+    """
+    ingredients = food.get("ingredients") or []
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+    text = " ".join([str(food.get("name") or ""), str(food.get("description") or "")]
+                    + [str(i) for i in ingredients]).lower()
+    text = _PLANT_BASED_DAIRY.sub(r"\1", text)
+
+    found = {allergen for allergen, pattern in _PATTERNS.items() if pattern.search(text)}
+    if any(str(label).lower() == "vegan" for label in food.get("labels") or []):
+        found -= ANIMAL_ALLERGENS
+    return sorted(found)
+
+
+def annotate_allergens(foods: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+    """Set `allergens` on each food document (in place) and return them."""
+    for food in foods:
+        food["allergens"] = derive_allergens(food)
+    return foods
+
+
+def normalize_allergens(values: Iterable[Any]) -> List[str]:
+    """
+    Map profile allergens / restriction filters ("dairy-free", "Soy", "tree_nuts") to allergen IDs.
+
+    Unknown values are ignored.
+    """
+    result = set()
+    for value in values or []:
+        key = str(value or "").strip().lower()
+        if key in ALLERGEN_KEYWORDS:
+            result.add(key)
+        else:
+            result.update(ALLERGEN_ALIASES.get(key, ()))
+    return sorted(result)
+
+
+def profile_allergens(profile: Dict[str, Any], extra: Iterable[Any] = ()) -> List[str]:
+    """Allergen IDs a user must avoid: profile allergens, food sensitivities and any extra values."""
+    food_sens = profile.get("food_sensitivities") or profile.get("foode_sensitivities") or []
+    values = list(profile.get("allergens") or []) + list(food_sens) + list(extra or [])
+    return normalize_allergens(values)
+
+
+def exclude_allergens_query(allergen_ids: Iterable[str]) -> Dict[str, Any]:
+    """
+    Query fragment matching foods free of the given allergens.
+
+    Fails closed: foods that were never annotated (no `allergens` field) are
+    excluded too, since nothing is known about them. Run
+    migrate_allergens.py to annotate older documents.
+    """
+    allergen_ids = list(allergen_ids)
+    return {"allergens": {"$exists": True, "$nin": allergen_ids}} if allergen_ids else {}
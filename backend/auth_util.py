@@ -2,12 +2,53 @@ from passlib.context import CryptContext
 from fastapi import HTTPException, status, Response, Request, Depends
 from pymongo.collection import Collection
 from jwt_util import decode_access_token
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import copy
+import logging
+import multiprocessing
 import os
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
 
 # Determine if running in production
 IS_PRODUCTION = os.getenv("ENVIRONMENT", "development") == "production"
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor. Hashes with any other cost are transparently re-hashed
+# on the next successful login (verify_and_update_password).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Password hashing runs in a dedicated process pool so bcrypt never occupies
+# the threads serving ordinary API calls; the semaphore caps how many hashes
+# are in flight per worker, the rest wait (queue depth is exported as a metric).
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", str(PASSWORD_HASH_WORKERS)))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+_hash_semaphore = None
+
+# Process-level cache of user documents keyed by token subject (email).
+# Kept short-lived so other workers' profile changes show up quickly; this
+# worker's own changes invalidate it immediately (invalidate_user_cache).
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+_user_cache = OrderedDict()  # email -> (expires_at, user document)
+_user_cache_lock = threading.Lock()
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -15,6 +56,83 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def _verify_and_update(plain_password: str, hashed_password: str):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+def _get_hash_pool(reset: bool = False) -> ProcessPoolExecutor:
+    global _hash_pool
+    with _hash_pool_lock:
+        if reset and _hash_pool is not None:
+            _hash_pool.shutdown(wait=False, cancel_futures=True)
+            _hash_pool = None
+        if _hash_pool is None:
+            # spawn, not fork: the API process has MongoClient/event-loop threads running.
+            # Spawned workers re-import the __main__ module, so entry points must
+            # not import main at module level (see production_server.py)
+            _hash_pool = ProcessPoolExecutor(
+                max_workers=max(1, PASSWORD_HASH_WORKERS),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _hash_pool
+
+def shutdown_password_pool():
+    """Stop the hashing worker processes (called on app shutdown)"""
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(wait=False, cancel_futures=True)
+            _hash_pool = None
+
+async def _run_in_hash_pool(operation: str, func, *args):
+    global _hash_semaphore
+    if _hash_semaphore is None:
+        _hash_semaphore = asyncio.Semaphore(max(1, PASSWORD_HASH_CONCURRENCY))
+
+    queued = metrics.gauge("password_hash_queue_depth")
+    in_flight = metrics.gauge("password_hash_in_flight")
+    wait_start = time.perf_counter()
+    queued.inc()
+    try:
+        await _hash_semaphore.acquire()
+    finally:
+        queued.dec()
+    metrics.histogram("password_hash_wait_ms").observe((time.perf_counter() - wait_start) * 1000)
+
+    in_flight.inc()
+    try:
+        with metrics.timed(f"password_{operation}_ms"):
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(_get_hash_pool(), func, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM killed) - start a fresh pool and retry once
+                logger.warning("Password hashing pool broke, restarting it")
+                metrics.counter("password_hash_pool_restarts").inc()
+                return await loop.run_in_executor(_get_hash_pool(reset=True), func, *args)
+    finally:
+        in_flight.dec()
+        _hash_semaphore.release()
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password in the hashing process pool"""
+    return await _run_in_hash_pool("hash", hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password in the hashing process pool"""
+    return await _run_in_hash_pool("verify", verify_password, plain_password, hashed_password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """
+    Verify a password and re-hash it if its cost factor is outdated.
+
+    Returns:
+        (valid, new_hash) - new_hash is None unless the stored hash should be replaced
+    """
+    valid, new_hash = await _run_in_hash_pool("verify", _verify_and_update, plain_password, hashed_password)
+    if new_hash:
+        metrics.counter("password_rehashes").inc()
+    return valid, new_hash
+
 def set_auth_cookie(response: Response, token: str):
     response.set_cookie(
         key="access_token",
@@ -33,7 +151,36 @@ def clear_auth_cookie(response: Response):
 def get_user_by_email(users_collection: Collection, email: str):
     return users_collection.find_one({"email": email})
 
-def get_current_user(request: Request, users_collection: Collection):
+def _get_cached_user(email: str):
+    with _user_cache_lock:
+        entry = _user_cache.get(email)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del _user_cache[email]
+            return None
+        _user_cache.move_to_end(email)
+    # Hand out a copy so callers mutating the document can't poison the cache
+    return copy.deepcopy(user)
+
+def _cache_user(email: str, user: dict):
+    with _user_cache_lock:
+        _user_cache[email] = (time.monotonic() + USER_CACHE_TTL_SECONDS, copy.deepcopy(user))
+        _user_cache.move_to_end(email)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+
+def invalidate_user_cache(email: str):
+    """Drop a user from the process cache after their document changes"""
+    with _user_cache_lock:
+        _user_cache.pop(email, None)
+
+def get_token_payload(request: Request) -> dict:
+    """Decode the auth cookie once per request"""
+    payload = getattr(request.state, "token_payload", None)
+    if payload is not None:
+        return payload
     token = request.cookies.get("access_token")
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -41,7 +188,44 @@ def get_current_user(request: Request, users_collection: Collection):
         payload = decode_access_token(token)
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
-    user = users_collection.find_one({"email": payload["sub"]})
-    if not user:
+    request.state.token_payload = payload
+    return payload
+
+def get_current_user(request: Request, users_collection: Collection):
+    """
+    Return the authenticated user's document.
+
+    Cached for the rest of the request on request.state and across requests
+    in a short-TTL process cache keyed by the token subject.
+    """
+    user = getattr(request.state, "current_user", None)
+    if user is not None:
+        return user
+    email = get_token_payload(request)["sub"]
+    user = _get_cached_user(email)
+    if user is None:
+        user = users_collection.find_one({"email": email})
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        _cache_user(email, user)
+    request.state.current_user = user
+    return user
+
+def get_current_user_id(request: Request, users_collection: Collection = None) -> str:
+    """
+    Return the authenticated user's ID.
+
+    The user is confirmed through get_current_user, so a token outliving its
+    account (deleted, or re-registered under the same email) is rejected;
+    most requests are served from the short-TTL user cache. Without a
+    collection the "uid" claim is trusted as is.
+    """
+    user_id = get_token_payload(request).get("uid")
+    if users_collection is None:
+        if user_id:
+            return user_id
+        raise HTTPException(status_code=401, detail="Invalid token")
+    current_id = str(get_current_user(request, users_collection)["_id"])
+    if user_id and user_id != current_id:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
\ No newline at end of file
+    return current_id
\ No newline at end of file
@@ -0,0 +1,767 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the AI agent and the AI meal planner.
+
+Drives NutritionAgent.chat and the /api/meal-plan pipeline (food filtering,
+targets, MealPlannerAI.generate_meal_plan, enhance_meal_plan_response) end to
+end without any network access:
+
+- MongoDB is replaced by mongomock, seeded with synthetic users, a day of
+  menus, 30 days of plates and weight logs. Every collection call is counted.
+- The OpenAI chat model is replaced by ScriptedChatModel, which answers each
+  scenario with a fixed sequence of tool calls and then streams a text
+  answer token by token (with configurable delays).
+- The Anthropic client of MealPlannerAI is replaced by an in-process fake
+  that returns a greedy meal plan for the foods in the prompt.
+
+Reported per scenario: turn latency and time to first token, time spent in
+each graph node, LLM and tool calls, MongoDB operations per turn (by
+collection) and peak Python memory. Node and tool times are taken from
+the graph's event stream, so they include a little event delivery overhead.
+
+Search through search_foods_by_criteria is not covered: mongomock does not
+implement $text queries.
+
+Needs the backend requirements plus mongomock:
+    pip install mongomock
+
+Usage:
+    python benchmarks/bench_agent.py
+    python benchmarks/bench_agent.py --runs 10 --users 5 --foods 600
+    python benchmarks/bench_agent.py --json bench_agent.json
+    python benchmarks/bench_agent.py --baseline bench_agent.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("USE_FOOD_CATALOG", "false")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import mongomock
+from bson import ObjectId
+from pydantic import Field
+
+from langchain_core.language_models.chat_models import (
+    BaseChatModel, agenerate_from_stream, generate_from_stream
+)
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from allergens import derive_allergens
+from user_targets import compute_targets, get_targets
+from ai_agent.agent import NutritionAgent
+from ai_agent.services.context_manager import estimate_message_tokens, estimate_tokens
+from ai_agent.services.tool_cache import clear_shared_cache
+from meal_planning.ai_integration import MealPlannerAI
+from meal_planning.food_filtering import get_filtered_foods_for_meal_plan
+from meal_planning.meal_validation import enhance_meal_plan_response
+from meal_planning.target_calculation import calculate_meal_targets, get_user_targets
+from models.meal_plan import DiningHallMeal, MealPlanRequest
+
+DINING_HALLS = [
+    "United Table @ Peterson Heritage Center",
+    "City Edge @ Kahlert Village",
+    "Urban Bytes @ Kahlert Village"
+]
+MEALS = ["Breakfast", "Lunch", "Dinner"]
+NODES = ("analyze_query", "manage_context", "call_model", "tools")
+
+COUNTED_METHODS = {
+    "find", "find_one", "aggregate", "insert_one", "insert_many", "update_one", "update_many",
+    "replace_one", "delete_one", "delete_many", "bulk_write", "find_one_and_update",
+    "count_documents", "distinct"
+}
+
+FOOD_WORDS = {
+    "protein": ["Grilled Chicken", "Turkey Breast", "Salmon Fillet", "Beef Brisket", "Tofu", "Black Bean Patty",
+                "Scrambled Eggs", "Shrimp", "Pulled Pork", "Tempeh"],
+    "base": ["Rice Bowl", "Wrap", "Salad", "Pasta", "Sandwich", "Burrito", "Stir Fry", "Flatbread", "Soup", "Plate"],
+    "extra": ["with Cheddar", "with Peanut Sauce", "with Roasted Vegetables", "with Pesto", "with Almonds",
+              "with Yogurt Dressing", "with Salsa", "", "", ""]
+}
+MEATLESS = {"Tofu", "Black Bean Patty", "Scrambled Eggs", "Tempeh"}
+
+ANSWER = (
+    "Nice work today! Based on what you've logged you're at about 62 grams of protein against a goal "
+    "of 120, so dinner is a good chance to catch up. The grilled chicken rice bowl plus a side of black "
+    "beans would close most of that gap, and the roasted vegetables keep fat in check. Keep it up and "
+    "let me know if you want a full plan for tomorrow."
+)
+
+# Each scenario is one user message; the fake model answers it with these
+# rounds of tool calls ("{user_id}" and "{date}" are filled in), then ANSWER
+SCENARIOS = [
+    {
+        "name": "protein_progress",
+        "prompt": "How am I doing on protein today?",
+        "rounds": [[("get_user_nutrition_progress", {"user_id": "{user_id}", "days": 1})]]
+    },
+    {
+        "name": "dinner_suggestions",
+        "prompt": "What should I get for dinner tonight? I want to fill my nutrition gaps.",
+        "rounds": [
+            [("get_available_dining_foods", {"date": "{date}", "meal_type": "dinner", "user_id": "{user_id}"}),
+             ("analyze_nutrition_gaps", {"user_id": "{user_id}", "analysis_period": 7})],
+            [("get_personalized_meal_suggestions", {"user_id": "{user_id}", "meal_type": "dinner", "date": "{date}"})]
+        ]
+    },
+    {
+        "name": "weight_and_meals",
+        "prompt": "Am I on track with my weight goal? And what did I eat this week?",
+        "rounds": [[("get_weight_progress", {"user_id": "{user_id}", "days": 30}),
+                    ("get_user_meal_history", {"user_id": "{user_id}", "days": 7})]]
+    },
+    {
+        "name": "vegetarian_lunch",
+        "prompt": "Any vegetarian lunch options with decent protein?",
+        "rounds": [[("get_available_dining_foods", {"date": "{date}", "meal_type": "lunch",
+                                                    "dietary_filters": ["vegetarian"], "user_id": "{user_id}"})]]
+    }
+]
+
+
+# MongoDB stand-in that counts operations
+class MongoOpCounter:
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+    def snapshot(self) -> Counter:
+        with self.lock:
+            return Counter(self.counts)
+
+    def since(self, before: Counter) -> Dict[str, int]:
+        after = self.snapshot()
+        after.subtract(before)
+        return {key: count for key, count in sorted(after.items()) if count}
+
+
+class CountingCollection:
+    def __init__(self, collection, database, counter: MongoOpCounter):
+        self._collection = collection
+        self._counter = counter
+        self.database = database
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in COUNTED_METHODS:
+            return attr
+        key = f"{self._collection.name}.{name}"
+
+        def counted(*args, **kwargs):
+            self._counter.add(key)
+            return attr(*args, **kwargs)
+        return counted
+
+
+class CountingDatabase:
+    def __init__(self, database, counter: MongoOpCounter):
+        self._database = database
+        self._counter = counter
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name], self, self._counter)
+
+    def __getattr__(self, name):
+        attr = getattr(self._database, name)
+        if isinstance(attr, mongomock.Collection):
+            return CountingCollection(attr, self, self._counter)
+        return attr
+
+
+class CountingClient:
+    def __init__(self, client, counter: MongoOpCounter):
+        self._client = client
+        self._counter = counter
+
+    def __getitem__(self, name):
+        return CountingDatabase(self._client[name], self._counter)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def seed(db, users: int, foods_per_day: int, today: datetime) -> List[Dict[str, Any]]:
+    """Insert synthetic users, today's menu, plates and weight logs; return the user documents."""
+    rng = random.Random(42)
+    date = today.strftime("%Y-%m-%d")
+
+    foods = []
+    for i in range(foods_per_day):
+        protein_word = rng.choice(FOOD_WORDS["protein"])
+        name = " ".join(filter(None, [protein_word, rng.choice(FOOD_WORDS["base"]), rng.choice(FOOD_WORDS["extra"])]))
+        calories = rng.randint(80, 650)
+        # Roughly 30/40/30 calories from protein/carbs/fat, so greedy plans can hit targets
+        labels = ["vegetarian"] if protein_word in MEATLESS else []
+        if protein_word in ("Tofu", "Tempeh", "Black Bean Patty") and "Cheddar" not in name and "Yogurt" not in name:
+            labels.append("vegan")
+        food = {
+            "_id": ObjectId(),
+            "name": name,
+            "description": f"{name} made fresh daily",
+            "date": date,
+            "dining_hall": DINING_HALLS[i % len(DINING_HALLS)],
+            "meal_name": MEALS[(i // len(DINING_HALLS)) % len(MEALS)],
+            "station": f"Station {i % 6 + 1}",
+            "labels": labels,
+            "ingredients": [w.lower() for w in name.split()],
+            "nutrients": {
+                "calories": calories,
+                "protein": round(calories * 0.30 / 4 * rng.uniform(0.6, 1.4), 1),
+                "total_carbohydrates": round(calories * 0.40 / 4 * rng.uniform(0.6, 1.4), 1),
+                "total_fat": round(calories * 0.30 / 9 * rng.uniform(0.6, 1.4), 1),
+                "dietary_fiber": round(rng.uniform(0, 8), 1)
+            }
+        }
+        food["allergens"] = derive_allergens(food)
+        foods.append(food)
+    db["foods"].insert_many(foods)
+    food_ids = [str(food["_id"]) for food in foods]
+
+    user_docs = []
+    for u in range(users):
+        profile = {
+            "name": f"Student {u}",
+            "sex": "female" if u % 2 else "male",
+            "weight": 150 + 10 * (u % 5),
+            "height": 64 + u % 10,
+            "birthday": f"{2001 + u % 5}-0{1 + u % 9}-15",
+            "activity_level": "moderate",
+            "weight_goal_type": "lose" if u % 3 == 0 else "maintain",
+            "weight_goal_rate": "moderate",
+            "goal_weight": 140 + 10 * (u % 5),
+            "diet_type": "vegetarian" if u % 4 == 1 else None,
+            "dietary_preferences": ["vegetarian"] if u % 4 == 1 else [],
+            "allergens": ["peanuts"] if u % 3 == 2 else []
+        }
+        user = {
+            "_id": ObjectId(),
+            "email": f"student{u}@example.edu",
+            "profile": profile,
+            "targets": compute_targets(profile, today)
+        }
+        user_docs.append(user)
+        user_id = str(user["_id"])
+
+        plates, weights = [], []
+        for day in range(30):
+            plate_date = (today - timedelta(days=day)).strftime("%Y-%m-%d")
+            for meal in ("breakfast", "lunch", "dinner"):
+                plates.append({
+                    "user_id": user_id,
+                    "date": plate_date,
+                    "meal_type": meal,
+                    "items": [{"food_id": rng.choice(food_ids), "quantity": rng.choice([0.5, 1.0, 1.0, 1.5])}
+                              for _ in range(rng.randint(2, 4))]
+                })
+            if day % 3 == 0:
+                weights.append({"user_id": user_id, "date": plate_date,
+                                "weight": round(profile["weight"] + day * 0.1 + rng.uniform(-0.5, 0.5), 1)})
+        db["plates"].insert_many(plates)
+        db["weight_log"].insert_many(weights)
+
+    db["users"].insert_many(user_docs)
+    return user_docs
+
+
+# Fake LLMs
+def _fill(value: Any, context: Dict[str, str]) -> Any:
+    if isinstance(value, str):
+        return value.format(**context)
+    if isinstance(value, list):
+        return [_fill(item, context) for item in value]
+    if isinstance(value, dict):
+        return {key: _fill(item, context) for key, item in value.items()}
+    return value
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model that plays back SCENARIOS.
+
+    The user message picks the scenario; the number of model rounds since
+    that message picks the tool calls to make, and once the rounds are used
+    up the model streams ANSWER. Summarization requests get a short summary.
+    """
+
+    scenarios: Dict[str, List[List[Any]]] = Field(default_factory=dict)
+    context: Dict[str, str] = Field(default_factory=dict)
+    first_token_delay: float = 0.0
+    token_delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _plan(self, messages: List[BaseMessage]) -> List[AIMessageChunk]:
+        if messages and isinstance(messages[0], SystemMessage) and str(messages[0].content).startswith("Summarize"):
+            text, tool_calls = "The student is tracking protein and asked about dinner options and weight progress.", []
+        else:
+            last_human = max(i for i, message in enumerate(messages) if isinstance(message, HumanMessage))
+            rounds = self.scenarios.get(str(messages[last_human].content), [])
+            done = sum(1 for message in messages[last_human:] if isinstance(message, AIMessage) and message.tool_calls)
+            if done < len(rounds):
+                text, tool_calls = "", [(name, _fill(args, self.context)) for name, args in rounds[done]]
+            else:
+                text, tool_calls = ANSWER, []
+
+        if tool_calls:
+            chunks = [AIMessageChunk(content="", tool_call_chunks=[
+                tool_call_chunk(name=name, args=json.dumps(args), id=f"call_{uuid.uuid4().hex[:16]}", index=index)
+            ]) for index, (name, args) in enumerate(tool_calls)]
+            output = json.dumps(tool_calls)
+        else:
+            words = text.split(" ")
+            chunks = [AIMessageChunk(content=word if i == 0 else " " + word) for i, word in enumerate(words)]
+            output = text
+        input_tokens, output_tokens = estimate_message_tokens(messages), estimate_tokens(output)
+        chunks.append(AIMessageChunk(content="", usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        }))
+        return chunks
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        for i, chunk in enumerate(self._plan(messages)):
+            time.sleep(self.first_token_delay if i == 0 else self.token_delay)
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content, chunk=generation)
+            yield generation
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        for i, chunk in enumerate(self._plan(messages)):
+            await asyncio.sleep(self.first_token_delay if i == 0 else self.token_delay)
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content, chunk=generation)
+            yield generation
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+
+
+class FakeAnthropicClient:
+    """Stands in for anthropic.Anthropic; messages.create returns a prepared plan."""
+
+    def __init__(self, first_token_delay: float, token_delay: float):
+        self.messages = self
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.plan_text = "{}"
+        self.calls = 0
+        self.prompt_chars = 0
+
+    def create(self, model: str, max_tokens: int, system: str, messages: List[Dict[str, str]], **kwargs):
+        self.calls += 1
+        prompt = system + "".join(message["content"] for message in messages)
+        self.prompt_chars += len(prompt)
+        output_tokens = estimate_tokens(self.plan_text)
+        time.sleep(self.first_token_delay + self.token_delay * output_tokens)
+        return SimpleNamespace(
+            id=f"msg_{uuid.uuid4().hex[:16]}",
+            model=model,
+            stop_reason="end_turn",
+            usage=SimpleNamespace(input_tokens=estimate_tokens(prompt), output_tokens=output_tokens),
+            content=[SimpleNamespace(type="text", text=self.plan_text)]
+        )
+
+
+def greedy_plan(ai_foods: Dict[str, List[list]], meal_targets: Dict[str, Dict[str, float]]) -> Dict[str, list]:
+    """Meal plan in the format the prompt asks for: largest foods first until each meal's calories are met."""
+    plan = {}
+    for meal_type, target in meal_targets.items():
+        rows = sorted(ai_foods.get(meal_type, []), key=lambda row: row[2], reverse=True)
+        picked, calories = [], 0.0
+        for row in rows:
+            if len(picked) == 6:
+                break
+            if calories + row[2] <= target["calories"] * 1.05:
+                picked.append(row)
+                calories += row[2]
+        if not picked and rows:
+            picked, calories = [rows[-1]], rows[-1][2]
+        scale = max(0.5, min(2.0, target["calories"] / calories)) if calories else 1.0
+        plan[meal_type] = [{"food_index": row[0], "quantity": round(scale, 1)} for row in picked]
+    return plan
+
+
+# Agent instrumentation
+class TurnRecorder:
+    """Node, tool and LLM timings of one turn, from the graph's event stream."""
+
+    def __init__(self):
+        self.node_ms: Dict[str, float] = defaultdict(float)
+        self.tool_ms: Dict[str, float] = defaultdict(float)
+        self.tool_calls = 0
+        self.nested_tool_calls = 0
+        self.tool_errors = 0
+        self.llm_calls = 0
+        self._started: Dict[str, float] = {}
+        self._tool_runs = set()
+
+    def record(self, event: Dict[str, Any]):
+        now = time.perf_counter()
+        kind, name, run_id = event["event"], event.get("name"), event.get("run_id")
+        node = event.get("metadata", {}).get("langgraph_node")
+
+        if kind == "on_chain_start" and name in NODES and name == node:
+            self._started[run_id] = now
+        elif kind == "on_chain_end" and run_id in self._started and name in NODES:
+            self.node_ms[name] += (now - self._started.pop(run_id)) * 1000
+        elif kind == "on_tool_start":
+            self._started[run_id] = now
+            if self._tool_runs.intersection(event.get("parent_ids", [])):
+                self.nested_tool_calls += 1
+            else:
+                self.tool_calls += 1
+            self._tool_runs.add(run_id)
+        elif kind in ("on_tool_end", "on_tool_error") and run_id in self._started:
+            self.tool_ms[name] += (now - self._started.pop(run_id)) * 1000
+            self.tool_errors += kind == "on_tool_error"
+        elif kind == "on_chat_model_start":
+            self.llm_calls += 1
+
+
+class RecordingGraph:
+    """Wraps the compiled graph so every streamed event also goes to the current recorder."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.recorder: Optional[TurnRecorder] = None
+
+    async def astream_events(self, *args, **kwargs):
+        async for event in self.graph.astream_events(*args, **kwargs):
+            if self.recorder:
+                self.recorder.record(event)
+            yield event
+
+    def __getattr__(self, name):
+        return getattr(self.graph, name)
+
+
+async def run_turn(agent: NutritionAgent, raw_db, counter: MongoOpCounter, user_id: str,
+                   session_id: str, scenario: Dict[str, Any]) -> Dict[str, Any]:
+    recorder = TurnRecorder()
+    agent.agent.recorder = recorder
+    agent.llm.context["user_id"] = user_id
+    before = counter.snapshot()
+    errors = []
+
+    start = time.perf_counter()
+    ttft = None
+    async for chunk in agent.chat(scenario["prompt"], user_id, session_id):
+        if chunk["type"] == "response" and ttft is None:
+            ttft = (time.perf_counter() - start) * 1000
+        elif chunk["type"] == "error":
+            errors.append(chunk.get("error"))
+    latency = (time.perf_counter() - start) * 1000
+
+    # The exchange is saved in the background; write it now so it is counted with this turn
+    agent.data_service.conversation_store.flush()
+    mongo_ops = counter.since(before)
+    saved = raw_db["conversations"].find_one({"user_id": user_id}, sort=[("timestamp", -1)]) or {}
+    return {
+        "latency_ms": latency,
+        "ttft_ms": ttft or latency,
+        "nodes_ms": dict(recorder.node_ms),
+        "tools_ms": dict(recorder.tool_ms),
+        "tool_calls": recorder.tool_calls,
+        "nested_tool_calls": recorder.nested_tool_calls,
+        "tool_errors": recorder.tool_errors,
+        "llm_calls": recorder.llm_calls,
+        "mongo_ops": mongo_ops,
+        "cache_hits": saved.get("metadata", {}).get("cache_hits", 0),
+        "errors": errors
+    }
+
+
+def run_meal_plan(db, user: Dict[str, Any], date: str, planner: MealPlannerAI,
+                  fake_client: FakeAnthropicClient) -> Dict[str, Any]:
+    """The /api/meal-plan pipeline, minus authentication and rate limiting."""
+    request = MealPlanRequest(
+        use_profile_data=True,
+        use_profile_preferences=True,
+        dining_hall_meals=[DiningHallMeal(meal_type=meal.lower(), dining_hall=DINING_HALLS[i])
+                           for i, meal in enumerate(MEALS)],
+        date=date
+    )
+    user_profile = user.get("profile", {})
+    calls_before, chars_before = fake_client.calls, fake_client.prompt_chars
+
+    start = time.perf_counter()
+    profile_targets = get_targets(db["users"], user)
+    target_calories, target_macros = get_user_targets(request, user_profile, profile_targets)
+    meal_targets = calculate_meal_targets(target_calories, target_macros)
+    dining_hall_meals = [{"meal_type": meal.meal_type.value, "dining_hall": meal.dining_hall}
+                         for meal in request.dining_hall_meals]
+    filtered = get_filtered_foods_for_meal_plan(request, user_profile, db["foods"], date)
+    foods_by_meal = filtered["foods_by_meal"]
+    filter_ms = (time.perf_counter() - start) * 1000
+
+    ai_foods, _ = planner.organize_foods_for_ai(foods_by_meal)
+    fake_client.plan_text = json.dumps(greedy_plan(ai_foods, meal_targets), separators=(",", ":"))
+    plan = planner.generate_meal_plan(foods_by_meal, meal_targets, filtered["dietary_labels"],
+                                      dining_hall_meals, user_profile)
+    if plan is not None:
+        enhance_meal_plan_response(plan, foods_by_meal, dining_hall_meals, target_calories, target_macros, date)
+
+    return {
+        "latency_ms": (time.perf_counter() - start) * 1000,
+        "filter_ms": filter_ms,
+        "attempts": fake_client.calls - calls_before,
+        "prompt_tokens": (fake_client.prompt_chars - chars_before) // 4,
+        "foods": sum(len(foods) for foods in foods_by_meal.values()),
+        "succeeded": plan is not None
+    }
+
+
+# Reporting
+def percentile(values: List[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))] if values else 0.0
+
+
+def summarize_turns(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    mongo_totals = [sum(sample["mongo_ops"].values()) for sample in samples]
+    by_collection: Dict[str, int] = {}
+    for sample in samples:
+        for key, count in sample["mongo_ops"].items():
+            by_collection[key] = max(by_collection.get(key, 0), count)
+    return {
+        "latency_ms": {"p50": percentile([s["latency_ms"] for s in samples], 0.5),
+                       "p95": percentile([s["latency_ms"] for s in samples], 0.95)},
+        "ttft_ms": {"p50": percentile([s["ttft_ms"] for s in samples], 0.5)},
+        "nodes_ms": {node: percentile([s["nodes_ms"].get(node, 0.0) for s in samples], 0.5) for node in NODES},
+        "tool_calls": max(s["tool_calls"] for s in samples),
+        "nested_tool_calls": max(s["nested_tool_calls"] for s in samples),
+        "tool_errors": sum(s["tool_errors"] for s in samples),
+        "llm_calls": max(s["llm_calls"] for s in samples),
+        "cache_hits": statistics.median(s["cache_hits"] for s in samples),
+        "mongo_ops": {"total": max(mongo_totals), "by_collection": by_collection}
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    config = report["config"]
+    print(f"\nAgent turns - {config['runs']} runs x {config['users']} users, {config['foods']} foods "
+          f"(ms; counts are the max per turn)")
+    print(f"  {'scenario':<20} {'p50':>8} {'p95':>8} {'ttft':>8} {'analyze':>8} {'context':>8} "
+          f"{'model':>8} {'tools':>8} {'llm':>4} {'tool':>5} {'nest':>5} {'hits':>5} {'mongo':>6} {'peak KB':>8}")
+    for name, result in report["scenarios"].items():
+        nodes = result["nodes_ms"]
+        print(f"  {name:<20} {result['latency_ms']['p50']:8.1f} {result['latency_ms']['p95']:8.1f} "
+              f"{result['ttft_ms']['p50']:8.1f} {nodes['analyze_query']:8.1f} {nodes['manage_context']:8.1f} "
+              f"{nodes['call_model']:8.1f} {nodes['tools']:8.1f} {result['llm_calls']:4d} "
+              f"{result['tool_calls']:5d} {result['nested_tool_calls']:5d} {result['cache_hits']:5.0f} "
+              f"{result['mongo_ops']['total']:6d} {result.get('memory_peak_kb', 0):8.0f}")
+    for name, result in report["scenarios"].items():
+        ops = ", ".join(f"{key} {count}" for key, count in result["mongo_ops"]["by_collection"].items())
+        print(f"  {name:<20} mongo: {ops}")
+        if result["tool_errors"]:
+            print(f"  {name:<20} tool errors: {result['tool_errors']}")
+
+    plan = report["meal_plan"]
+    print(f"\nMeal plan - {config['runs']} runs x {config['users']} users")
+    print(f"  p50 {plan['latency_ms']['p50']:8.1f}  p95 {plan['latency_ms']['p95']:8.1f}  "
+          f"filter p50 {plan['filter_ms']['p50']:6.1f}  attempts {plan['attempts']}  "
+          f"prompt tokens {plan['prompt_tokens']}  foods {plan['foods']}  "
+          f"succeeded {plan['succeeded']}/{plan['plans']}  mongo {plan['mongo_ops']['total']}  "
+          f"peak KB {plan.get('memory_peak_kb', 0):.0f}")
+    print(f"\nMax RSS: {report['max_rss_kb']} KB")
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions against a saved report: more LLM/tool/Mongo calls, or p50 latency beyond tolerance."""
+    problems = []
+    sections = dict(report["scenarios"], meal_plan=report["meal_plan"])
+    base_sections = dict(baseline.get("scenarios", {}), meal_plan=baseline.get("meal_plan", {}))
+    for name, result in sections.items():
+        base = base_sections.get(name)
+        if not base:
+            continue
+        for key in ("llm_calls", "tool_calls", "nested_tool_calls", "attempts"):
+            if key in result and result[key] > base.get(key, result[key]):
+                problems.append(f"{name}: {key} {base[key]} -> {result[key]}")
+        if result["mongo_ops"]["total"] > base["mongo_ops"]["total"]:
+            problems.append(f"{name}: mongo ops {base['mongo_ops']['total']} -> {result['mongo_ops']['total']}")
+        limit = base["latency_ms"]["p50"] * (1 + tolerance)
+        if result["latency_ms"]["p50"] > limit:
+            problems.append(f"{name}: p50 {base['latency_ms']['p50']:.1f} -> {result['latency_ms']['p50']:.1f} ms "
+                            f"(limit {limit:.1f})")
+    return problems
+
+
+async def run(args) -> Dict[str, Any]:
+    today = datetime.now()
+    date = today.strftime("%Y-%m-%d")
+    raw_client = mongomock.MongoClient()
+    raw_db = raw_client["nutritionapp"]
+    counter = MongoOpCounter()
+    client = CountingClient(raw_client, counter)
+    db = client["nutritionapp"]
+    users = seed(raw_db, args.users, args.foods, today)
+
+    agent = NutritionAgent(client, "bench-key")
+    fake_llm = ScriptedChatModel(
+        scenarios={scenario["prompt"]: scenario["rounds"] for scenario in SCENARIOS},
+        context={"date": date},
+        first_token_delay=args.first_token_delay,
+        token_delay=args.token_delay
+    )
+    agent.llm = fake_llm
+    agent.llm_with_tools = fake_llm
+    agent.agent = RecordingGraph(agent.agent)
+
+    planner = MealPlannerAI("bench-key")
+    fake_anthropic = FakeAnthropicClient(args.first_token_delay, args.token_delay)
+    planner.client = fake_anthropic
+
+    async def conversation(session_prefix: str, user: Dict[str, Any], traced: bool = False):
+        """All scenarios as one conversation, so later turns carry history."""
+        results = {}
+        for scenario in SCENARIOS:
+            if traced:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            result = await run_turn(agent, raw_db, counter, str(user["_id"]), f"{session_prefix}-{user['_id']}", scenario)
+            if result["errors"]:
+                raise RuntimeError(f"{scenario['name']} failed: {result['errors']}")
+            if traced:
+                result["memory_peak_kb"] = (tracemalloc.get_traced_memory()[1] - base) / 1024
+            results[scenario["name"]] = result
+        return results
+
+    def meal_plan(user: Dict[str, Any]) -> Dict[str, Any]:
+        before = counter.snapshot()
+        result = run_meal_plan(db, dict(user), date, planner, fake_anthropic)
+        result["mongo_ops"] = counter.since(before)
+        return result
+
+    # Warm up (graph compilation, first imports, executor threads)
+    await conversation("warmup", users[0])
+    meal_plan(users[0])
+
+    turns = defaultdict(list)
+    plans = []
+    for run_index in range(args.runs):
+        clear_shared_cache()
+        for user in users:
+            for name, result in (await conversation(f"run{run_index}", user)).items():
+                turns[name].append(result)
+            plans.append(meal_plan(user))
+
+    # One more pass under tracemalloc for memory (it slows everything down)
+    clear_shared_cache()
+    tracemalloc.start()
+    traced = await conversation("traced", users[0], traced=True)
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    meal_plan(users[0])
+    plan_peak_kb = (tracemalloc.get_traced_memory()[1] - base) / 1024
+    tracemalloc.stop()
+
+    scenarios = {}
+    for name, samples in turns.items():
+        scenarios[name] = summarize_turns(samples)
+        scenarios[name]["memory_peak_kb"] = traced[name]["memory_peak_kb"]
+
+    plan_mongo = [sum(p["mongo_ops"].values()) for p in plans]
+    by_collection: Dict[str, int] = {}
+    for p in plans:
+        for key, count in p["mongo_ops"].items():
+            by_collection[key] = max(by_collection.get(key, 0), count)
+
+    return {
+        "config": {"runs": args.runs, "users": args.users, "foods": args.foods,
+                   "first_token_delay": args.first_token_delay, "token_delay": args.token_delay},
+        "scenarios": scenarios,
+        "meal_plan": {
+            "latency_ms": {"p50": percentile([p["latency_ms"] for p in plans], 0.5),
+                           "p95": percentile([p["latency_ms"] for p in plans], 0.95)},
+            "filter_ms": {"p50": percentile([p["filter_ms"] for p in plans], 0.5)},
+            "attempts": max(p["attempts"] for p in plans),
+            "prompt_tokens": max(p["prompt_tokens"] for p in plans),
+            "foods": max(p["foods"] for p in plans),
+            "succeeded": sum(p["succeeded"] for p in plans),
+            "plans": len(plans),
+            "mongo_ops": {"total": max(plan_mongo), "by_collection": by_collection},
+            "memory_peak_kb": plan_peak_kb
+        },
+        # Linux reports KB
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline agent and meal planner benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--foods", type=int, default=300, help="Menu items for today")
+    parser.add_argument("--first-token-delay", type=float, default=0.0, help="Fake LLM latency before the first chunk (s)")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Fake LLM latency per chunk (s)")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Compare against a report written with --json; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 latency increase over the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show application logs")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}", flush=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.tolerance)
+        if problems:
+            print("\nRegressions against baseline:")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print("\nNo regressions against baseline", flush=True)
+
+
+if __name__ == "__main__":
+    main()
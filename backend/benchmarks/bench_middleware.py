@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-request overhead of the API middleware stack.
+
+Compares the previous BaseHTTPMiddleware stack (security headers, global and
+auth rate limiting, cache control and the log_requests HTTP middleware, all
+reproduced below) with the pure-ASGI stack from middleware.py. Requests are
+driven straight through the ASGI interface, so the numbers only contain
+routing + middleware cost (no sockets, no database).
+
+Usage:
+    python benchmarks/bench_middleware.py
+    python benchmarks/bench_middleware.py --requests 50000 --chunks 200
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from middleware import RateLimitMiddleware, RateLimitRule, RequestLogMiddleware, ResponseHeadersMiddleware
+
+logger = logging.getLogger("bench")
+logger.addHandler(logging.NullHandler())
+logger.propagate = False
+
+SECURITY_HEADERS = [
+    ("Content-Security-Policy", "default-src 'self'; object-src 'none'; frame-ancestors 'none';"),
+    ("X-Frame-Options", "DENY"),
+    ("X-Content-Type-Options", "nosniff"),
+    ("X-XSS-Protection", "1; mode=block"),
+    ("Referrer-Policy", "strict-origin-when-cross-origin"),
+    ("Permissions-Policy", "geolocation=(), microphone=(), camera=()")
+]
+AUTH_PATHS = ["/auth/login", "/auth/register"]
+HIGH_LIMIT = 10 ** 9  # Never trips - we measure bookkeeping cost, not rejections
+
+
+def build_endpoints(chunks: int):
+    async def plain(request):
+        return JSONResponse({"ok": True})
+
+    async def stream(request):
+        async def events():
+            for i in range(chunks):
+                yield f"data: {i}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return [Route("/api/plate", plain), Route("/api/ai/chat", stream)]
+
+
+# Previous BaseHTTPMiddleware stack (as it was in main.py)
+class LegacySecurityHeaders(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        for name, value in SECURITY_HEADERS:
+            response.headers[name] = value
+        return response
+
+
+class LegacyRateLimit(BaseHTTPMiddleware):
+    def __init__(self, app, requests_per_minute: int = HIGH_LIMIT):
+        super().__init__(app)
+        self.requests_per_minute = requests_per_minute
+        self.requests = defaultdict(list)
+
+    async def dispatch(self, request: Request, call_next):
+        client_ip = request.client.host if request.client else "unknown"
+        current_time = datetime.now()
+        self.requests[client_ip] = [
+            t for t in self.requests[client_ip] if current_time - t < timedelta(minutes=1)
+        ]
+        if len(self.requests[client_ip]) >= self.requests_per_minute:
+            return Response(status_code=429)
+        self.requests[client_ip].append(current_time)
+        return await call_next(request)
+
+
+class LegacyAuthRateLimit(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        if not any(request.url.path == endpoint for endpoint in AUTH_PATHS):
+            return await call_next(request)
+        return await call_next(request)
+
+
+async def log_requests(request: Request, call_next):
+    logger.info(f"Request: {request.method} {request.url.path}")
+    response = await call_next(request)
+    logger.info(f"Response: {response.status_code}")
+    return response
+
+
+class LegacyCacheControl(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        if request.url.path.startswith("/static/"):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+def build_legacy_app(chunks: int):
+    app = Starlette(routes=build_endpoints(chunks))
+    app.add_middleware(LegacySecurityHeaders)
+    app.add_middleware(LegacyRateLimit)
+    app.add_middleware(LegacyAuthRateLimit)
+    # What FastAPI's @app.middleware("http") registers; plain Starlette 1.x
+    # no longer has the decorator
+    app.add_middleware(BaseHTTPMiddleware, dispatch=log_requests)
+    app.add_middleware(LegacyCacheControl)
+    return app
+
+
+def build_asgi_app(chunks: int):
+    app = Starlette(routes=build_endpoints(chunks))
+    app.add_middleware(RateLimitMiddleware, rules=[
+        RateLimitRule("auth", limit=HIGH_LIMIT, period_seconds=300, paths=AUTH_PATHS, detail="auth"),
+        RateLimitRule("global", limit=HIGH_LIMIT, period_seconds=60, prefixes=["/"], detail="global")
+    ])
+    app.add_middleware(ResponseHeadersMiddleware, headers=SECURITY_HEADERS,
+                       prefix_headers={"/static/": [("Cache-Control", "public, max-age=31536000, immutable")]})
+    app.add_middleware(RequestLogMiddleware, log=logger)
+    return app
+
+
+def build_bare_app(chunks: int):
+    return Starlette(routes=build_endpoints(chunks))
+
+
+async def call(app, path: str) -> int:
+    """Run one request through the ASGI app; return the number of body messages."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80)
+    }
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(3600)  # Client stays connected
+
+    bodies = 0
+
+    async def send(message):
+        nonlocal bodies
+        if message["type"] == "http.response.body":
+            bodies += 1
+
+    await app(scope, receive, send)
+    return bodies
+
+
+async def measure(app, path: str, requests: int):
+    for _ in range(min(500, requests)):  # Warm up
+        await call(app, path)
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await call(app, path)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        "mean": statistics.fmean(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[int(len(samples) * 0.99)]
+    }
+
+
+async def run(requests: int, chunks: int):
+    stacks = {
+        "no middleware": build_bare_app(chunks),
+        "BaseHTTPMiddleware (before)": build_legacy_app(chunks),
+        "pure ASGI (after)": build_asgi_app(chunks)
+    }
+    for path, label in (("/api/plate", "JSON"), ("/api/ai/chat", f"SSE x{chunks}")):
+        print(f"\n{label} {path} - {requests} requests (microseconds per request)")
+        baseline = None
+        for name, app in stacks.items():
+            result = await measure(app, path, requests)
+            baseline = baseline if baseline is not None else result["mean"]
+            overhead = result["mean"] - baseline
+            print(f"  {name:<30} mean {result['mean']:8.1f}  p50 {result['p50']:8.1f}  "
+                  f"p99 {result['p99']:8.1f}  middleware overhead {overhead:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Middleware overhead benchmark")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--chunks", type=int, default=50, help="Body chunks per streaming response")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.chunks))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark worker startup and import costs.
+
+Every measurement runs in a fresh interpreter, so module caches don't hide
+anything:
+
+- import time of the heavy dependencies and of the backend modules that
+  pull them in
+- worker startup: `import main`, as uvicorn does, plus the list of heavy
+  modules it left loaded (the AI stack and PDF library should be absent)
+- first use: building NutritionAgent and MealPlannerAI, the cost now paid
+  by the first AI request (or by the AI_PREWARM background thread)
+
+The worker startup step connects to MongoDB (main creates indexes on
+import), so it needs --mongodb-uri or MONGODB_URI and is skipped without
+one. The first-use step uses mongomock when it is installed and an
+unreachable client otherwise (index creation then fails fast and is
+logged).
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeats 10 --mongodb-uri mongodb://localhost:27017
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["langgraph", "langchain_core", "langchain_openai", "openai", "anthropic", "fpdf"]
+IMPORTS = HEAVY_MODULES + [
+    "fastapi", "pymongo",
+    "ai_agent.api", "ai_agent.agent", "meal_planning.ai_integration", "data_export"
+]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+try:
+    import {module}
+except ImportError as e:
+    print(json.dumps({{"error": str(e)}}))
+else:
+    print(json.dumps({{"ms": (time.perf_counter() - start) * 1000}}))
+"""
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = (time.perf_counter() - start) * 1000
+heavy = {heavy!r}
+print(json.dumps({{"ms": elapsed, "loaded": [m for m in heavy if m in sys.modules]}}))
+"""
+
+FIRST_USE_SCRIPT = """
+import json, logging, time
+logging.disable(logging.CRITICAL)
+try:
+    import mongomock
+    client = mongomock.MongoClient()
+except ImportError:
+    from pymongo import MongoClient
+    client = MongoClient("mongodb://127.0.0.1:9", serverSelectionTimeoutMS=50, connect=False)
+result = {{}}
+start = time.perf_counter()
+try:
+    {build}
+    result["ms"] = (time.perf_counter() - start) * 1000
+except Exception as e:
+    result["error"] = f"{{type(e).__name__}}: {{e}}"
+print(json.dumps(result))
+"""
+
+FIRST_USE = {
+    "NutritionAgent": "from ai_agent.agent import NutritionAgent; NutritionAgent(client, 'sk-bench')",
+    "MealPlannerAI": "from meal_planning.ai_integration import MealPlannerAI; MealPlannerAI('bench')"
+}
+
+
+def run_script(script: str, env=None) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, timeout=300
+    )
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        error = (result.stderr.strip().splitlines() or ["no output"])[-1]
+        return {"error": error}
+    return json.loads(lines[-1])
+
+
+def measure(script: str, repeats: int, env=None) -> dict:
+    samples, last = [], {}
+    for _ in range(repeats):
+        last = run_script(script, env)
+        if "error" in last:
+            return last
+        samples.append(last["ms"])
+    return {**last, "median_ms": statistics.median(samples), "min_ms": min(samples)}
+
+
+def print_row(name: str, result: dict, extra: str = ""):
+    if "error" in result:
+        print(f"  {name:<32} unavailable ({result['error']})", flush=True)
+    else:
+        print(f"  {name:<32} median {result['median_ms']:8.1f}  min {result['min_ms']:8.1f}  {extra}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker startup and import cost benchmark")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--mongodb-uri", default=os.getenv("MONGODB_URI"),
+                        help="MongoDB for the worker startup step (default: $MONGODB_URI)")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+    report = {"imports": {}, "startup": None, "first_use": {}}
+
+    print("\nImport time in a fresh interpreter (ms, interpreter start excluded)", flush=True)
+    for module in IMPORTS:
+        result = measure(IMPORT_SCRIPT.format(module=module), args.repeats)
+        report["imports"][module] = result
+        print_row(module, result)
+
+    print("\nWorker startup: import main (ms)", flush=True)
+    if args.mongodb_uri:
+        env = dict(os.environ, MONGODB_URI=args.mongodb_uri, OPENAI_API_KEY="sk-bench",
+                   ANTHROPIC_API_KEY="bench", AI_PREWARM="false")
+        result = measure(STARTUP_SCRIPT.format(heavy=HEAVY_MODULES), args.repeats, env)
+        report["startup"] = result
+        loaded = ", ".join(result.get("loaded", [])) or "none"
+        print_row("import main", result, f"heavy modules loaded: {loaded}")
+    else:
+        print("  skipped (no --mongodb-uri / MONGODB_URI)", flush=True)
+
+    print("\nFirst use: import + construct (ms)", flush=True)
+    for name, build in FIRST_USE.items():
+        result = measure(FIRST_USE_SCRIPT.format(build=build), args.repeats)
+        report["first_use"][name] = result
+        print_row(name, result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
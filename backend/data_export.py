@@ -0,0 +1,600 @@
+"""
+Streaming export of a user's data (profile, weight history, meal logs).
+
+Rows are produced by cursor-based stages instead of loading every plate and
+weight entry up front:
+
+- iter_weight_logs: weight_log cursor sorted by date
+- iter_meal_logs: plates cursor sorted by date; foods are joined one batch of
+  plates at a time with a single get_foods_by_ids lookup per batch
+
+Writers turn those rows into CSV, NDJSON or JSON text chunks that are sent
+with StreamingResponse (optionally gzip-compressed), so memory stays flat
+regardless of history length.
+
+PDF exports and histories larger than EXPORT_BACKGROUND_THRESHOLD plates run
+as background jobs instead: the artifact is written to EXPORT_DIR, tracked in
+the export_jobs collection and downloaded once ready. A sweep thread started
+with the app deletes artifacts after EXPORT_RETENTION_HOURS (including files
+whose job record is gone) and fails jobs a recycled worker left unfinished;
+job records themselves are kept EXPORT_RECORD_GRACE_HOURS longer, so the
+"expired" status stays visible.
+"""
+import csv
+import importlib.util
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from food_catalog import get_foods_by_ids
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_BACKGROUND_THRESHOLD = int(os.getenv("EXPORT_BACKGROUND_THRESHOLD", "2000"))  # plates
+EXPORT_RETENTION_HOURS = int(os.getenv("EXPORT_RETENTION_HOURS", "24"))
+EXPORT_RECORD_GRACE_HOURS = int(os.getenv("EXPORT_RECORD_GRACE_HOURS", "24"))
+EXPORT_JOB_WORKERS = int(os.getenv("EXPORT_JOB_WORKERS", "2"))
+# Jobs still queued/running after this long were lost with their worker
+EXPORT_JOB_TIMEOUT_MINUTES = int(os.getenv("EXPORT_JOB_TIMEOUT_MINUTES", "30"))
+EXPORT_SWEEP_INTERVAL_SECONDS = int(os.getenv("EXPORT_SWEEP_INTERVAL_SECONDS", "900"))
+EXPORT_JOBS_COLLECTION = "export_jobs"
+
+# Plates per food lookup in the join stage
+JOIN_BATCH_SIZE = 200
+# Rows buffered before a text chunk is emitted
+CHUNK_ROWS = 500
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "json": ("application/json", "json"),
+    "pdf": ("application/pdf", "pdf"),
+}
+
+MEAL_COLUMNS = ["Date", "Food Name", "Quantity", "Calories", "Protein", "Carbs", "Fat", "Type"]
+
+_job_pool: Optional[ThreadPoolExecutor] = None
+_sweep_stop: Optional[threading.Event] = None
+
+
+# ---------------------------------------------------------------------------
+# Row stages
+# ---------------------------------------------------------------------------
+
+def iter_weight_logs(db, user_id: str) -> Iterator[Dict[str, Any]]:
+    """Stream the user's weight entries in date order (uses weight_user_date_idx)."""
+    return db["weight_log"].find({"user_id": user_id}, {"_id": 0, "user_id": 0}).sort("date", 1)
+
+
+def export_item(item: Dict[str, Any], food: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Flatten a plate item into the exported row shape (name, quantity, macros, type)."""
+    if "custom_macros" in item:
+        n = item["custom_macros"]
+        return {
+            "name": n.get("name", "Custom Food"),
+            "quantity": item.get("quantity", 1),
+            "calories": n.get("calories", ""),
+            "protein": n.get("protein", ""),
+            "carbs": n.get("carbs", ""),
+            "fat": n.get("totalFat", n.get("total_fat", "")),
+            "type": "Custom"
+        }
+    if food:
+        n = food.get("nutrients", {})
+        return {
+            "name": food.get("name", ""),
+            "quantity": item.get("quantity", 1),
+            "calories": n.get("calories", ""),
+            "protein": n.get("protein", ""),
+            "carbs": n.get("total_carbohydrates", ""),
+            "fat": n.get("total_fat", ""),
+            "type": "Standard"
+        }
+    return {
+        "name": "",
+        "quantity": item.get("quantity", 1),
+        "calories": "",
+        "protein": "",
+        "carbs": "",
+        "fat": "",
+        "type": "Standard"
+    }
+
+
+def _join_batch(db, plates: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    food_ids = {
+        item["food_id"]
+        for plate in plates
+        for item in plate.get("items", [])
+        if "custom_macros" not in item and item.get("food_id")
+    }
+    foods_map = get_foods_by_ids(db, food_ids, {"name": 1, "nutrients": 1}) if food_ids else {}
+    for plate in plates:
+        yield {
+            "date": plate.get("date", ""),
+            "items": [
+                export_item(item, foods_map.get(str(item.get("food_id", ""))))
+                for item in plate.get("items", [])
+            ]
+        }
+
+
+def iter_meal_logs(db, user_id: str, batch_size: int = JOIN_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the user's plates in date order with their foods joined.
+
+    Args:
+        db: Database handle
+        user_id: User id as stored on plates
+        batch_size: Plates per food lookup
+
+    Yields:
+        {"date": str, "items": [exported item rows]}
+    """
+    cursor = db["plates"].find({"user_id": user_id}, {"_id": 0, "date": 1, "items": 1}).sort("date", 1)
+    batch: List[Dict[str, Any]] = []
+    for plate in cursor:
+        batch.append(plate)
+        if len(batch) >= batch_size:
+            yield from _join_batch(db, batch)
+            batch = []
+    if batch:
+        yield from _join_batch(db, batch)
+
+
+def count_meal_logs(db, user_id: str) -> int:
+    return db["plates"].count_documents({"user_id": user_id})
+
+
+# ---------------------------------------------------------------------------
+# Writers
+# ---------------------------------------------------------------------------
+
+class _CsvChunker:
+    """csv.writer over a small buffer that is drained every CHUNK_ROWS rows."""
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.rows = 0
+
+    def writerow(self, row) -> Optional[str]:
+        self.writer.writerow(row)
+        self.rows += 1
+        if self.rows % CHUNK_ROWS == 0:
+            return self.drain()
+        return None
+
+    def drain(self) -> str:
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate(0)
+        return text
+
+
+def stream_csv(db, user: Dict[str, Any], selections: Dict[str, bool]) -> Iterator[str]:
+    """Sectioned CSV export (profile, weight history, meal logs) as text chunks."""
+    user_id = str(user["_id"])
+    out = _CsvChunker()
+
+    def rows():
+        if selections.get("profile"):
+            yield ["Profile Info"]
+            yield ["Field", "Value"]
+            for k, v in user.get("profile", {}).items():
+                yield [k, f"'{v}" if v is not None else ""]
+            yield []
+        if selections.get("weight"):
+            yield ["Weight History"]
+            yield ["Date", "Weight"]
+            for log in iter_weight_logs(db, user_id):
+                weight = log.get("weight", "")
+                yield [log.get("date", ""), f"'{weight}" if weight != "" else ""]
+            yield []
+        if selections.get("meals"):
+            yield ["Meal Logs"]
+            yield MEAL_COLUMNS
+            for plate in iter_meal_logs(db, user_id):
+                for item in plate["items"]:
+                    yield [plate["date"], item["name"], item["quantity"], item["calories"],
+                           item["protein"], item["carbs"], item["fat"], item["type"]]
+            yield []
+
+    for row in rows():
+        chunk = out.writerow(row)
+        if chunk:
+            yield chunk
+    tail = out.drain()
+    if tail:
+        yield tail
+
+
+def stream_ndjson(db, user: Dict[str, Any], selections: Dict[str, bool]) -> Iterator[str]:
+    """One JSON object per line, tagged with its section."""
+    user_id = str(user["_id"])
+    lines: List[str] = []
+    if selections.get("profile"):
+        lines.append(json.dumps({"section": "profile", **user.get("profile", {})}, default=str))
+    if selections.get("weight"):
+        for log in iter_weight_logs(db, user_id):
+            lines.append(json.dumps({"section": "weight", **log}, default=str))
+            if len(lines) >= CHUNK_ROWS:
+                yield "\n".join(lines) + "\n"
+                lines = []
+    if selections.get("meals"):
+        for plate in iter_meal_logs(db, user_id):
+            for item in plate["items"]:
+                lines.append(json.dumps({"section": "meal", "date": plate["date"], **item}, default=str))
+            if len(lines) >= CHUNK_ROWS:
+                yield "\n".join(lines) + "\n"
+                lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _stream_json_array(items: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    yield "["
+    parts: List[str] = []
+    first = True
+    for item in items:
+        parts.append(("" if first else ",") + json.dumps(item, default=str))
+        first = False
+        if len(parts) >= CHUNK_ROWS:
+            yield "".join(parts)
+            parts = []
+    parts.append("]")
+    yield "".join(parts)
+
+
+def stream_json(db, user: Dict[str, Any], selections: Dict[str, bool]) -> Iterator[str]:
+    """The {"profile", "weight_history", "meal_logs"} JSON document, written incrementally."""
+    user_id = str(user["_id"])
+    sections = []
+    if selections.get("profile"):
+        sections.append(("profile", None))
+    if selections.get("weight"):
+        sections.append(("weight_history", iter_weight_logs(db, user_id)))
+    if selections.get("meals"):
+        sections.append(("meal_logs", iter_meal_logs(db, user_id)))
+
+    yield "{"
+    for index, (name, rows) in enumerate(sections):
+        yield ("," if index else "") + json.dumps(name) + ":"
+        if rows is None:
+            yield json.dumps(user.get("profile", {}), default=str)
+        else:
+            yield from _stream_json_array(rows)
+    yield "}"
+
+
+STREAM_WRITERS = {
+    "csv": stream_csv,
+    "ndjson": stream_ndjson,
+    "json": stream_json,
+}
+
+
+def encode_chunks(chunks: Iterable[str], compress: bool = False) -> Iterator[bytes]:
+    """UTF-8 encode text chunks, optionally as a gzip stream."""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode("utf-8")
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_filename(format: str, compress: bool = False) -> str:
+    return f"export.{FORMATS[format][1]}" + (".gz" if compress else "")
+
+
+def export_media_type(format: str, compress: bool = False) -> str:
+    return "application/gzip" if compress else FORMATS[format][0]
+
+
+# ---------------------------------------------------------------------------
+# PDF
+# ---------------------------------------------------------------------------
+
+def pdf_available() -> bool:
+    # Checked without importing fpdf; it is only imported by the export job that writes the PDF
+    return importlib.util.find_spec("fpdf") is not None
+
+
+def _pdf_text(value) -> str:
+    # Core PDF fonts are latin-1 only, replace anything else
+    return str(value).encode('latin-1', 'replace').decode('latin-1')
+
+
+def write_pdf(db, user: Dict[str, Any], selections: Dict[str, bool], path: str):
+    """Render the export as a PDF file at `path`, streaming rows from the cursors."""
+    from fpdf import FPDF
+
+    user_id = str(user["_id"])
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    # Profile Info
+    if selections.get("profile"):
+        pdf.set_font("Arial", style="B", size=14)
+        pdf.cell(0, 10, "Profile Info", ln=1)
+        pdf.set_font("Arial", size=12)
+        for k, v in user.get("profile", {}).items():
+            pdf.cell(50, 8, _pdf_text(k), border=1)
+            pdf.cell(0, 8, _pdf_text(v), border=1, ln=1)
+        pdf.ln(5)
+
+    # Weight History
+    if selections.get("weight"):
+        pdf.set_font("Arial", style="B", size=14)
+        pdf.cell(0, 10, "Weight History", ln=1)
+        pdf.set_font("Arial", style="B", size=12)
+        pdf.cell(40, 8, "Date", border=1)
+        pdf.cell(40, 8, "Weight", border=1, ln=1)
+        pdf.set_font("Arial", size=12)
+        for log in iter_weight_logs(db, user_id):
+            pdf.cell(40, 8, str(log.get("date", "")), border=1)
+            pdf.cell(40, 8, str(log.get("weight", "")), border=1, ln=1)
+        pdf.ln(5)
+
+    # Meal Logs
+    if selections.get("meals"):
+        pdf.set_font("Arial", style="B", size=14)
+        pdf.cell(0, 10, "Meal Logs", ln=1)
+        pdf.set_font("Arial", style="B", size=12)
+        widths = [30, 40, 20, 20, 20, 20, 20, 20]
+        headers = ["Date", "Food Name", "Qty", "Cal", "Protein", "Carbs", "Fat", "Type"]
+        for i, (width, header) in enumerate(zip(widths, headers)):
+            pdf.cell(width, 8, header, border=1, ln=1 if i == len(headers) - 1 else 0)
+        pdf.set_font("Arial", size=12)
+        for plate in iter_meal_logs(db, user_id):
+            for item in plate["items"]:
+                values = [plate["date"], item["name"], item["quantity"], item["calories"],
+                          item["protein"], item["carbs"], item["fat"], item["type"]]
+                for i, (width, value) in enumerate(zip(widths, values)):
+                    pdf.cell(width, 8, _pdf_text(value), border=1, ln=1 if i == len(values) - 1 else 0)
+        pdf.ln(5)
+
+    pdf.output(path)
+
+
+# ---------------------------------------------------------------------------
+# Background jobs
+# ---------------------------------------------------------------------------
+
+def _get_job_pool() -> ThreadPoolExecutor:
+    global _job_pool
+    if _job_pool is None:
+        _job_pool = ThreadPoolExecutor(max_workers=EXPORT_JOB_WORKERS, thread_name_prefix="export")
+    return _job_pool
+
+
+def shutdown_export_pool():
+    global _job_pool, _sweep_stop
+    if _job_pool is not None:
+        _job_pool.shutdown(wait=False)
+        _job_pool = None
+    if _sweep_stop is not None:
+        _sweep_stop.set()
+        _sweep_stop = None
+
+
+def ensure_export_indexes(db):
+    jobs = db[EXPORT_JOBS_COLLECTION]
+    jobs.create_index([("user_id", 1), ("created_at", -1)], background=True)
+    # Job records disappear EXPORT_RECORD_GRACE_HOURS after their files are removed by the sweep
+    jobs.create_index("expires_at", expireAfterSeconds=0, background=True)
+
+
+def needs_background_job(db, user_id: str, format: str, selections: Dict[str, bool]) -> bool:
+    """PDFs always run in the background, other formats only for very long histories."""
+    if format == "pdf":
+        return True
+    return bool(selections.get("meals")) and count_meal_logs(db, user_id) > EXPORT_BACKGROUND_THRESHOLD
+
+
+def _write_artifact(db, user: Dict[str, Any], format: str, selections: Dict[str, bool],
+                    compress: bool, path: str):
+    if format == "pdf":
+        write_pdf(db, user, selections, path)
+        return
+    with open(path, "wb") as f:
+        for data in encode_chunks(STREAM_WRITERS[format](db, user, selections), compress):
+            f.write(data)
+
+
+def _run_job(db, job_id: str, user: Dict[str, Any], format: str, selections: Dict[str, bool], compress: bool):
+    jobs = db[EXPORT_JOBS_COLLECTION]
+    path = os.path.join(EXPORT_DIR, f"{job_id}_{export_filename(format, compress)}")
+    jobs.update_one({"_id": job_id}, {"$set": {"status": "running", "started_at": datetime.utcnow()}})
+    try:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        _write_artifact(db, user, format, selections, compress, path)
+        result = jobs.update_one({"_id": job_id}, {"$set": {
+            "status": "done",
+            "path": path,
+            "size_bytes": os.path.getsize(path),
+            "finished_at": datetime.utcnow()
+        }})
+        if not result.matched_count:
+            # The job was deleted while running (account deleted), nobody owns the file
+            os.remove(path)
+            return
+        logger.info(f"Export job {job_id} finished ({format}, {os.path.getsize(path)} bytes)")
+    except Exception as e:
+        logger.error(f"Export job {job_id} failed: {e}")
+        if os.path.exists(path):
+            os.remove(path)
+        jobs.update_one({"_id": job_id}, {"$set": {
+            "status": "failed",
+            "error": "Export failed. Please try again.",
+            "finished_at": datetime.utcnow()
+        }})
+
+
+def start_export_job(db, user: Dict[str, Any], format: str, selections: Dict[str, bool],
+                     compress: bool = False) -> Dict[str, Any]:
+    """
+    Queue a background export and return its job document.
+
+    Args:
+        db: Database handle
+        user: Current user document
+        format: One of FORMATS
+        selections: Sections to include (profile, weight, meals)
+        compress: Gzip the artifact (ignored for PDF)
+
+    Returns:
+        The job document as stored in export_jobs
+    """
+    cleanup_expired_exports(db)
+    compress = compress and format != "pdf"
+    now = datetime.utcnow()
+    job = {
+        "_id": uuid.uuid4().hex,
+        "user_id": str(user["_id"]),
+        "format": format,
+        "compress": compress,
+        "selections": selections,
+        "status": "queued",
+        "filename": export_filename(format, compress),
+        "media_type": export_media_type(format, compress),
+        "created_at": now,
+        "expires_at": now + timedelta(hours=EXPORT_RETENTION_HOURS + EXPORT_RECORD_GRACE_HOURS)
+    }
+    db[EXPORT_JOBS_COLLECTION].insert_one(job)
+    _get_job_pool().submit(_run_job, db, job["_id"], user, format, selections, compress)
+    return job
+
+
+def get_export_job(db, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    return db[EXPORT_JOBS_COLLECTION].find_one({"_id": job_id, "user_id": user_id})
+
+
+def serialize_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "format": job["format"],
+        "filename": job["filename"],
+        "created_at": job["created_at"].isoformat(),
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None,
+        "size_bytes": job.get("size_bytes"),
+        "error": job.get("error")
+    }
+
+
+def cleanup_expired_exports(db):
+    """Delete artifacts of jobs past the retention period."""
+    cutoff = datetime.utcnow() - timedelta(hours=EXPORT_RETENTION_HOURS)
+    jobs = db[EXPORT_JOBS_COLLECTION]
+    for job in jobs.find({"created_at": {"$lt": cutoff}, "path": {"$exists": True}}, {"path": 1}):
+        try:
+            if os.path.exists(job["path"]):
+                os.remove(job["path"])
+        except OSError as e:
+            logger.warning(f"Could not remove export file {job['path']}: {e}")
+        jobs.update_one({"_id": job["_id"]}, {"$unset": {"path": ""}, "$set": {"status": "expired"}})
+
+
+def delete_user_exports(db, user_id: str) -> int:
+    """
+    Delete a user's export jobs and their artifacts (account deletion).
+
+    Returns:
+        Number of job records deleted
+    """
+    jobs = db[EXPORT_JOBS_COLLECTION]
+    for job in jobs.find({"user_id": user_id, "path": {"$exists": True}}, {"path": 1}):
+        try:
+            if os.path.exists(job["path"]):
+                os.remove(job["path"])
+        except OSError as e:
+            logger.warning(f"Could not remove export file {job['path']}: {e}")
+    return jobs.delete_many({"user_id": user_id}).deleted_count
+
+
+def fail_stale_jobs(db) -> int:
+    """
+    Mark jobs queued or running for longer than EXPORT_JOB_TIMEOUT_MINUTES as failed.
+
+    Jobs run on in-process threads, so a job whose worker was recycled or
+    crashed would otherwise stay queued/running forever.
+
+    Returns:
+        Number of jobs marked failed
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=EXPORT_JOB_TIMEOUT_MINUTES)
+    result = db[EXPORT_JOBS_COLLECTION].update_many(
+        {"status": {"$in": ["queued", "running"]}, "created_at": {"$lt": cutoff}},
+        {"$set": {
+            "status": "failed",
+            "error": "Export was interrupted. Please try again.",
+            "finished_at": datetime.utcnow()
+        }}
+    )
+    if result.modified_count:
+        logger.warning(f"Marked {result.modified_count} interrupted export jobs as failed")
+    return result.modified_count
+
+
+def sweep_export_files() -> int:
+    """
+    Delete artifacts in EXPORT_DIR older than the retention period, whether or not a job record still points to them.
+
+    Returns:
+        Number of files removed
+    """
+    if not os.path.isdir(EXPORT_DIR):
+        return 0
+    cutoff = time.time() - EXPORT_RETENTION_HOURS * 3600
+    removed = 0
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError as e:
+            logger.warning(f"Could not remove export file {entry.path}: {e}")
+    return removed
+
+
+def sweep_exports(db):
+    """One maintenance pass: expire old jobs and their files, fail interrupted jobs."""
+    try:
+        cleanup_expired_exports(db)
+        sweep_export_files()
+        fail_stale_jobs(db)
+    except Exception as e:
+        logger.error(f"Export sweep failed: {e}")
+
+
+def start_export_sweeper(db, interval_seconds: int = EXPORT_SWEEP_INTERVAL_SECONDS) -> threading.Thread:
+    """Run sweep_exports now and then every interval_seconds in a daemon thread (stopped by shutdown_export_pool)."""
+    global _sweep_stop
+    stop = threading.Event()
+    _sweep_stop = stop
+
+    def loop():
+        while True:
+            sweep_exports(db)
+            if stop.wait(interval_seconds):
+                return
+
+    thread = threading.Thread(target=loop, name="export-sweeper", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,320 @@
+"""
+Canonical food catalog with per-date menu occurrences.
+
+Instead of storing a full copy of every food (name, ingredients, nutrients)
+for every date, unique foods live once in the food_catalog collection,
+deduplicated by a normalized fingerprint, and each day's menu is a list of
+slim menu_items documents: (date, dining_hall, meal_name, station, catalog_id).
+
+Everything that reads foods goes through this module so that the API, the
+meal planner and the AI agent work against either layout:
+- find_menu_foods() returns food documents shaped like the legacy foods
+  collection (with _id set to the catalog ID)
+- get_foods_by_ids() resolves IDs stored in plates against the catalog and
+  the legacy foods collection, so plates saved before the migration keep working
+
+Set USE_FOOD_CATALOG=true once migrate_food_catalog.py has backfilled the
+catalog to switch reads and scraper writes over to the new collections.
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from allergens import derive_allergens
+
+logger = logging.getLogger(__name__)
+
+USE_FOOD_CATALOG = os.getenv("USE_FOOD_CATALOG", "false").lower() == "true"
+
+CATALOG_COLLECTION = "food_catalog"
+MENU_ITEMS_COLLECTION = "menu_items"
+# Unique (campus, date, hall, meal, station, catalog_id) key of menu occurrences
+MENU_OCCURRENCE_INDEX = "campus_menu_occurrence_idx"
+LEGACY_FOODS_COLLECTION = "foods"
+
+# Fields stored once per unique food
+CATALOG_FIELDS = ("name", "description", "labels", "ingredients", "nutrients", "portion_size", "allergens")
+
+# Fields stored per date / dining hall / meal occurrence
+MENU_FIELDS = ("campus", "date", "dining_hall", "dining_hall_id", "meal_name", "station", "station_id")
+
+# Catalog bookkeeping fields that are not part of the food shape
+_CATALOG_INTERNAL_FIELDS = ("fingerprint", "created_at")
+
+
+def _normalize_text(value: Any) -> str:
+    """Lowercase and collapse whitespace for fingerprinting."""
+    return " ".join(str(value or "").lower().split())
+
+
+def food_fingerprint(food: Dict[str, Any]) -> str:
+    """
+    Compute a normalized fingerprint identifying a unique food.
+
+    Two scraped items with the same name, description, portion, labels,
+    ingredients and nutrients (ignoring case, whitespace and list order) map
+    to the same catalog entry.
+    """
+    nutrients = food.get("nutrients") or {}
+    payload = {
+        "name": _normalize_text(food.get("name")),
+        "description": _normalize_text(food.get("description")),
+        "portion_size": _normalize_text(food.get("portion_size")),
+        "labels": sorted(_normalize_text(label) for label in food.get("labels") or []),
+        "ingredients": sorted(_normalize_text(i) for i in food.get("ingredients") or []),
+        "nutrients": {str(k).lower(): _normalize_text(v) for k, v in nutrients.items()}
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def menu_collection(db):
+    """Collection holding per-date menu rows (date, dining_hall, meal_name, ...)."""
+    return db[MENU_ITEMS_COLLECTION] if USE_FOOD_CATALOG else db[LEGACY_FOODS_COLLECTION]
+
+
+def ensure_catalog_indexes(db) -> None:
+    """Create the indexes the catalog layout relies on."""
+    db[CATALOG_COLLECTION].create_index("fingerprint", unique=True, background=True, name="fingerprint_idx")
+    db[CATALOG_COLLECTION].create_index("labels", background=True)
+    db[CATALOG_COLLECTION].create_index("allergens", background=True)
+    db[CATALOG_COLLECTION].create_index([
+        ("name", "text"),
+        ("description", "text")
+    ], background=True, name="food_search_idx")
+
+    menu_items = db[MENU_ITEMS_COLLECTION]
+    menu_items.create_index([
+        ("date", 1),
+        ("dining_hall", 1),
+        ("meal_name", 1)
+    ], background=True, name="date_hall_meal_idx")
+    menu_items.create_index([
+        ("campus", 1),
+        ("date", 1),
+        ("dining_hall", 1),
+        ("meal_name", 1)
+    ], background=True, name="campus_date_hall_meal_idx")
+    menu_items.create_index([
+        ("campus", 1),
+        ("date", 1),
+        ("dining_hall", 1),
+        ("meal_name", 1),
+        ("station", 1),
+        ("catalog_id", 1)
+    ], unique=True, background=True, name=MENU_OCCURRENCE_INDEX)
+    menu_items.create_index("catalog_id", background=True)
+
+
+def upsert_catalog_entries(db, foods: List[Dict[str, Any]]) -> Dict[str, ObjectId]:
+    """
+    Make sure every food has a catalog entry.
+
+    Returns:
+        {fingerprint: catalog_id} for all given foods
+    """
+    catalog = db[CATALOG_COLLECTION]
+    now = datetime.utcnow()
+
+    operations = {}
+    for food in foods:
+        fingerprint = food_fingerprint(food)
+        if fingerprint in operations:
+            continue
+        entry = {field: food.get(field) for field in CATALOG_FIELDS if field in food}
+        if "allergens" not in entry:
+            entry["allergens"] = derive_allergens(food)
+        entry["created_at"] = now
+        operations[fingerprint] = UpdateOne(
+            {"fingerprint": fingerprint},
+            {"$setOnInsert": entry},
+            upsert=True
+        )
+
+    if not operations:
+        return {}
+
+    catalog.bulk_write(list(operations.values()), ordered=False)
+
+    return {
+        doc["fingerprint"]: doc["_id"]
+        for doc in catalog.find({"fingerprint": {"$in": list(operations)}}, {"fingerprint": 1})
+    }
+
+
+def record_foods(db, foods: Iterable[Dict[str, Any]], batch_size: int = 500) -> Dict[str, int]:
+    """
+    Store scraped food documents as catalog entries plus menu occurrences.
+
+    Occurrences are upserted on (campus, date, dining_hall, meal_name,
+    station, catalog_id), so recording the same menu twice does not
+    duplicate it, and two campuses with the same hall and meal names keep
+    separate menus.
+
+    Returns:
+        Counts of foods processed and menu occurrences inserted
+    """
+    stats = {"foods": 0, "menu_items": 0}
+    batch: List[Dict[str, Any]] = []
+
+    def flush():
+        if not batch:
+            return
+        catalog_ids = upsert_catalog_entries(db, batch)
+        operations = []
+        for food in batch:
+            catalog_id = catalog_ids[food_fingerprint(food)]
+            key = {
+                "campus": food.get("campus"),
+                "date": food.get("date"),
+                "dining_hall": food.get("dining_hall"),
+                "meal_name": food.get("meal_name"),
+                "station": food.get("station"),
+                "catalog_id": catalog_id
+            }
+            extra = {f: food[f] for f in ("dining_hall_id", "station_id") if food.get(f) is not None}
+            operations.append(UpdateOne(key, {"$setOnInsert": {**key, **extra}}, upsert=True))
+        result = db[MENU_ITEMS_COLLECTION].bulk_write(operations, ordered=False)
+        stats["foods"] += len(batch)
+        stats["menu_items"] += result.upserted_count
+        batch.clear()
+
+    for food in foods:
+        batch.append(food)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    return stats
+
+
+def _is_menu_clause(clause: Dict[str, Any]) -> bool:
+    return all(key in MENU_FIELDS for key in clause)
+
+
+def _split_query(query: Dict[str, Any]):
+    """Split a legacy foods query into menu_items filters and post-join filters."""
+    menu_query, food_query = {}, {}
+    for key, value in query.items():
+        if key in MENU_FIELDS:
+            menu_query[key] = value
+        elif key == "$or" and all(_is_menu_clause(clause) for clause in value):
+            menu_query[key] = value
+        else:
+            food_query[key] = value
+    return menu_query, food_query
+
+
+def menu_foods_pipeline(query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None,
+                        limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Aggregation joining menu_items to the catalog and returning legacy-shaped foods.
+
+    Filters on menu fields run first (using the menu_items indexes); filters
+    on food fields (name, labels, ...) run after the join.
+    """
+    menu_query, food_query = _split_query(query)
+
+    pipeline: List[Dict[str, Any]] = [{"$match": menu_query}]
+    pipeline.extend([
+        {"$lookup": {
+            "from": CATALOG_COLLECTION,
+            "localField": "catalog_id",
+            "foreignField": "_id",
+            "as": "food"
+        }},
+        {"$unwind": "$food"},
+        {"$replaceRoot": {"newRoot": {"$mergeObjects": [
+            "$food",
+            {"menu_item_id": "$_id", **{field: f"${field}" for field in MENU_FIELDS}}
+        ]}}},
+        {"$project": {field: 0 for field in _CATALOG_INTERNAL_FIELDS}}
+    ])
+    if food_query:
+        pipeline.append({"$match": food_query})
+    if limit:
+        pipeline.append({"$limit": limit})
+    if projection:
+        pipeline.append({"$project": projection})
+    return pipeline
+
+
+def find_menu_foods(db, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None,
+                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Find menu foods matching a legacy foods-collection query.
+
+    Returns:
+        Food documents with the legacy shape (_id, name, nutrients, date, dining_hall, ...)
+    """
+    if not USE_FOOD_CATALOG:
+        cursor = db[LEGACY_FOODS_COLLECTION].find(query, projection)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    return list(db[MENU_ITEMS_COLLECTION].aggregate(menu_foods_pipeline(query, projection, limit)))
+
+
+def split_food_ids(food_ids: Iterable[Any]):
+    """Separate ObjectId-compatible IDs from plain string IDs."""
+    object_ids, str_ids = [], []
+    for food_id in food_ids:
+        if isinstance(food_id, ObjectId):
+            object_ids.append(food_id)
+            continue
+        try:
+            object_ids.append(ObjectId(food_id))
+        except Exception:
+            str_ids.append(food_id)
+    return object_ids, str_ids
+
+
+def _fetch_by_ids(collection, food_ids: Iterable[Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    object_ids, str_ids = split_food_ids(food_ids)
+    found = {}
+    if object_ids:
+        for food in collection.find({"_id": {"$in": object_ids}}, projection):
+            found[str(food["_id"])] = food
+    if str_ids:
+        for food in collection.find({"_id": {"$in": str_ids}}, projection):
+            found[str(food["_id"])] = food
+    return found
+
+
+def get_foods_by_ids(db, food_ids: Iterable[Any], projection: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Resolve food IDs (as stored in plates) to food documents in bulk.
+
+    IDs are looked up in the active store first and only the misses are
+    looked up in the other one, so plates saved before or after the catalog
+    migration both resolve.
+
+    Returns:
+        {str(food_id): food_document}
+    """
+    ids = {str(food_id) for food_id in food_ids if food_id}
+    if not ids:
+        return {}
+
+    stores = [db[CATALOG_COLLECTION], db[LEGACY_FOODS_COLLECTION]]
+    if not USE_FOOD_CATALOG:
+        stores.reverse()
+
+    foods_map: Dict[str, Dict[str, Any]] = {}
+    for store in stores:
+        missing = ids - foods_map.keys()
+        if not missing:
+            break
+        foods_map.update(_fetch_by_ids(store, missing, projection))
+    return foods_map
+
+
+def get_food_by_id(db, food_id: Any, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Resolve a single food ID through the catalog and legacy foods collection."""
+    return get_foods_by_ids(db, [food_id], projection).get(str(food_id))
@@ -0,0 +1,251 @@
+"""
+Food search.
+
+Two ways to look foods up:
+
+- search_foods: full-text search through MongoDB's text index (food_search_idx
+  on name/description), ranked by text score and filterable by date, dining
+  hall, meal and label. Replaces the unanchored case-insensitive $regex
+  queries, which had to scan the whole collection.
+- typeahead: an in-memory prefix/trigram index of one day's menu, built on
+  first use and kept for a few minutes, for as-you-type suggestions without
+  a database round trip.
+"""
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+from allergens import exclude_allergens_query
+from food_catalog import (
+    CATALOG_COLLECTION, LEGACY_FOODS_COLLECTION, USE_FOOD_CATALOG, find_menu_foods
+)
+
+logger = logging.getLogger(__name__)
+
+# Catalog entries considered before menu filters (date/hall/meal) are applied
+TEXT_SEARCH_CANDIDATES = int(os.getenv("TEXT_SEARCH_CANDIDATES", "500"))
+TYPEAHEAD_TTL_SECONDS = int(os.getenv("TYPEAHEAD_TTL_SECONDS", "300"))
+TYPEAHEAD_MAX_DATES = int(os.getenv("TYPEAHEAD_MAX_DATES", "7"))
+
+TYPEAHEAD_FIELDS = {"_id": 1, "name": 1, "dining_hall": 1, "meal_name": 1, "station": 1, "labels": 1}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _menu_filters(date: Optional[str], dining_hall: Optional[str], meal_name: Optional[str]) -> Dict[str, Any]:
+    filters = {}
+    if date:
+        filters["date"] = date
+    if dining_hall:
+        filters["dining_hall"] = dining_hall
+    if meal_name:
+        filters["meal_name"] = meal_name
+    return filters
+
+
+def search_foods(db, text: str, date: Optional[str] = None, dining_hall: Optional[str] = None,
+                 meal_name: Optional[str] = None, label: Optional[str] = None,
+                 limit: int = 50, projection: Optional[Dict[str, Any]] = None,
+                 exclude_allergens: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Full-text food search ranked by relevance.
+
+    Args:
+        db: Database handle
+        text: Search terms (matched by word, with stemming)
+        date: Only foods served on this date (YYYY-MM-DD)
+        dining_hall: Only foods from this dining hall
+        meal_name: Only foods from this meal
+        label: Only foods carrying this label
+        limit: Maximum number of results
+        projection: Fields to return (score is always included)
+        exclude_allergens: Allergen IDs the foods must not be flagged with
+
+    Returns:
+        Food documents with a "score" field, best match first
+    """
+    score = {"$meta": "textScore"}
+    fields = {**projection, "score": score} if projection else {"score": score}
+    menu_filters = _menu_filters(date, dining_hall, meal_name)
+    text_query: Dict[str, Any] = {"$text": {"$search": text}}
+    if label:
+        text_query["labels"] = label
+    text_query.update(exclude_allergens_query(exclude_allergens or []))
+
+    if not USE_FOOD_CATALOG:
+        cursor = db[LEGACY_FOODS_COLLECTION].find({**text_query, **menu_filters}, fields)
+        return list(cursor.sort([("score", score)]).limit(limit))
+
+    # $text has to run on the collection that owns the text index, so rank
+    # catalog entries first and then keep the ones on the requested menu
+    candidates = list(
+        db[CATALOG_COLLECTION].find(text_query, fields if not menu_filters else {"score": score})
+        .sort([("score", score)])
+        .limit(limit if not menu_filters else TEXT_SEARCH_CANDIDATES)
+    )
+    if not menu_filters:
+        return candidates
+
+    scores = {doc["_id"]: doc["score"] for doc in candidates}
+    if not scores:
+        return []
+    foods = find_menu_foods(db, {**menu_filters, "_id": {"$in": list(scores)}}, projection)
+    for food in foods:
+        food["score"] = scores.get(food["_id"], 0.0)
+    foods.sort(key=lambda food: food["score"], reverse=True)
+    return foods[:limit]
+
+
+def _normalize(value: str) -> str:
+    return " ".join(_TOKEN_RE.findall(str(value or "").lower()))
+
+
+def _trigrams(value: str) -> Set[str]:
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class TypeaheadIndex:
+    """
+    Prefix and trigram index over the foods of one menu date.
+
+    Query words of one or two letters are looked up in a map of word
+    prefixes; longer words intersect the postings of their trigrams, which
+    also finds matches inside words ("wich" in "sandwich").
+    """
+
+    def __init__(self, foods: List[Dict[str, Any]]):
+        self.foods = []
+        self.names: List[str] = []
+        self.prefixes: Dict[str, List[int]] = defaultdict(list)
+        self.trigrams: Dict[str, Set[int]] = defaultdict(set)
+
+        for food in foods:
+            name = _normalize(food.get("name"))
+            if not name:
+                continue
+            index = len(self.foods)
+            self.foods.append({
+                "_id": str(food["_id"]),
+                "name": food.get("name", ""),
+                "dining_hall": food.get("dining_hall"),
+                "meal_name": food.get("meal_name"),
+                "station": food.get("station"),
+                "labels": food.get("labels", [])
+            })
+            self.names.append(name)
+            seen = set()
+            for token in name.split():
+                for length in range(1, min(len(token), 2) + 1):
+                    prefix = token[:length]
+                    if prefix not in seen:
+                        seen.add(prefix)
+                        self.prefixes[prefix].append(index)
+            for trigram in _trigrams(name):
+                self.trigrams[trigram].add(index)
+
+    def __len__(self):
+        return len(self.foods)
+
+    def _token_candidates(self, token: str) -> Set[int]:
+        if len(token) < 3:
+            return set(self.prefixes.get(token, ()))
+        # Names containing every trigram of the token (a superset of the names containing it)
+        postings = sorted((self.trigrams.get(t, set()) for t in _trigrams(token)), key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def _candidates(self, tokens: List[str]) -> Set[int]:
+        result = None
+        for token in sorted(tokens, key=len, reverse=True):
+            candidates = self._token_candidates(token)
+            result = candidates if result is None else result & candidates
+            if not result:
+                break
+        return result or set()
+
+    @staticmethod
+    def _score(name: str, query: str, tokens: List[str]) -> int:
+        if name.startswith(query):
+            return 3
+        words = name.split()
+        if all(any(word.startswith(token) for word in words) for token in tokens):
+            return 2
+        if all(token in name for token in tokens):
+            return 1
+        return 0
+
+    def search(self, query: str, dining_hall: Optional[str] = None, meal_name: Optional[str] = None,
+               label: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Foods whose name starts with, has a word starting with, or contains the query.
+
+        Returns:
+            Matches ranked by match quality, then shorter names first
+        """
+        query = _normalize(query)
+        if not query:
+            return []
+        tokens = query.split()
+        ranked = []
+        for index in self._candidates(tokens):
+            food = self.foods[index]
+            if dining_hall and food["dining_hall"] != dining_hall:
+                continue
+            if meal_name and food["meal_name"] != meal_name:
+                continue
+            if label and label not in food["labels"]:
+                continue
+            name = self.names[index]
+            score = self._score(name, query, tokens)
+            if score:
+                ranked.append((-score, len(name), name, index))
+        return [dict(self.foods[index], score=-neg_score)
+                for neg_score, _, _, index in heapq.nsmallest(limit, ranked)]
+
+
+_typeahead_indexes: "OrderedDict[str, tuple]" = OrderedDict()  # date -> (built_at, index)
+_typeahead_lock = threading.Lock()
+
+
+def get_typeahead_index(db, date: str) -> TypeaheadIndex:
+    """Typeahead index for a menu date, rebuilt after TYPEAHEAD_TTL_SECONDS."""
+    now = time.monotonic()
+    with _typeahead_lock:
+        cached = _typeahead_indexes.get(date)
+        if cached and now - cached[0] < TYPEAHEAD_TTL_SECONDS:
+            _typeahead_indexes.move_to_end(date)
+            return cached[1]
+
+        start = time.perf_counter()
+        index = TypeaheadIndex(find_menu_foods(db, {"date": date}, TYPEAHEAD_FIELDS))
+        logger.info(f"Built typeahead index for {date}: {len(index)} foods in "
+                    f"{(time.perf_counter() - start) * 1000:.1f} ms")
+        _typeahead_indexes[date] = (now, index)
+        _typeahead_indexes.move_to_end(date)
+        while len(_typeahead_indexes) > TYPEAHEAD_MAX_DATES:
+            _typeahead_indexes.popitem(last=False)
+        return index
+
+
+def invalidate_typeahead(date: Optional[str] = None):
+    """Drop the typeahead index of one date (or all dates) after foods change."""
+    with _typeahead_lock:
+        if date is None:
+            _typeahead_indexes.clear()
+        else:
+            _typeahead_indexes.pop(date, None)
+
+
+def typeahead(db, query: str, date: str, dining_hall: Optional[str] = None, meal_name: Optional[str] = None,
+              label: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    """As-you-type food suggestions for a menu date."""
+    return get_typeahead_index(db, date).search(query, dining_hall, meal_name, label, limit)
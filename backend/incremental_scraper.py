@@ -17,6 +17,8 @@ Usage:
     python incremental_scraper.py                    # Normal run
     python incremental_scraper.py --dry-run         # Show what would be scraped
     python incremental_scraper.py --force-rescrape  # Rescrape everything
+    python incremental_scraper.py --check-coverage  # Exit 0 if today's coverage is complete
+    python incremental_scraper.py --resume          # Continue an interrupted run from its checkpoint log
 """
 
 import os
@@ -24,11 +26,14 @@ import sys
 import datetime
 import logging
 import argparse
-from typing import Dict, List, Set, Tuple, Any
+from typing import Dict, List, Optional, Set, Tuple, Any
 from collections import defaultdict
 
 # Import the existing scraper components
 from menu_scraper import DiningHallScraper
+from scrape_coverage import campus_from_url, refresh_coverage, set_expected_halls, get_coverage, missing_halls
+from food_catalog import menu_collection
+from scrape_checkpoint import CheckpointLog
 
 # MongoDB imports
 from pymongo import MongoClient
@@ -51,11 +56,15 @@ class IncrementalScraper:
     Uses the exact same extraction logic as the main scraper.
     """
     
-    def __init__(self, target_url: str, mongodb_uri: str, headless: bool = True, dry_run: bool = False):
+    def __init__(self, target_url: str, mongodb_uri: str, headless: bool = True, dry_run: bool = False,
+                 resume: bool = False, campus: Optional[str] = None):
         self.target_url = target_url
+        self.campus = campus or campus_from_url(target_url)
         self.mongodb_uri = mongodb_uri
         self.headless = headless
         self.dry_run = dry_run
+        self.resume = resume
+        self.checkpoint: Optional[CheckpointLog] = None
         self.today = datetime.date.today().isoformat()
         
         # Setup logging
@@ -94,61 +103,40 @@ class IncrementalScraper:
         if self.mongodb_uri:
             self.client = MongoClient(self.mongodb_uri, server_api=ServerApi('1'), tlsCAFile=certifi.where())
             self.db = self.client["nutritionapp"]
-            self.foods_collection = self.db["foods"]
+            self.foods_collection = menu_collection(self.db)
     
     def get_existing_data_for_today(self) -> Dict[str, Set[str]]:
         """
         Get existing meal combinations from MongoDB for today.
+
+        Coverage is computed with one index-covered aggregation and persisted
+        to the scrape_coverage collection for the cron wrapper and the API.
         Returns: {dining_hall: {meal1, meal2, ...}}
         """
         existing_combinations = defaultdict(set)
         
-        if self.foods_collection is None:
+        if self.db is None:
             return existing_combinations
         
         try:
-            # Query for today's data
-            cursor = self.foods_collection.find({"date": self.today})
+            coverage = refresh_coverage(self.db, self.today, self.campus)
             
-            for doc in cursor:
-                dining_hall = doc.get("dining_hall")
-                meal_name = doc.get("meal_name")
-                
-                if dining_hall and meal_name:
-                    existing_combinations[dining_hall].add(meal_name)
+            item_counts = defaultdict(int)
+            for combination in coverage.get("combinations", []):
+                existing_combinations[combination["dining_hall"]].add(combination["meal_name"])
+                item_counts[combination["dining_hall"]] += combination["count"]
             
             # Log what we found
-            total_halls = len(existing_combinations)
-            total_items = sum(len(meals) for meals in existing_combinations.values())
+            for hall, meals in existing_combinations.items():
+                self.logger.info(f"Found existing data: {hall} - {len(meals)} meals, {item_counts[hall]} items")
             
-            if existing_combinations:
-                for hall, meals in existing_combinations.items():
-                    self.logger.info(f"Found existing data: {hall} - {len(meals)} meals, {self._count_items_for_hall_today(hall)} items")
-            
-            self.logger.info(f"Total existing data: {total_halls} dining halls, {self._count_total_items_today()} items")
+            self.logger.info(f"Total existing data: {len(existing_combinations)} dining halls, {coverage.get('total_items', 0)} items")
             
         except Exception as e:
             self.logger.error(f"Error querying existing data: {e}")
         
         return existing_combinations
     
-    def _count_items_for_hall_today(self, dining_hall: str) -> int:
-        """Count total items for a specific dining hall today."""
-        try:
-            return self.foods_collection.count_documents({
-                "date": self.today,
-                "dining_hall": dining_hall
-            })
-        except:
-            return 0
-    
-    def _count_total_items_today(self) -> int:
-        """Count total items for today."""
-        try:
-            return self.foods_collection.count_documents({"date": self.today})
-        except:
-            return 0
-    
     def get_available_dining_halls_and_meals(self) -> Dict[str, List[str]]:
         """
         Get all available dining halls and their meals from the website.
@@ -251,6 +239,13 @@ class IncrementalScraper:
         # Get all available dining halls (same as main scraper)
         available_dining_halls = self.get_available_dining_halls()
         
+        # Record what the site lists so completeness can be checked without scraping
+        if available_dining_halls and self.db is not None and not self.dry_run:
+            try:
+                set_expected_halls(self.db, self.today, available_dining_halls, self.campus)
+            except Exception as e:
+                self.logger.warning(f"Could not record expected dining halls: {e}")
+        
         # For each dining hall, we need to check if we need to process it
         # We'll determine missing meals dynamically when processing each dining hall
         dining_halls_to_process = []
@@ -294,30 +289,18 @@ class IncrementalScraper:
         self.logger.info(f"Processing {len(dining_halls_to_process)} dining halls")
         
         try:
-            # Initialize the scraper (same as main scraper)
-            self.scraper = DiningHallScraper(
-                target_url=self.target_url,
-                mongodb_uri=self.mongodb_uri,
-                headless=self.headless,
-                max_retries=3  # Use same retries as main scraper
-            )
-            
-            # Setup driver with same logic as main scraper
-            self.scraper.driver = self.scraper.setup_driver()
-            if not self.scraper.is_driver_alive():
-                raise RuntimeError("Driver failed to initialize properly")
-            
-            self.scraper.driver.get(self.target_url)
-            self.scraper.human_wait(2, 4)  # Same wait as main scraper
-            
-            if not self.scraper.is_driver_alive():
-                raise RuntimeError("Driver died after loading page")
+            self._start_scraper()
             
-            all_new_foods = []
+            # Scraped meals are appended here as they are extracted (see scrape_checkpoint.py)
+            self.checkpoint = CheckpointLog.open("incremental_scraper", self.today, self.campus, resume=self.resume)
             
             # Process each dining hall with recovery (EXACT same pattern as main scraper)
             for idx, dining_hall in enumerate(dining_halls_to_process):
                 try:
+                    if self.checkpoint.is_hall_complete(dining_hall):
+                        self.logger.info(f"Skipping dining hall {idx + 1}/{len(dining_halls_to_process)}: {dining_hall} - already in checkpoint")
+                        continue
+                    
                     self.logger.info(f"Processing dining hall {idx + 1}/{len(dining_halls_to_process)}: {dining_hall}")
                     
                     # Clear failed items for each dining hall
@@ -326,22 +309,8 @@ class IncrementalScraper:
                     # Use recovery version (same as main scraper)
                     meals_data = self._process_dining_hall_with_recovery_incremental(dining_hall)
                     
-                    if meals_data:
-                        # Convert to the format expected by save_to_json
-                        hall_data = {
-                            "name": dining_hall,
-                            "meals": meals_data
-                        }
-                        
-                        # Convert to foods format and add to collection
-                        foods_data = {
-                            "date": self.today,
-                            "dining_halls": [hall_data]
-                        }
-                        
-                        new_foods = self.scraper.save_to_json(foods_data, filename=f"incremental_foods_{self.today}.json")
-                        all_new_foods.extend(new_foods)
-                        
+                    if meals_data or self.checkpoint.has_meals(dining_hall):
+                        self.checkpoint.mark_hall_complete(dining_hall)
                         self.logger.info(f"✓ Successfully processed {dining_hall}")
                     else:
                         self.logger.warning(f"✗ No new meals found for {dining_hall}")
@@ -362,15 +331,17 @@ class IncrementalScraper:
                     
                     continue
             
-            # Upload all new foods to MongoDB (same as main scraper)
-            if all_new_foods:
-                self.logger.info(f"Uploading {len(all_new_foods)} new food items to MongoDB...")
+            # Upload all new foods to MongoDB (same as main scraper), streaming from the checkpoint log
+            if self.checkpoint.has_meals():
+                food_count = self.checkpoint.export_json(f"incremental_foods_{self.today}.json")
+                self.logger.info(f"Uploading {food_count} new food items to MongoDB...")
                 
-                # Use the main scraper's upload method instead of custom logic
-                success = self.scraper.upload_to_mongodb(all_new_foods)
+                # Use the main scraper's upload method, replacing only the scraped meals
+                success = self.scraper.upload_to_mongodb(self.checkpoint.iter_foods(), replace_all_today=False)
                 
                 if success:
-                    self.logger.info(f"✓ Successfully uploaded {len(all_new_foods)} food items")
+                    self.logger.info(f"✓ Successfully uploaded {food_count} food items")
+                    self.get_existing_data_for_today()  # Refresh persisted coverage
                     return True
                 else:
                     self.logger.error("Failed to upload food items to MongoDB")
@@ -386,13 +357,81 @@ class IncrementalScraper:
                 self.scraper.take_screenshot("incremental_critical_error")
             return False
         finally:
-            # Clean shutdown (same as main scraper)
-            if self.scraper and self.scraper.driver:
-                try:
-                    self.scraper.driver.quit()
-                except:
-                    pass
-                self.logger.info("Driver session closed")
+            self._stop_scraper()
+    
+    def _start_scraper(self):
+        """Start a browser session on the menu page (same setup as main scraper)."""
+        self.scraper = DiningHallScraper(
+            target_url=self.target_url,
+            mongodb_uri=self.mongodb_uri,
+            headless=self.headless,
+            max_retries=3,  # Use same retries as main scraper
+            campus=self.campus
+        )
+        
+        # Setup driver with same logic as main scraper
+        self.scraper.driver = self.scraper.setup_driver()
+        if not self.scraper.is_driver_alive():
+            raise RuntimeError("Driver failed to initialize properly")
+        
+        self.scraper.driver.get(self.target_url)
+        self.scraper.human_wait(2, 4)  # Same wait as main scraper
+        
+        if not self.scraper.is_driver_alive():
+            raise RuntimeError("Driver died after loading page")
+    
+    def _stop_scraper(self):
+        """Clean shutdown (same as main scraper)."""
+        if self.scraper and self.scraper.driver:
+            try:
+                self.scraper.driver.quit()
+            except:
+                pass
+            self.logger.info("Driver session closed")
+    
+    def scrape_hall(self, dining_hall: str, meals: Optional[List[str]] = None) -> int:
+        """
+        Scrape a single dining hall in its own browser session.
+        
+        Used by the scrape scheduler, which runs several halls concurrently.
+        
+        Args:
+            dining_hall: Dining hall name as listed on the site
+            meals: Meals to re-scrape, replacing their existing items.
+                None scrapes only the meals that have no data yet.
+        
+        Returns:
+            Number of food items uploaded
+        
+        Raises:
+            RuntimeError: If the browser could not be started or the upload failed
+        """
+        try:
+            self._start_scraper()
+            
+            if meals:
+                meals_data = self._process_specific_meals(dining_hall, meals)
+            else:
+                meals_data = self._process_dining_hall_with_recovery_incremental(dining_hall)
+            
+            if not meals_data:
+                self.logger.info(f"No new meals found for {dining_hall}")
+                return 0
+            
+            foods_data = {
+                "date": self.today,
+                "dining_halls": [{"name": dining_hall, "meals": meals_data}]
+            }
+            filename = f"incremental_foods_{self.today}_{dining_hall.replace(' ', '_')}.json"
+            new_foods = self.scraper.save_to_json(foods_data, filename=filename)
+            
+            if not self.scraper.upload_to_mongodb(new_foods, replace_all_today=False):
+                raise RuntimeError(f"Failed to upload food items for {dining_hall}")
+            
+            self.logger.info(f"✓ Uploaded {len(new_foods)} food items for {dining_hall}")
+            return len(new_foods)
+        finally:
+            self._stop_scraper()
     
     def _process_dining_hall_with_recovery_incremental(self, dining_hall_name: str) -> List[Dict[str, Any]]:
         """Process dining hall with crash recovery (EXACT same as main scraper but only missing meals)."""
@@ -467,6 +506,9 @@ class IncrementalScraper:
                     if meal_name in existing_meals:
                         self.logger.info(f"  Skipping {meal_name} - already exists")
                         continue
+                    if self.checkpoint and self.checkpoint.is_meal_complete(dining_hall_name, meal_name):
+                        self.logger.info(f"  Skipping {meal_name} - already in checkpoint")
+                        continue
                     
                     if not self.scraper.is_driver_alive():
                         self.logger.error("Driver died during meal processing")
@@ -483,6 +525,8 @@ class IncrementalScraper:
                                 "meal_name": meal_name,
                                 "stations": stations_data
                             })
+                            if self.checkpoint:
+                                self.checkpoint.append_meal(dining_hall_name, meal_name, stations_data)
                             
                             # Count total items across all stations
                             total_items = sum(len(station.get('items', [])) for station in stations_data)
@@ -566,6 +610,37 @@ class IncrementalScraper:
         
         return meals_data
     
+    def check_coverage(self) -> bool:
+        """
+        Check today's persisted scrape coverage without touching the browser.
+        
+        Returns:
+            True if every dining hall listed on the site has data for today,
+            False if halls are missing or the expected halls are unknown
+        """
+        if self.db is None:
+            self.logger.error("MongoDB not configured, cannot check coverage")
+            return False
+        
+        coverage = get_coverage(self.db, self.today, self.campus)
+        if not coverage:
+            self.logger.info(f"No scrape coverage recorded for {self.today}")
+            return False
+        
+        for combination in coverage.get("combinations", []):
+            self.logger.info(f"  {combination['dining_hall']} - {combination['meal_name']}: {combination['count']} items")
+        
+        missing = missing_halls(coverage)
+        if missing is None:
+            self.logger.info("Expected dining halls unknown - a discovery run is needed")
+            return False
+        if missing:
+            self.logger.info(f"Missing dining halls: {', '.join(missing)}")
+            return False
+        
+        self.logger.info(f"Coverage complete: {len(coverage.get('dining_halls', []))} dining halls, {coverage.get('total_items', 0)} items")
+        return True
+    
     def run(self, force_rescrape: bool = False) -> bool:
         """
         Main execution method.
@@ -617,6 +692,10 @@ def main():
                        help="Show what would be scraped without actually scraping")
     parser.add_argument("--force-rescrape", action="store_true",
                        help="Re-scrape all meals even if they already exist")
+    parser.add_argument("--check-coverage", action="store_true",
+                       help="Only check today's recorded coverage (exit 0 if complete)")
+    parser.add_argument("--resume", action="store_true",
+                       help="Continue today's interrupted run from its checkpoint log")
     parser.add_argument("--headless", action="store_true", default=True,
                        help="Run in headless mode (default: True)")
     parser.add_argument("--no-headless", action="store_false", dest="headless",
@@ -629,9 +708,13 @@ def main():
         target_url=TARGET_URL,
         mongodb_uri=MONGODB_URI,
         headless=args.headless,
-        dry_run=args.dry_run
+        dry_run=args.dry_run,
+        resume=args.resume
     )
     
+    if args.check_coverage:
+        sys.exit(0 if scraper.check_coverage() else 1)
+    
     # Run scraper
     success = scraper.run(force_rescrape=args.force_rescrape)
     
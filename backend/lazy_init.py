@@ -0,0 +1,78 @@
+"""
+Build expensive objects on first use instead of at worker startup.
+
+The AI agent (langgraph, langchain, OpenAI client, compiled graph) and the
+Anthropic meal planner take seconds to import and construct. Every uvicorn
+worker used to pay that at startup, whether or not it served an AI request,
+and workers are recycled regularly. LazyInit builds them on the first
+request that needs them; with AI_PREWARM=true they are built in a
+background thread right after startup instead, so the first request
+doesn't wait and startup isn't delayed.
+
+Build times are recorded in the lazy_init_<name>_ms histograms.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+AI_PREWARM = os.getenv("AI_PREWARM", "false").lower() == "true"
+
+T = TypeVar("T")
+
+
+class LazyInit(Generic[T]):
+    """A value built by `factory` on the first get(), once per process."""
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self.factory = factory
+        self._value: Optional[T] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> T:
+        """
+        The value, built on first call.
+
+        Concurrent first callers wait for one build. If the factory raises,
+        the error propagates and the next call tries again.
+        """
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                start = time.perf_counter()
+                self._value = self.factory()
+                self._loaded = True
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                metrics.histogram(f"lazy_init_{self.name}_ms").observe(elapsed_ms)
+                logger.info(f"Initialized {self.name} in {elapsed_ms:.0f} ms")
+        return self._value
+
+    def prewarm(self) -> threading.Thread:
+        """Build the value in a background thread (errors are logged, get() retries later)."""
+        def build():
+            try:
+                self.get()
+            except Exception as e:
+                logger.warning(f"Pre-warming {self.name} failed: {e}")
+
+        thread = threading.Thread(target=build, name=f"prewarm-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def set(self, value: Any):
+        """Use an already built value (tests, benchmarks)."""
+        with self._lock:
+            self._value = value
+            self._loaded = True
@@ -1,25 +1,22 @@
 from fastapi import FastAPI, Query, HTTPException, status, Response, Request, Depends, Body, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
 from typing import Optional, List
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 import os
 from dotenv import load_dotenv
 import certifi
 import logging
 import sys
-from collections import defaultdict
 import asyncio
 from datetime import datetime, timedelta
 import shutil
 import uuid
 import time
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse, JSONResponse, RedirectResponse
-import io
-import csv
-import json
+from fastapi.responses import StreamingResponse, JSONResponse, RedirectResponse, FileResponse
 from authlib.integrations.starlette_client import OAuth
 from pydantic import BaseModel
 import cloudinary
@@ -32,19 +29,39 @@ from models.plate import Plate, PlateItem
 from models.meal_plan import MealPlanRequest, MealPlanResponse
 
 from auth_util import (
-    hash_password, verify_password, set_auth_cookie, clear_auth_cookie,
-    get_user_by_email, get_current_user
+    hash_password_async, verify_password_async, verify_and_update_password, shutdown_password_pool,
+    set_auth_cookie, clear_auth_cookie,
+    get_user_by_email, get_current_user, get_current_user_id, invalidate_user_cache
 )
+import metrics
+from lazy_init import AI_PREWARM, LazyInit
 from jwt_util import create_access_token, decode_access_token
 
-from meal_planning.ai_integration import MealPlannerAI
 from meal_planning.food_filtering import get_filtered_foods_for_meal_plan
 from meal_planning.target_calculation import get_user_targets, calculate_meal_targets
 from meal_planning.meal_validation import enhance_meal_plan_response
 
-from rate_limiting import check_rate_limit, record_meal_plan_request, get_rate_limit_status
+from rate_limiting import (
+    AI_USAGE_COLLECTION, ensure_usage_indexes, get_rate_limit_status,
+    release_meal_plan_request, reserve_meal_plan_request
+)
+from scrape_coverage import DEFAULT_CAMPUS, compute_coverage, get_coverage, serialize_coverage
+import food_catalog
+import data_export
+from allergens import derive_allergens
+from food_search import invalidate_typeahead, search_foods, typeahead
+from user_targets import compute_targets, get_targets, profile_with_targets
+from nutrition_history import (
+    GRANULARITIES, get_nutrition_history, invalidate_plate_totals, item_macros, plate_totals, standard_food_ids
+)
+from food_catalog import (
+    USE_FOOD_CATALOG, CATALOG_COLLECTION, ensure_catalog_indexes, find_menu_foods,
+    get_foods_by_ids, menu_collection, upsert_catalog_entries, food_fingerprint, record_foods
+)
 
 from starlette.middleware.sessions import SessionMiddleware
+from middleware import RateLimitMiddleware, RateLimitRule, RequestLogMiddleware, ResponseHeadersMiddleware
+from rate_limiter import RATE_LIMIT_COLLECTION, SlidingWindowLimiter, create_store
 
 
 
@@ -133,178 +150,78 @@ app.add_middleware(
     https_only=IS_PRODUCTION  # Enable HTTPS-only in production
 )
 
-# Security Headers Middleware
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        # Security headers for production
-        if IS_PRODUCTION:
-            # Strict Transport Security - Force HTTPS
-            response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-            
-        # Content Security Policy - Prevent XSS attacks
-        response.headers["Content-Security-Policy"] = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
-            "style-src 'self' 'unsafe-inline'; "
-            "img-src 'self' data: https:; "
-            "font-src 'self' data:; "
-            "connect-src 'self'; "
-            "media-src 'self'; "
-            "object-src 'none'; "
-            "frame-ancestors 'none';"
-        )
-        
-        # Prevent clickjacking
-        response.headers["X-Frame-Options"] = "DENY"
-        
-        # Prevent MIME type sniffing
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        
-        # XSS Protection (legacy browsers)
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        
-        # Referrer Policy - Control referrer information
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        
-        # Permissions Policy - Control browser features
-        response.headers["Permissions-Policy"] = (
-            "geolocation=(), "
-            "microphone=(), "
-            "camera=(), "
-            "payment=(), "
-            "usb=(), "
-            "magnetometer=(), "
-            "gyroscope=(), "
-            "speaker=(), "
-            "vibrate=(), "
-            "fullscreen=(self)"
-        )
-        
-        return response
+# Rate limiting - stricter limits for sensitive auth endpoints (skipped in development)
+AUTH_RATE_LIMITED_PATHS = [
+    "/auth/login",
+    "/auth/register",
+    "/api/auth/forgot-password",
+    "/api/auth/reset-password",
+    "/api/account/change-password"
+]
 
-app.add_middleware(SecurityHeadersMiddleware)
+app.add_middleware(
+    RateLimitMiddleware,
+    rules=[
+        # 5 attempts per 5 minutes on auth endpoints
+        RateLimitRule("auth", limit=5, period_seconds=300, paths=AUTH_RATE_LIMITED_PATHS,
+                      detail="Too many authentication attempts. Please try again later."),
+        # 100 requests per minute overall
+        RateLimitRule("global", limit=100, period_seconds=60, prefixes=["/"],
+                      detail="Rate limit exceeded. Please try again later.")
+    ],
+    enabled=IS_PRODUCTION,
+    # RATE_LIMIT_STORE=mongo shares counters across workers; db is resolved on first use
+    limiter=SlidingWindowLimiter(create_store(lambda: db[RATE_LIMIT_COLLECTION]))
+)
 
-# Rate Limiting Middleware
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, requests_per_minute: int = 60):
-        super().__init__(app)
-        self.requests_per_minute = requests_per_minute
-        self.requests = defaultdict(list)
-        
-    def get_client_ip(self, request: Request) -> str:
-        """Get client IP from request headers or connection"""
-        # Check for forwarded headers first (behind proxy)
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-        
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
-            
-        # Fallback to client host
-        return request.client.host if request.client else "unknown"
-    
-    async def dispatch(self, request: Request, call_next):
-        # Skip rate limiting in development
-        if not IS_PRODUCTION:
-            return await call_next(request)
-            
-        client_ip = self.get_client_ip(request)
-        current_time = datetime.now()
-        
-        # Clean old requests (older than 1 minute)
-        self.requests[client_ip] = [
-            req_time for req_time in self.requests[client_ip]
-            if current_time - req_time < timedelta(minutes=1)
-        ]
-        
-        # Check if rate limit exceeded
-        if len(self.requests[client_ip]) >= self.requests_per_minute:
-            logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-            return Response(
-                content='{"detail": "Rate limit exceeded. Please try again later."}',
-                status_code=429,
-                headers={"Content-Type": "application/json", "Retry-After": "60"}
-            )
-        
-        # Add current request
-        self.requests[client_ip].append(current_time)
-        
-        return await call_next(request)
-
-# Apply rate limiting - more restrictive for auth endpoints
-app.add_middleware(RateLimitMiddleware, requests_per_minute=100)
-
-# Auth-specific Rate Limiting Middleware
-class AuthRateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, requests_per_period: int = 5, period_minutes: int = 5):
-        super().__init__(app)
-        self.requests_per_period = requests_per_period
-        self.period_minutes = period_minutes
-        self.requests = defaultdict(list)
-        
-    def get_client_ip(self, request: Request) -> str:
-        """Get client IP from request headers or connection"""
-        # Check for forwarded headers first (behind proxy)
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-        
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
-            
-        # Fallback to client host
-        return request.client.host if request.client else "unknown"
-    
-    async def dispatch(self, request: Request, call_next):
-        # Only apply to sensitive auth endpoints
-        auth_endpoints = [
-            "/auth/login",
-            "/auth/register", 
-            "/api/auth/forgot-password",
-            "/api/auth/reset-password",
-            "/api/account/change-password"
-        ]
-        
-        if not any(request.url.path == endpoint for endpoint in auth_endpoints):
-            return await call_next(request)
-        
-        # Skip rate limiting in development
-        if not IS_PRODUCTION:
-            return await call_next(request)
-            
-        client_ip = self.get_client_ip(request)
-        current_time = datetime.now()
-        
-        # Clean old requests (older than period)
-        self.requests[client_ip] = [
-            req_time for req_time in self.requests[client_ip]
-            if current_time - req_time < timedelta(minutes=self.period_minutes)
-        ]
-        
-        # Check if rate limit exceeded
-        if len(self.requests[client_ip]) >= self.requests_per_period:
-            logger.warning(f"Auth rate limit exceeded for IP: {client_ip} on endpoint: {request.url.path}")
-            return Response(
-                content='{"detail": "Too many authentication attempts. Please try again later."}',
-                status_code=429,
-                headers={
-                    "Content-Type": "application/json", 
-                    "Retry-After": str(self.period_minutes * 60)
-                }
-            )
-        
-        # Add current request
-        self.requests[client_ip].append(current_time)
-        
-        return await call_next(request)
+# Security headers on every response, long-lived caching for static assets
+SECURITY_HEADERS = [
+    # Content Security Policy - Prevent XSS attacks
+    ("Content-Security-Policy", (
+        "default-src 'self'; "
+        "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
+        "style-src 'self' 'unsafe-inline'; "
+        "img-src 'self' data: https:; "
+        "font-src 'self' data:; "
+        "connect-src 'self'; "
+        "media-src 'self'; "
+        "object-src 'none'; "
+        "frame-ancestors 'none';"
+    )),
+    # Prevent clickjacking
+    ("X-Frame-Options", "DENY"),
+    # Prevent MIME type sniffing
+    ("X-Content-Type-Options", "nosniff"),
+    # XSS Protection (legacy browsers)
+    ("X-XSS-Protection", "1; mode=block"),
+    # Referrer Policy - Control referrer information
+    ("Referrer-Policy", "strict-origin-when-cross-origin"),
+    # Permissions Policy - Control browser features
+    ("Permissions-Policy", (
+        "geolocation=(), "
+        "microphone=(), "
+        "camera=(), "
+        "payment=(), "
+        "usb=(), "
+        "magnetometer=(), "
+        "gyroscope=(), "
+        "speaker=(), "
+        "vibrate=(), "
+        "fullscreen=(self)"
+    ))
+]
+if IS_PRODUCTION:
+    # Strict Transport Security - Force HTTPS
+    SECURITY_HEADERS.insert(0, ("Strict-Transport-Security", "max-age=31536000; includeSubDomains"))
 
-# Apply auth-specific rate limiting (5 attempts per 5 minutes)
-app.add_middleware(AuthRateLimitMiddleware, requests_per_period=5, period_minutes=5)
+app.add_middleware(
+    ResponseHeadersMiddleware,
+    headers=SECURITY_HEADERS,
+    # Static assets have content hashes - cache for 1 year
+    prefix_headers={"/static/": [("Cache-Control", "public, max-age=31536000, immutable")]}
+)
+
+app.add_middleware(RequestLogMiddleware, log=logger)
 
 # MongoDB connection with production optimizations
 MONGODB_URI = os.getenv("MONGODB_URI")
@@ -336,6 +253,10 @@ client = MongoClient(
 db = client["nutritionapp"]
 foods_collection = db["foods"]
 users_collection = db["users"]
+ai_usage_collection = db[AI_USAGE_COLLECTION]
+
+# AI meal plan limits are off by default while the feature is being tested
+AI_MEAL_PLAN_RATE_LIMIT_ENABLED = os.getenv("AI_MEAL_PLAN_RATE_LIMIT_ENABLED", "false").lower() == "true"
 
 # Database index optimization
 def ensure_database_indexes():
@@ -354,16 +275,34 @@ def ensure_database_indexes():
             ("meal_name", 1)
         ], background=True, name="date_hall_meal_idx")
         
+        # Per-campus scrape coverage (scrape_coverage.py)
+        foods_collection.create_index([
+            ("campus", 1),
+            ("date", 1),
+            ("dining_hall", 1),
+            ("meal_name", 1)
+        ], background=True, name="campus_date_hall_meal_idx")
+        
         foods_collection.create_index([
             ("name", "text"),
             ("description", "text")
         ], background=True, name="food_search_idx")
         
         foods_collection.create_index("labels", background=True)
+        foods_collection.create_index("allergens", background=True)
         foods_collection.create_index("dining_hall", background=True)
         foods_collection.create_index("meal_name", background=True)
         foods_collection.create_index("date", background=True)
         
+        # Catalog + menu_items indexes (used when USE_FOOD_CATALOG is enabled)
+        ensure_catalog_indexes(db)
+        
+        # AI meal plan usage counters expire a day after the last request
+        ensure_usage_indexes(ai_usage_collection)
+        
+        # Background export jobs
+        data_export.ensure_export_indexes(db)
+        
         # Plates collection indexes - critical for nutrition tracking
         db["plates"].create_index([
             ("user_id", 1),
@@ -409,89 +348,79 @@ def ensure_database_indexes():
 # Initialize indexes on startup
 ensure_database_indexes()
 
-# Initialize AI Agent
-try:
-    from ai_agent.agent import NutritionAgent
-    from ai_agent.api import router as ai_router, set_agent
-    
-    # Get OpenAI API key
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    if OPENAI_API_KEY:
-        logger.info("Initializing AI nutrition agent...")
-        nutrition_agent = NutritionAgent(client, OPENAI_API_KEY)
-        set_agent(nutrition_agent)
-        
-        # Add AI agent routes
-        app.include_router(ai_router)
-        logger.info("AI agent initialized successfully")
-    else:
-        logger.warning("OPENAI_API_KEY not found - AI agent features disabled")
-        
-except ImportError as e:
-    logger.warning(f"AI agent dependencies not available: {e}")
-except Exception as e:
-    logger.error(f"Failed to initialize AI agent: {e}")
+# AI agent: routes are registered now, the agent itself (langgraph, langchain,
+# LLM client, compiled graph) is built on the first request that needs it
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+if OPENAI_API_KEY:
+    from ai_agent.api import (
+        router as ai_router, configure_agent, delete_user_agent_data, prewarm_agent, shutdown_agent
+    )
+
+    def build_nutrition_agent():
+        from ai_agent.agent import NutritionAgent
+        return NutritionAgent(client, OPENAI_API_KEY)
+
+    configure_agent(build_nutrition_agent)
+    app.include_router(ai_router)
+    logger.info("AI agent routes registered (agent is built on first use)")
+else:
+    logger.warning("OPENAI_API_KEY not found - AI agent features disabled")
+
+
+def build_meal_planner():
+    from meal_planning.ai_integration import MealPlannerAI
+    return MealPlannerAI(os.getenv("ANTHROPIC_API_KEY"))
+
+
+# Anthropic client for meal plans, shared by all requests of this worker
+meal_planner = LazyInit("meal_planner", build_meal_planner)
 
 # In-memory cache for frequently accessed food items
-from functools import lru_cache
+from collections import OrderedDict
 import hashlib
-
-@lru_cache(maxsize=1000)  # Cache up to 1000 food items
-def get_cached_food_nutrients(food_id: str):
-    """Cache food nutrients to avoid repeated database lookups"""
-    try:
-        food = foods_collection.find_one(
-            {"_id": ObjectId(food_id)}, 
-            {"nutrients": 1, "name": 1, "_id": 0}
-        )
-        return food if food else None
-    except Exception:
-        # Handle string IDs
-        food = foods_collection.find_one(
-            {"_id": food_id}, 
-            {"nutrients": 1, "name": 1, "_id": 0}
-        )
-        return food if food else None
+import threading
+
+FOOD_CACHE_SIZE = int(os.getenv("FOOD_CACHE_SIZE", "1000"))  # Cache up to 1000 food items
+_food_nutrients_cache = OrderedDict()
+# Sync handlers run on the threadpool, so cache reads and writes can race
+_food_cache_lock = threading.Lock()
+
+def invalidate_food_cache(food_id: str = None):
+    """Drop one food (or every food) from the nutrients cache"""
+    with _food_cache_lock:
+        if food_id is None:
+            _food_nutrients_cache.clear()
+        else:
+            _food_nutrients_cache.pop(str(food_id), None)
 
 def bulk_get_foods_optimized(food_ids: set):
-    """Optimized bulk food retrieval with caching"""
+    """Bulk food retrieval with a bounded LRU cache; misses are fetched in one batch"""
     foods_map = {}
     uncached_ids = []
     
     # First, try to get from cache
-    for food_id in food_ids:
-        cached_food = get_cached_food_nutrients(food_id)
-        if cached_food:
-            foods_map[food_id] = cached_food
-        else:
-            uncached_ids.append(food_id)
+    with _food_cache_lock:
+        for food_id in food_ids:
+            key = str(food_id)
+            cached_food = _food_nutrients_cache.get(key)
+            if cached_food is not None:
+                _food_nutrients_cache.move_to_end(key)
+                foods_map[key] = cached_food
+            else:
+                uncached_ids.append(food_id)
     
-    # Bulk fetch uncached foods
+    # Bulk fetch uncached foods (catalog and legacy foods) - only fetch needed fields
     if uncached_ids:
-        object_ids = []
-        str_ids = []
-        for fid in uncached_ids:
-            try:
-                object_ids.append(ObjectId(fid))
-            except Exception:
-                str_ids.append(fid)
-        
-        # Optimized projection - only fetch needed fields
-        projection = {"nutrients": 1, "name": 1}
-        
-        if object_ids:
-            for food in foods_collection.find({"_id": {"$in": object_ids}}, projection):
-                food_id = str(food["_id"])
-                foods_map[food_id] = food
-                # Cache the result
-                get_cached_food_nutrients(food_id)
-        
-        if str_ids:
-            for food in foods_collection.find({"_id": {"$in": str_ids}}, projection):
-                food_id = food["_id"]
-                foods_map[food_id] = food
-                # Cache the result
-                get_cached_food_nutrients(food_id)
+        fetched = get_foods_by_ids(db, uncached_ids, {"nutrients": 1, "name": 1})
+        with _food_cache_lock:
+            for food_id in uncached_ids:
+                food = fetched.get(str(food_id))
+                if not food:
+                    continue
+                foods_map[str(food_id)] = food
+                _food_nutrients_cache[str(food_id)] = food
+                if len(_food_nutrients_cache) > FOOD_CACHE_SIZE:
+                    _food_nutrients_cache.popitem(last=False)
     
     return foods_map
 
@@ -539,24 +468,27 @@ def has_complete_macros(food):
 
 @app.get("/foods", response_model=List[Food])
 def get_foods(
-    name: Optional[str] = Query(None, description="Partial name match, case-insensitive"),
+    name: Optional[str] = Query(None, description="Words to search for in name/description, ranked by relevance"),
     label: Optional[str] = Query(None, description="Label must be present in labels array"),
     dining_hall: Optional[str] = Query(None),
     meal_name: Optional[str] = Query(None),
     date: Optional[str] = Query(None, description="Date in YYYY-MM-DD format")
 ):
-    query = {}
     if name:
-        query["name"] = {"$regex": name, "$options": "i"}
-    if label:
-        query["labels"] = label
-    if dining_hall:
-        query["dining_hall"] = dining_hall
-    if meal_name:
-        query["meal_name"] = meal_name
-    if date:
-        query["date"] = date
-    foods = list(foods_collection.find(query))
+        # Full-text search on food_search_idx instead of a collection-scanning $regex
+        foods = search_foods(db, name, date=date, dining_hall=dining_hall, meal_name=meal_name,
+                             label=label, limit=200)
+    else:
+        query = {}
+        if label:
+            query["labels"] = label
+        if dining_hall:
+            query["dining_hall"] = dining_hall
+        if meal_name:
+            query["meal_name"] = meal_name
+        if date:
+            query["date"] = date
+        foods = find_menu_foods(db, query)
     for food in foods:
         if "_id" in food and food["_id"] is not None:
             food["_id"] = str(food["_id"])
@@ -566,48 +498,135 @@ def get_foods(
         food["trackable"] = has_complete_macros(food)
     return [Food(**food) for food in foods]
 
+@app.get("/api/foods/search")
+def search_foods_endpoint(
+    q: str = Query(..., min_length=1, description="Search terms"),
+    date: Optional[str] = Query(None, description="Date in YYYY-MM-DD format"),
+    dining_hall: Optional[str] = Query(None),
+    meal_name: Optional[str] = Query(None),
+    label: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Full-text food search, best matches first (each result has a relevance score)"""
+    results = search_foods(db, q, date=date, dining_hall=dining_hall, meal_name=meal_name, label=label,
+                           limit=limit, projection={"name": 1, "dining_hall": 1, "meal_name": 1, "station": 1,
+                                                    "date": 1, "labels": 1, "nutrients": 1, "portion_size": 1})
+    for food in results:
+        food["_id"] = str(food["_id"])
+        food.pop("menu_item_id", None)
+    return results
+
+@app.get("/api/foods/typeahead")
+def typeahead_endpoint(
+    q: str = Query(..., min_length=1, description="What the user has typed so far"),
+    date: str = Query(..., description="Menu date in YYYY-MM-DD format"),
+    dining_hall: Optional[str] = Query(None),
+    meal_name: Optional[str] = Query(None),
+    label: Optional[str] = Query(None),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """As-you-type suggestions from an in-memory index of the day's menu"""
+    return typeahead(db, q, date, dining_hall=dining_hall, meal_name=meal_name, label=label, limit=limit)
+
+# Collection that owns food documents (catalog entries or legacy per-date foods)
+food_store = db[CATALOG_COLLECTION] if USE_FOOD_CATALOG else foods_collection
+
 @app.get("/foods/{food_id}", response_model=Food)
 def get_food_by_id(food_id: str):
-    food = foods_collection.find_one({"_id": ObjectId(food_id)})
+    food = food_catalog.get_food_by_id(db, food_id)
     if not food:
         raise HTTPException(status_code=404, detail="Food not found")
+    food["_id"] = str(food["_id"])
     return Food(**food)
 
 @app.post("/foods", response_model=Food, status_code=status.HTTP_201_CREATED)
 def create_food(food: Food):
     food_dict = food.dict(by_alias=True, exclude_unset=True)
     food_dict.pop("_id", None)  # Remove _id if present, MongoDB will create it
-    result = foods_collection.insert_one(food_dict)
-    food_dict["_id"] = str(result.inserted_id)
+    food_dict["allergens"] = derive_allergens(food_dict)
+    if USE_FOOD_CATALOG:
+        catalog_id = upsert_catalog_entries(db, [food_dict])[food_fingerprint(food_dict)]
+        if food_dict.get("date"):
+            record_foods(db, [food_dict])
+        food_dict["_id"] = str(catalog_id)
+    else:
+        result = foods_collection.insert_one(food_dict)
+        food_dict["_id"] = str(result.inserted_id)
+    invalidate_typeahead(food_dict.get("date"))
     return Food(**food_dict)
 
 @app.put("/foods/{food_id}", response_model=Food)
 def update_food(food_id: str, food: Food):
     food_dict = food.dict(by_alias=True, exclude_unset=True)
     food_dict.pop("_id", None)
-    result = foods_collection.update_one({"_id": ObjectId(food_id)}, {"$set": food_dict})
+    update = dict(food_dict)
+    if USE_FOOD_CATALOG:
+        # Catalog entries are matched by fingerprint when menus are recorded;
+        # a stale one would make the next scrape create a duplicate entry
+        current = food_store.find_one({"_id": ObjectId(food_id)})
+        if not current:
+            raise HTTPException(status_code=404, detail="Food not found")
+        update["fingerprint"] = food_fingerprint({**current, **food_dict})
+    try:
+        result = food_store.update_one({"_id": ObjectId(food_id)}, {"$set": update})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="An identical food already exists in the catalog")
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Food not found")
-    updated_food = foods_collection.find_one({"_id": ObjectId(food_id)})
+    invalidate_food_cache(food_id)
+    invalidate_typeahead()
+    if "nutrients" in food_dict:
+        invalidate_plate_totals(db, food_id)
+    updated_food = food_store.find_one({"_id": ObjectId(food_id)})
+    if {"name", "description", "ingredients", "labels"} & food_dict.keys():
+        # Keep the derived allergen flags in sync with the edited fields
+        updated_food["allergens"] = derive_allergens(updated_food)
+        food_store.update_one({"_id": updated_food["_id"]}, {"$set": {"allergens": updated_food["allergens"]}})
+    updated_food["_id"] = str(updated_food["_id"])
     return Food(**updated_food)
 
 @app.delete("/foods/{food_id}")
 def delete_food(food_id: str):
-    result = foods_collection.delete_one({"_id": ObjectId(food_id)})
+    result = food_store.delete_one({"_id": ObjectId(food_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Food not found")
+    if USE_FOOD_CATALOG:
+        db[food_catalog.MENU_ITEMS_COLLECTION].delete_many({"catalog_id": ObjectId(food_id)})
+    invalidate_food_cache(food_id)
+    invalidate_typeahead()
+    invalidate_plate_totals(db, food_id)
     return {"message": "Food deleted successfully"}
 
 @app.get("/")
 def read_root():
     return {"message": "Hello World"}
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.info(f"Request: {request.method} {request.url.path}")
-    response = await call_next(request)
-    logger.info(f"Response: {response.status_code}")
-    return response
+@app.get("/api/metrics")
+def get_metrics():
+    """In-process metrics for this worker (password hashing latency, queue depth, ...)"""
+    return metrics.snapshot()
+
+@app.on_event("startup")
+def prewarm_ai():
+    """With AI_PREWARM=true, build the AI agent and meal planner in the background after startup."""
+    if not AI_PREWARM:
+        return
+    if OPENAI_API_KEY:
+        prewarm_agent()
+    if os.getenv("ANTHROPIC_API_KEY"):
+        meal_planner.prewarm()
+
+@app.on_event("startup")
+def start_export_sweeper():
+    """Delete expired export files and fail export jobs interrupted by a worker restart, now and periodically."""
+    data_export.start_export_sweeper(db)
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    shutdown_password_pool()
+    data_export.shutdown_export_pool()
+    if OPENAI_API_KEY:
+        shutdown_agent()
 
 @app.get("/test")
 def test_endpoint():
@@ -622,29 +641,37 @@ logger.info("All routes registered successfully")
 
 
 @app.post("/auth/register")
-def register(user: UserCreate, response: Response):
-    if get_user_by_email(users_collection, user.email):
+async def register(user: UserCreate, response: Response):
+    # Async for the hash pool; blocking MongoDB calls go to the threadpool
+    if await run_in_threadpool(get_user_by_email, users_collection, user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_pw = hash_password(user.password)
-    users_collection.insert_one({
+    hashed_pw = await hash_password_async(user.password)
+    result = await run_in_threadpool(users_collection.insert_one, {
         "email": user.email,
         "hashed_password": hashed_pw,
         "profile": {"name": user.first_name + " " + user.last_name}  # or default profile fields
     })
-    token = create_access_token({"sub": user.email})
+    token = create_access_token({"sub": user.email, "uid": str(result.inserted_id)})
     set_auth_cookie(response, token)
     return {"message": "Registered"}
 
 @app.post("/auth/login")
-def login(user: UserLogin, response: Response):
-    db_user = get_user_by_email(users_collection, user.email)
+async def login(user: UserLogin, response: Response):
+    db_user = await run_in_threadpool(get_user_by_email, users_collection, user.email)
     if not db_user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     if db_user.get("hashed_password") is None:
         raise HTTPException(status_code=400, detail="Account uses Google login. Please use 'Continue with Google' or set a password in your account settings.")
-    if not verify_password(user.password, db_user["hashed_password"]):
+    valid, new_hash = await verify_and_update_password(user.password, db_user["hashed_password"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    token = create_access_token({"sub": user.email})
+    if new_hash:
+        # Stored hash used an outdated cost factor (BCRYPT_ROUNDS changed)
+        await run_in_threadpool(
+            users_collection.update_one, {"_id": db_user["_id"]}, {"$set": {"hashed_password": new_hash}}
+        )
+        invalidate_user_cache(user.email)
+    token = create_access_token({"sub": user.email, "uid": str(db_user["_id"])})
     set_auth_cookie(response, token)
     return {"message": "Logged in"}
 
@@ -686,25 +713,11 @@ def get_profile(request: Request):
     user = get_current_user(request, users_collection)
     profile = user.get("profile", {})
 
-    # Calculate daily calorie target and macro grams
+    # Daily calorie target and macro grams, cached on the user document
     try:
-        from meal_planning.target_calculation import calculate_energy_target_from_profile, get_macro_targets_from_profile
-
-        daily_calories = calculate_energy_target_from_profile(profile)
-        macro_percentages = get_macro_targets_from_profile(profile)
-
-        # Calculate macro grams from calories and percentages
-        protein_grams = round((daily_calories * (macro_percentages["protein"] / 100)) / 4)
-        carb_grams = round((daily_calories * (macro_percentages["carbs"] / 100)) / 4)
-        fat_grams = round((daily_calories * (macro_percentages["fat"] / 100)) / 9)
-
-        # Add calculated fields to profile
-        profile["daily_calorie_target"] = daily_calories
-        profile["protein_grams"] = protein_grams
-        profile["carb_grams"] = carb_grams
-        profile["fat_grams"] = fat_grams
+        profile = profile_with_targets(profile, get_targets(users_collection, user))
     except Exception as e:
-        print(f"Error calculating targets: {e}")
+        logger.error(f"Error calculating targets: {e}")
         # Continue without calculated fields if error occurs
 
     return {
@@ -722,10 +735,15 @@ def get_email(request: Request):
 @app.put("/api/profile")
 def update_profile(request: Request, data: dict = Body(...)):
     user = get_current_user(request, users_collection)
-    users_collection.update_one(
-        {"email": user["email"]},
-        {"$set": {f"profile.{k}": v for k, v in data.items()}}
-    )
+    update = {"$set": {f"profile.{k}": v for k, v in data.items()}}
+    # Targets depend on the profile; store the new ones in the same write
+    try:
+        update["$set"]["targets"] = compute_targets({**user.get("profile", {}), **data})
+    except Exception as e:
+        logger.warning(f"Error calculating targets: {e}")
+        update["$unset"] = {"targets": ""}
+    users_collection.update_one({"email": user["email"]}, update)
+    invalidate_user_cache(user["email"])
     return {"message": "Profile updated"}
 
 @app.post("/api/profile/image")
@@ -793,6 +811,7 @@ async def upload_profile_image(request: Request, image: UploadFile = File(...)):
             {"_id": user["_id"]},
             {"$set": {"profile.image": image_url}}
         )
+        invalidate_user_cache(user["email"])
         
         # Return the Cloudinary URL
         return {"url": image_url}
@@ -801,109 +820,23 @@ async def upload_profile_image(request: Request, image: UploadFile = File(...)):
         logger.error(f"Cloudinary upload failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to upload image. Please try again.")
 
-def calculate_bmr(sex, weight_kg, height_cm, age):
-    if sex == 'male':
-        return 10 * weight_kg + 6.25 * height_cm - 5 * age + 5
-    else:
-        return 10 * weight_kg + 6.25 * height_cm - 5 * age - 161
-
-def get_activity_multiplier(activity_level):
-    return {
-        'sedentary': 1.2,
-        'light': 1.375,
-        'moderate': 1.55,
-        'high': 1.725,
-        'extreme': 1.9
-    }.get(activity_level, 1.2)
-
 @app.get("/api/profile/energy-target")
 def get_energy_target(request: Request):
     user = get_current_user(request, users_collection)
-    profile = user.get("profile", {})
-    sex = profile.get("sex", "male")
-    weight_lbs = profile.get("weight", 150)
-    height_in = profile.get("height", 68)
-    birthday = profile.get("birthday")
-    activity_level = profile.get("activity_level", "sedentary")
-    weight_goal_type = profile.get("weight_goal_type", "maintain")
-    weight_goal_rate = profile.get("weight_goal_rate", 0)
-    weight_goal_custom_rate = profile.get("weight_goal_custom_rate", 0)
-    
-
-    weight_kg = float(weight_lbs) * 0.453592
-    height_cm = float(height_in) * 2.54
-
-    # Calculate age
-    if birthday:
-        if isinstance(birthday, str):
-            birthdate = datetime.strptime(birthday[:10], "%Y-%m-%d")
-        else:
-            birthdate = birthday
-        today = datetime.today()
-        age = today.year - birthdate.year - ((today.month, today.day) < (birthdate.month, birthdate.day))
-    else:
-        age = 30  # default
-
-    bmr = calculate_bmr(sex, weight_kg, height_cm, age)
-    tdee = bmr * get_activity_multiplier(activity_level)
-
-    # Map string rates to float values
-    rate_map = {"slow": 0.5, "moderate": 1.0, "fast": 1.5}
-
-    # Adjust for weight goal
-    if weight_goal_type == "lose" or weight_goal_type == "losing":
-        if str(weight_goal_rate) == "custom":
-            try:
-                custom_rate = float(weight_goal_custom_rate)
-            except Exception:
-                custom_rate = 0
-            tdee -= 500 * custom_rate
-        else:
-            rate_value = rate_map.get(str(weight_goal_rate), None)
-            if rate_value is not None:
-                tdee -= 500 * rate_value
-            else:
-                try:
-                    tdee -= 500 * float(weight_goal_rate)
-                except Exception:
-                    pass
-    elif weight_goal_type == "gain" or weight_goal_type == "gaining":
-        if str(weight_goal_rate) == "custom":
-            try:
-                custom_rate = float(weight_goal_custom_rate)
-            except Exception:
-                custom_rate = 0
-            tdee += 500 * custom_rate
-        else:
-            rate_value = rate_map.get(str(weight_goal_rate), None)
-            if rate_value is not None:
-                tdee += 500 * rate_value
-            else:
-                try:
-                    tdee += 500 * float(weight_goal_rate)
-                except Exception:
-                    pass
-    elif weight_goal_type == "maintain" or weight_goal_type == "maintaining":
-        # For maintenance, don't adjust TDEE - return the calculated TDEE as-is
-        pass
-    elif weight_goal_type == "custom":
-        try:
-            tdee += 500 * float(weight_goal_custom_rate)
-        except Exception:
-            pass
-
-    return {"energy_target": round(tdee)}
+    return {"energy_target": get_targets(users_collection, user)["daily_calories"]}
 
 @app.post("/api/account/change-password")
-def change_password(request: Request, data: ChangePasswordRequest):
-    user = get_current_user(request, users_collection)
-    if not verify_password(data.current_password, user["hashed_password"]):
+async def change_password(request: Request, data: ChangePasswordRequest):
+    user = await run_in_threadpool(get_current_user, request, users_collection)
+    if not await verify_password_async(data.current_password, user["hashed_password"]):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
-    new_hashed = hash_password(data.new_password)
-    users_collection.update_one(
+    new_hashed = await hash_password_async(data.new_password)
+    await run_in_threadpool(
+        users_collection.update_one,
         {"email": user["email"]},
         {"$set": {"hashed_password": new_hashed}}
     )
+    invalidate_user_cache(user["email"])
     return {"message": "Password updated"}
 
 @app.delete("/api/account")
@@ -931,17 +864,25 @@ def delete_account(request: Request):
     
     # Delete all user-related data from database
     users_collection.delete_one({"email": user["email"]})
+    invalidate_user_cache(user["email"])
     db["plates"].delete_many({"user_id": user_id})
     db["weight_log"].delete_many({"user_id": user_id})
+    ai_usage_collection.delete_one({"_id": user["_id"]})
+    data_export.delete_user_exports(db, user_id)
+    if OPENAI_API_KEY:
+        try:
+            delete_user_agent_data(db, user_id)
+        except Exception as e:
+            logger.error(f"Failed to delete AI agent data for user {user_id}: {e}")
     
     return {"message": "Account and all associated data deleted"}
 
 @app.get("/api/plate")
 def get_plate(request: Request, date: str):
-    user = get_current_user(request, users_collection)
+    user_id = get_current_user_id(request, users_collection)
     # Optimized single plate lookup with projection
     plate = db["plates"].find_one(
-        {"user_id": str(user["_id"]), "date": date},
+        {"user_id": user_id, "date": date},
         {"items": 1, "date": 1, "_id": 0}  # Only return needed fields
     )
     if not plate:
@@ -950,7 +891,7 @@ def get_plate(request: Request, date: str):
 
 @app.post("/api/plate")
 def save_plate(request: Request, plate: Plate = Body(...)):
-    user = get_current_user(request, users_collection)
+    user_id = get_current_user_id(request, users_collection)
     items = []
     for item in plate.items:
         d = item.dict()
@@ -962,17 +903,20 @@ def save_plate(request: Request, plate: Plate = Body(...)):
         if "custom_macros" in d and d["custom_macros"] is None:
             del d["custom_macros"]
         items.append(d)
-    db["plates"].update_one(
-        {"user_id": str(user["_id"]), "date": plate.date},
-        {"$set": {"items": items, "user_id": str(user["_id"]), "date": plate.date}},
-        upsert=True
-    )
+    # Daily nutrition rollup used by /api/plate/history; if it can't be
+    # computed the plate is saved without it and backfilled on first read
+    update = {"$set": {"items": items, "user_id": user_id, "date": plate.date}}
+    try:
+        update["$set"]["totals"] = plate_totals(items, bulk_get_foods_optimized(standard_food_ids(items)))
+    except Exception as e:
+        logger.error(f"Failed to compute plate totals for user {user_id} on {plate.date}: {e}")
+        update["$unset"] = {"totals": ""}
+    db["plates"].update_one({"user_id": user_id, "date": plate.date}, update, upsert=True)
     return {"message": "Plate saved"}
 
 @app.get("/api/plate/summary")
 def get_plate_summary(request: Request, start_date: str, end_date: str):
-    user = get_current_user(request, users_collection)
-    user_id = str(user["_id"])
+    user_id = get_current_user_id(request, users_collection)
     # Optimized query with projection to only fetch needed fields
     plates = list(db["plates"].find(
         {
@@ -1054,8 +998,7 @@ def get_plate_summary(request: Request, start_date: str, end_date: str):
 
 @app.get("/api/plate/food-macros")
 def get_food_macros(request: Request, start_date: str, end_date: str):
-    user = get_current_user(request, users_collection)
-    user_id = str(user["_id"])
+    user_id = get_current_user_id(request, users_collection)
     # Optimized query with projection and index hint
     plates = list(db["plates"].find(
         {
@@ -1068,51 +1011,34 @@ def get_food_macros(request: Request, start_date: str, end_date: str):
             "_id": 0
         }
     ).hint("meal_history_idx").sort("date", 1))  # Sort by date ascending
+    # Resolve every referenced food in one batch instead of one query per item
+    foods_map = get_foods_by_ids(db, {
+        item.get("food_id")
+        for plate in plates
+        for item in plate.get("items", [])
+        if "custom_macros" not in item
+    }, {"nutrients": 1})
     result = []
     for plate in plates:
-        date = plate["date"]
         for item in plate.get("items", []):
-            quantity = item.get("quantity", 1)
-            if "custom_macros" in item:
-                n = item["custom_macros"]
-                if n is None:
-                    continue
-                fiber = float(n.get("dietary_fiber", 0))
-                total_carbs = float(n.get("carbs", n.get("total_carbohydrates", 0)))
-                net_carbs = total_carbs - fiber
-                result.append({
-                    "date": date,
-                    "calories": int(n.get("calories", 0)) * quantity,
-                    "protein": float(n.get("protein", 0)) * quantity,
-                    "carbs": net_carbs * quantity,
-                    "fat": float(n.get("totalFat", n.get("total_fat", 0))) * quantity,
-                    "fiber": fiber * quantity
-                })
-                continue
-            food_id = item.get("food_id")
-            food = None
-            try:
-                food = db["foods"].find_one({"_id": ObjectId(food_id)})
-            except Exception:
-                food = db["foods"].find_one({"_id": food_id})
-            if not food:
-                continue
-            n = food.get("nutrients", {})
-            if n is None:
-                continue
-            fiber = float(n.get("dietary_fiber", 0))
-            total_carbs = float(n.get("total_carbohydrates", 0))
-            net_carbs = total_carbs - fiber
-            result.append({
-                "date": date,
-                "calories": int(n.get("calories", 0)) * quantity,
-                "protein": float(n.get("protein", 0)) * quantity,
-                "carbs": net_carbs * quantity,
-                "fat": float(n.get("total_fat", 0)) * quantity,
-                "fiber": fiber * quantity
-            })
+            macros = item_macros(item, foods_map.get(str(item.get("food_id"))))
+            if macros:
+                result.append({"date": plate["date"], **macros})
     return result
 
+@app.get("/api/plate/history")
+def get_plate_history(request: Request, start_date: str, end_date: str, granularity: str = "daily"):
+    """
+    Nutrition history in daily, weekly or monthly buckets.
+
+    Each bucket has days_tracked plus sum, mean, min and max (over tracked
+    days) of calories, protein, net carbs, fat and fiber.
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    user_id = get_current_user_id(request, users_collection)
+    return get_nutrition_history(db, user_id, start_date, end_date, granularity)
+
 @app.put("/api/profile/email")
 def update_email(request: Request, data: dict = Body(...)):
     user = get_current_user(request, users_collection)
@@ -1126,12 +1052,12 @@ def update_email(request: Request, data: dict = Body(...)):
         {"email": user["email"]},
         {"$set": {"email": new_email}}
     )
+    invalidate_user_cache(user["email"])
     return {"message": "Email updated"}
 
 @app.post("/api/weight-log")
 def upsert_weight_log(request: Request, weight: float = Body(...), date: str = Body(None)):
-    user = get_current_user(request, users_collection)
-    user_id = str(user["_id"])
+    user_id = get_current_user_id(request, users_collection)
     if not date:
         date = datetime.now().strftime("%Y-%m-%d")
     db["weight_log"].update_one(
@@ -1143,8 +1069,7 @@ def upsert_weight_log(request: Request, weight: float = Body(...), date: str = B
 
 @app.get("/api/weight-log")
 def get_weight_logs(request: Request, start_date: str = Query(...), end_date: str = Query(...)):
-    user = get_current_user(request, users_collection)
-    user_id = str(user["_id"])
+    user_id = get_current_user_id(request, users_collection)
     logs = list(db["weight_log"].find({
         "user_id": user_id,
         "date": {"$gte": start_date, "$lte": end_date}
@@ -1155,313 +1080,56 @@ def get_weight_logs(request: Request, start_date: str = Query(...), end_date: st
 
 @app.post("/api/export-data")
 def export_data(request: Request, body: dict = Body(...)):
+    """
+    Export the user's data as CSV, NDJSON, JSON or PDF.
+
+    CSV/NDJSON/JSON are streamed straight from the database cursors (gzip with
+    "compress": true). PDFs and very long histories are produced by a
+    background job instead: the response is 202 with a job id to poll at
+    /api/export-jobs/{job_id}.
+    """
     user = get_current_user(request, users_collection)
     user_id = str(user["_id"])
     selections = body.get("selections", {})
     format = body.get("format", "csv")
-    export_data = {}
-
-    # Profile Info
-    if selections.get("profile"):
-        export_data["profile"] = user.get("profile", {})
-
-    # Weight History
-    if selections.get("weight"):
-        weight_logs = list(db["weight_log"].find({"user_id": user_id}, {"_id": 0, "user_id": 0}))
-        weight_logs.sort(key=lambda x: x["date"])
-        export_data["weight_history"] = weight_logs
-
-    # Meal Logs
-    if selections.get("meals"):
-        plates = list(db["plates"].find({"user_id": user_id}))
-        for plate in plates:
-            plate["_id"] = str(plate["_id"])
-        export_data["meal_logs"] = plates
-
-    # JSON Export (improved: no IDs, include food name and macros for all items)
-    if format == "json":
-        # If meal logs are selected, process them to remove IDs and add names/macros
-        if selections.get("meals"):
-            # Collect all unique standard food_ids
-            food_ids = set()
-            for plate in export_data.get("meal_logs", []):
-                for item in plate.get("items", []):
-                    if "custom_macros" not in item:
-                        food_id = item.get("food_id", "")
-                        if food_id:
-                            food_ids.add(food_id)
-            # Batch fetch all foods
-            foods_map = {}
-            if food_ids:
-                from bson import ObjectId
-                object_ids = []
-                str_ids = []
-                for fid in food_ids:
-                    try:
-                        object_ids.append(ObjectId(fid))
-                    except Exception:
-                        str_ids.append(fid)
-                if object_ids:
-                    for food in db["foods"].find({"_id": {"$in": object_ids}}):
-                        foods_map[str(food["_id"])] = food
-                if str_ids:
-                    for food in db["foods"].find({"_id": {"$in": str_ids}}):
-                        foods_map[food["_id"]] = food
-            # Build new meal_logs structure
-            new_meal_logs = []
-            for plate in export_data.get("meal_logs", []):
-                date = plate.get("date", "")
-                new_items = []
-                for item in plate.get("items", []):
-                    if "custom_macros" in item:
-                        n = item["custom_macros"]
-                        new_items.append({
-                            "name": n.get("name", "Custom Food"),
-                            "quantity": item.get("quantity", 1),
-                            "calories": n.get("calories", ""),
-                            "protein": n.get("protein", ""),
-                            "carbs": n.get("carbs", ""),
-                            "fat": n.get("totalFat", n.get("total_fat", "")),
-                            "type": "Custom"
-                        })
-                    else:
-                        food_id = item.get("food_id", "")
-                        food = foods_map.get(str(food_id))
-                        if food:
-                            n = food.get("nutrients", {})
-                            new_items.append({
-                                "name": food.get("name", ""),
-                                "quantity": item.get("quantity", 1),
-                                "calories": n.get("calories", ""),
-                                "protein": n.get("protein", ""),
-                                "carbs": n.get("total_carbohydrates", ""),
-                                "fat": n.get("total_fat", ""),
-                                "type": "Standard"
-                            })
-                        else:
-                            new_items.append({
-                                "name": "",
-                                "quantity": item.get("quantity", 1),
-                                "calories": "",
-                                "protein": "",
-                                "carbs": "",
-                                "fat": "",
-                                "type": "Standard"
-                            })
-                new_meal_logs.append({
-                    "date": date,
-                    "items": new_items
-                })
-            export_data["meal_logs"] = new_meal_logs
-        return JSONResponse(content=export_data)
-
-    # CSV Export (improved, sectioned and flattened)
-    if format == "csv":
-        output = io.StringIO()
-        writer = csv.writer(output)
-        # Profile Info
-        if selections.get("profile"):
-            writer.writerow(["Profile Info"])
-            writer.writerow(["Field", "Value"])
-            for k, v in export_data.get("profile", {}).items():
-                writer.writerow([k, f"'{v}" if v is not None else ""])
-            writer.writerow([])
-        # Weight History
-        if selections.get("weight"):
-            writer.writerow(["Weight History"])
-            writer.writerow(["Date", "Weight"])
-            for log in export_data.get("weight_history", []):
-                weight = log.get("weight", "")
-                writer.writerow([log.get("date", ""), f"'{weight}" if weight != "" else ""])
-            writer.writerow([])
-        # Meal Logs
-        if selections.get("meals"):
-            writer.writerow(["Meal Logs"])
-            writer.writerow(["Date", "Food Name", "Quantity", "Calories", "Protein", "Carbs", "Fat", "Type"])
-            # Collect all unique standard food_ids
-            food_ids = set()
-            for plate in export_data.get("meal_logs", []):
-                for item in plate.get("items", []):
-                    if "custom_macros" not in item:
-                        food_id = item.get("food_id", "")
-                        if food_id:
-                            food_ids.add(food_id)
-            # Batch fetch all foods
-            foods_map = {}
-            if food_ids:
-                from bson import ObjectId
-                object_ids = []
-                str_ids = []
-                for fid in food_ids:
-                    try:
-                        object_ids.append(ObjectId(fid))
-                    except Exception:
-                        str_ids.append(fid)
-                if object_ids:
-                    for food in db["foods"].find({"_id": {"$in": object_ids}}):
-                        foods_map[str(food["_id"])] = food
-                if str_ids:
-                    for food in db["foods"].find({"_id": {"$in": str_ids}}):
-                        foods_map[food["_id"]] = food
-            # Write meal log rows
-            for plate in export_data.get("meal_logs", []):
-                date = plate.get("date", "")
-                for item in plate.get("items", []):
-                    if "custom_macros" in item:
-                        n = item["custom_macros"]
-                        writer.writerow([
-                            date,
-                            n.get("name", "Custom Food"),
-                            item.get("quantity", 1),
-                            n.get("calories", ""),
-                            n.get("protein", ""),
-                            n.get("carbs", ""),
-                            n.get("totalFat", n.get("total_fat", "")),
-                            "Custom"
-                        ])
-                    else:
-                        food_id = item.get("food_id", "")
-                        food = foods_map.get(str(food_id))
-                        if food:
-                            n = food.get("nutrients", {})
-                            writer.writerow([
-                                date,
-                                food.get("name", ""),
-                                item.get("quantity", 1),
-                                n.get("calories", ""),
-                                n.get("protein", ""),
-                                n.get("total_carbohydrates", ""),
-                                n.get("total_fat", ""),
-                                "Standard"
-                            ])
-                        else:
-                            writer.writerow([
-                                date,
-                                "",
-                                item.get("quantity", 1),
-                                "", "", "", "",
-                                "Standard"
-                            ])
-            writer.writerow([])
-        output.seek(0)
-        return StreamingResponse(iter([output.getvalue()]), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=export.csv"})
-
-    # PDF Export
-    if format == "pdf":
-        try:
-            from fpdf import FPDF
-        except ImportError:
-            return JSONResponse({"error": "PDF export is temporarily unavailable. Please try CSV or JSON format instead."}, status_code=400)
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-
-        # Profile Info
-        if selections.get("profile"):
-            pdf.set_font("Arial", style="B", size=14)
-            pdf.cell(0, 10, "Profile Info", ln=1)
-            pdf.set_font("Arial", size=12)
-            profile = export_data.get("profile", {})
-            for k, v in profile.items():
-                pdf.cell(50, 8, str(k), border=1)
-                pdf.cell(0, 8, str(v), border=1, ln=1)
-            pdf.ln(5)
-
-        # Weight History
-        if selections.get("weight"):
-            pdf.set_font("Arial", style="B", size=14)
-            pdf.cell(0, 10, "Weight History", ln=1)
-            pdf.set_font("Arial", style="B", size=12)
-            pdf.cell(40, 8, "Date", border=1)
-            pdf.cell(40, 8, "Weight", border=1, ln=1)
-            pdf.set_font("Arial", size=12)
-            for log in export_data.get("weight_history", []):
-                pdf.cell(40, 8, str(log.get("date", "")), border=1)
-                pdf.cell(40, 8, str(log.get("weight", "")), border=1, ln=1)
-            pdf.ln(5)
-
-        # Meal Logs
-        if selections.get("meals"):
-            pdf.set_font("Arial", style="B", size=14)
-            pdf.cell(0, 10, "Meal Logs", ln=1)
-            pdf.set_font("Arial", style="B", size=12)
-            pdf.cell(30, 8, "Date", border=1)
-            pdf.cell(40, 8, "Food Name", border=1)
-            pdf.cell(20, 8, "Qty", border=1)
-            pdf.cell(20, 8, "Cal", border=1)
-            pdf.cell(20, 8, "Protein", border=1)
-            pdf.cell(20, 8, "Carbs", border=1)
-            pdf.cell(20, 8, "Fat", border=1)
-            pdf.cell(20, 8, "Type", border=1, ln=1)
-            pdf.set_font("Arial", size=12)
-            # Collect all unique standard food_ids
-            food_ids = set()
-            for plate in export_data.get("meal_logs", []):
-                for item in plate.get("items", []):
-                    if "custom_macros" not in item:
-                        food_id = item.get("food_id", "")
-                        if food_id:
-                            food_ids.add(food_id)
-            # Batch fetch all foods
-            foods_map = {}
-            if food_ids:
-                from bson import ObjectId
-                object_ids = []
-                str_ids = []
-                for fid in food_ids:
-                    try:
-                        object_ids.append(ObjectId(fid))
-                    except Exception:
-                        str_ids.append(fid)
-                if object_ids:
-                    for food in db["foods"].find({"_id": {"$in": object_ids}}):
-                        foods_map[str(food["_id"])] = food
-                if str_ids:
-                    for food in db["foods"].find({"_id": {"$in": str_ids}}):
-                        foods_map[food["_id"]] = food
-            for plate in export_data.get("meal_logs", []):
-                date = plate.get("date", "")
-                for item in plate.get("items", []):
-                    if "custom_macros" in item:
-                        n = item["custom_macros"]
-                        pdf.cell(30, 8, str(date), border=1)
-                        pdf.cell(40, 8, str(n.get("name", "Custom Food")), border=1)
-                        pdf.cell(20, 8, str(item.get("quantity", 1)), border=1)
-                        pdf.cell(20, 8, str(n.get("calories", "")), border=1)
-                        pdf.cell(20, 8, str(n.get("protein", "")), border=1)
-                        pdf.cell(20, 8, str(n.get("carbs", "")), border=1)
-                        pdf.cell(20, 8, str(n.get("totalFat", n.get("total_fat", ""))), border=1)
-                        pdf.cell(20, 8, "Custom", border=1, ln=1)
-                    else:
-                        food_id = item.get("food_id", "")
-                        food = foods_map.get(str(food_id))
-                        if food:
-                            n = food.get("nutrients", {})
-                            pdf.cell(30, 8, str(date), border=1)
-                            food_name = str(food.get("name", ""))
-                            # Handle special characters by replacing problematic ones
-                            safe_food_name = food_name.encode('latin-1', 'replace').decode('latin-1')
-                            pdf.cell(40, 8, safe_food_name, border=1)
-                            pdf.cell(20, 8, str(item.get("quantity", 1)), border=1)
-                            pdf.cell(20, 8, str(n.get("calories", "")), border=1)
-                            pdf.cell(20, 8, str(n.get("protein", "")), border=1)
-                            pdf.cell(20, 8, str(n.get("total_carbohydrates", "")), border=1)
-                            pdf.cell(20, 8, str(n.get("total_fat", "")), border=1)
-                            pdf.cell(20, 8, "Standard", border=1, ln=1)
-                        else:
-                            pdf.cell(30, 8, str(date), border=1)
-                            pdf.cell(40, 8, "", border=1)
-                            pdf.cell(20, 8, str(item.get("quantity", 1)), border=1)
-                            pdf.cell(20, 8, "", border=1)
-                            pdf.cell(20, 8, "", border=1)
-                            pdf.cell(20, 8, "", border=1)
-                            pdf.cell(20, 8, "", border=1)
-                            pdf.cell(20, 8, "Standard", border=1, ln=1)
-            pdf.ln(5)
-        pdf_bytes = pdf.output(dest='S')
-        return StreamingResponse(io.BytesIO(pdf_bytes), media_type="application/pdf", headers={"Content-Disposition": "attachment; filename=export.pdf"})
-
-    return JSONResponse({"error": "Invalid format."}, status_code=400)
+    compress = bool(body.get("compress", False))
+
+    if format not in data_export.FORMATS:
+        return JSONResponse({"error": "Invalid format."}, status_code=400)
+    if format == "pdf" and not data_export.pdf_available():
+        return JSONResponse({"error": "PDF export is temporarily unavailable. Please try CSV or JSON format instead."}, status_code=400)
+
+    if data_export.needs_background_job(db, user_id, format, selections):
+        job = data_export.start_export_job(db, user, format, selections, compress)
+        return JSONResponse(data_export.serialize_job(job), status_code=202)
+
+    chunks = data_export.STREAM_WRITERS[format](db, user, selections)
+    filename = data_export.export_filename(format, compress)
+    return StreamingResponse(
+        data_export.encode_chunks(chunks, compress),
+        media_type=data_export.export_media_type(format, compress),
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@app.get("/api/export-jobs/{job_id}")
+def get_export_job_status(job_id: str, request: Request):
+    """Status of a background export job"""
+    user_id = get_current_user_id(request, users_collection)
+    job = data_export.get_export_job(db, job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return data_export.serialize_job(job)
+
+@app.get("/api/export-jobs/{job_id}/download")
+def download_export_job(job_id: str, request: Request):
+    """Download the artifact of a finished export job"""
+    user_id = get_current_user_id(request, users_collection)
+    job = data_export.get_export_job(db, job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job["status"] != "done" or not job.get("path") or not os.path.exists(job["path"]):
+        raise HTTPException(status_code=409, detail=f"Export is not ready (status: {job['status']})")
+    return FileResponse(job["path"], media_type=job["media_type"], filename=job["filename"])
 
 @app.get('/auth/google/login')
 async def google_login(request: Request):
@@ -1533,7 +1201,7 @@ async def google_auth(request: Request):
             logger.info(f"New OAuth user created successfully")
         
         # Issue JWT/cookie
-        jwt_token = create_access_token({"sub": email})
+        jwt_token = create_access_token({"sub": email, "uid": str(db_user["_id"])})
         
         # Pass token via URL for cross-domain auth
         redirect_url = f"{FRONTEND_URL}/auth/callback?token={jwt_token}"
@@ -1548,15 +1216,17 @@ async def google_auth(request: Request):
         return RedirectResponse(url=f"{FRONTEND_URL}/login?error=user_processing_failed")
 
 @app.post("/api/account/set-password")
-def set_password(request: Request, new_password: str = Body(...)):
-    user = get_current_user(request, users_collection)
+async def set_password(request: Request, new_password: str = Body(...)):
+    user = await run_in_threadpool(get_current_user, request, users_collection)
     if user.get("hashed_password"):
         raise HTTPException(status_code=400, detail="Password already set.")
-    hashed_pw = hash_password(new_password)
-    users_collection.update_one(
+    hashed_pw = await hash_password_async(new_password)
+    await run_in_threadpool(
+        users_collection.update_one,
         {"email": user["email"]},
         {"$set": {"hashed_password": hashed_pw}}
     )
+    invalidate_user_cache(user["email"])
     return {"message": "Password set successfully"}
 
 @app.post("/api/auth/forgot-password")
@@ -1568,7 +1238,7 @@ async def forgot_password(request: dict = Body(...)):
             raise HTTPException(status_code=400, detail="Email is required")
             
         # Check if user exists
-        user = get_user_by_email(users_collection, email)
+        user = await run_in_threadpool(get_user_by_email, users_collection, email)
         if not user:
             # For security, always return success even if user doesn't exist
             return {"message": "If the email exists in our system, a reset link has been sent."}
@@ -1577,10 +1247,12 @@ async def forgot_password(request: dict = Body(...)):
         reset_token = create_access_token({"sub": email, "type": "reset"}, expires_delta=timedelta(hours=1))
         
         # Store reset token in database (optional - for token invalidation)
-        users_collection.update_one(
+        await run_in_threadpool(
+            users_collection.update_one,
             {"email": email},
             {"$set": {"reset_token": reset_token, "reset_token_expires": time.time() + 3600}}
         )
+        invalidate_user_cache(email)
         
         # Send password reset email
         from email_util import send_password_reset_email
@@ -1607,7 +1279,7 @@ async def reset_password(token: str = Body(...), new_password: str = Body(...)):
             raise HTTPException(status_code=400, detail="Invalid reset token")
         
         email = payload["sub"]
-        user = get_user_by_email(users_collection, email)
+        user = await run_in_threadpool(get_user_by_email, users_collection, email)
         if not user:
             raise HTTPException(status_code=400, detail="User not found")
         
@@ -1616,14 +1288,16 @@ async def reset_password(token: str = Body(...), new_password: str = Body(...)):
             raise HTTPException(status_code=400, detail="Reset token has expired")
         
         # Hash new password and update user
-        hashed_password = hash_password(new_password)
-        users_collection.update_one(
+        hashed_password = await hash_password_async(new_password)
+        await run_in_threadpool(
+            users_collection.update_one,
             {"email": email},
             {
                 "$set": {"hashed_password": hashed_password},
                 "$unset": {"reset_token": "", "reset_token_expires": ""}
             }
         )
+        invalidate_user_cache(email)
         
         return {"message": "Password reset successfully"}
         
@@ -1632,42 +1306,34 @@ async def reset_password(token: str = Body(...), new_password: str = Body(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to reset password")
 
-# Production-optimized static file serving
-class CacheControlMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        # Add caching headers for static assets
-        if request.url.path.startswith("/static/"):
-            # Cache static assets for 1 year (they have content hashes)
-            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
-            response.headers["Expires"] = (datetime.now() + timedelta(days=365)).strftime("%a, %d %b %Y %H:%M:%S GMT")
-        
-        return response
-
-app.add_middleware(CacheControlMiddleware)
-
 # Static files removed - using Cloudinary for profile images
 
 
 @app.get("/api/available-options")
 def get_available_options(date: str):
-    dining_halls = foods_collection.distinct("dining_hall", {"date": date})
+    # One index-covered aggregation instead of a distinct() per dining hall
     meal_types_by_hall = {}
-    for hall in dining_halls:
-        meal_types = foods_collection.distinct("meal_name", {"date": date, "dining_hall": hall})
-        meal_types_by_hall[hall] = sorted(meal_types)
+    for combination in compute_coverage(menu_collection(db), date):
+        meal_types_by_hall.setdefault(combination["dining_hall"], []).append(combination["meal_name"])
     return {
-        "dining_halls": sorted(dining_halls),
-        "meal_types_by_hall": meal_types_by_hall
+        "dining_halls": sorted(meal_types_by_hall),
+        "meal_types_by_hall": {hall: sorted(meals) for hall, meals in meal_types_by_hall.items()}
     }
 
+@app.get("/api/scrape-coverage")
+def get_scrape_coverage(date: str, campus: str = DEFAULT_CAMPUS):
+    """Return the persisted scrape coverage of a campus for a date (hall, meal, count, last update)"""
+    coverage = serialize_coverage(get_coverage(db, date, campus))
+    if not coverage:
+        raise HTTPException(status_code=404, detail="No scrape coverage recorded for this date")
+    return coverage
+
 @app.get("/api/meal-plan/rate-limit-status")
 def get_meal_plan_rate_limit_status(req: Request):
     """Get current rate limit status for AI meal plan generation"""
     try:
-        user = get_current_user(req, users_collection)
-        status = get_rate_limit_status(user["_id"], users_collection)
+        user_id = get_current_user_id(req, users_collection)
+        status = get_rate_limit_status(user_id, ai_usage_collection)
         return status
     except HTTPException:
         raise
@@ -1677,17 +1343,19 @@ def get_meal_plan_rate_limit_status(req: Request):
 
 @app.post("/api/meal-plan", response_model=MealPlanResponse)
 def generate_meal_plan(request_body: MealPlanRequest, req: Request):
+    requested_at = None
     try:
         # Get current user
         user = get_current_user(req, users_collection)
-        user_doc = users_collection.find_one({"_id": ObjectId(user["_id"])})
-        user_profile = user_doc.get("profile", {})
+        user_profile = user.get("profile", {})
 
-        # Check rate limit (will raise HTTPException if exceeded)
-        # check_rate_limit(user["_id"], users_collection)  # DISABLED FOR TESTING
+        # Check rate limit and record the request atomically (raises HTTPException if exceeded)
+        if AI_MEAL_PLAN_RATE_LIMIT_ENABLED:
+            requested_at = reserve_meal_plan_request(str(user["_id"]), ai_usage_collection)
 
         # Calculate nutrition targets
-        target_calories, target_macros = get_user_targets(request_body, user_profile)
+        profile_targets = get_targets(users_collection, user) if request_body.use_profile_data else None
+        target_calories, target_macros = get_user_targets(request_body, user_profile, profile_targets)
         meal_targets = calculate_meal_targets(target_calories, target_macros)
 
         # Convert Pydantic models to dicts for meal planning functions
@@ -1721,7 +1389,7 @@ def generate_meal_plan(request_body: MealPlanRequest, req: Request):
                 detail="AI meal planning temporarily unavailable. Please contact support."
             )
 
-        ai_planner = MealPlannerAI(anthropic_key)
+        ai_planner = meal_planner.get()
         ai_meal_plan = ai_planner.generate_meal_plan(
             foods_by_meal, meal_targets, dietary_labels, dining_hall_meals_dicts, user_profile
         )
@@ -1739,14 +1407,16 @@ def generate_meal_plan(request_body: MealPlanRequest, req: Request):
             target_calories, target_macros, request_body.date
         )
 
-        # Record successful meal plan generation for rate limiting
-        # record_meal_plan_request(user["_id"], users_collection)  # DISABLED FOR TESTING
-
         return response
 
     except HTTPException:
+        # Only successful generations count against the limit
+        if requested_at:
+            release_meal_plan_request(str(user["_id"]), requested_at, ai_usage_collection)
         raise
     except Exception as e:
+        if requested_at:
+            release_meal_plan_request(str(user["_id"]), requested_at, ai_usage_collection)
         logging.error(f"Meal plan generation error: {str(e)}")
         raise HTTPException(
             status_code=500,
@@ -4,6 +4,9 @@ Food filtering and dietary preference handling for meal planning
 from typing import List, Dict, Tuple
 import logging
 
+from allergens import exclude_allergens_query, profile_allergens
+from food_catalog import find_menu_foods
+
 logger = logging.getLogger(__name__)
 
 def has_complete_macros(food: Dict) -> bool:
@@ -145,6 +148,7 @@ def get_filtered_foods_for_meal_plan(
         Dict with keys:
             - foods_by_meal: Dict[str, List[Dict]]
             - dietary_labels: List[str]
+            - excluded_allergens: List[str]
     """
     # Build base query for available foods
     base_query = {
@@ -182,6 +186,13 @@ def get_filtered_foods_for_meal_plan(
 
         base_query["$or"].extend(meal_conditions)
 
+    # Exclude foods flagged with the user's allergens in the query itself, so
+    # unsafe foods never reach the prompt (this filter is never relaxed)
+    excluded_allergens = profile_allergens(user_profile, getattr(request, "allergens_to_avoid", None) or [])
+    if excluded_allergens:
+        base_query.update(exclude_allergens_query(excluded_allergens))
+        logger.info(f"Excluding foods with allergens: {excluded_allergens}")
+
     # Extract dietary labels
     dietary_labels = extract_dietary_labels(request, user_profile)
 
@@ -191,7 +202,7 @@ def get_filtered_foods_for_meal_plan(
         logger.info(f"Applied dietary label filters: {dietary_labels}")
 
     # Execute query
-    available_foods = list(foods_collection.find(base_query))
+    available_foods = find_menu_foods(foods_collection.database, base_query)
     logger.info(f"Found {len(available_foods)} foods matching criteria")
 
     # Filter for trackable foods (complete macros)
@@ -212,7 +223,7 @@ def get_filtered_foods_for_meal_plan(
 
         # Remove strict label requirement
         base_query.pop("labels", None)
-        all_foods = list(foods_collection.find(base_query))
+        all_foods = find_menu_foods(foods_collection.database, base_query)
         trackable_foods = [f for f in all_foods if has_complete_macros(f)]
 
         # Sort to prioritize foods with preferred labels
@@ -225,7 +236,8 @@ def get_filtered_foods_for_meal_plan(
 
     return {
         "foods_by_meal": foods_by_meal,
-        "dietary_labels": dietary_labels
+        "dietary_labels": dietary_labels,
+        "excluded_allergens": excluded_allergens
     }
 
 def organize_foods_by_meal(
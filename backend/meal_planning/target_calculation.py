@@ -1,7 +1,7 @@
 """
 Target calculation and macro distribution for meal planning
 """
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 import logging
 from datetime import datetime
 
@@ -29,10 +29,25 @@ def get_activity_multiplier(activity_level: str) -> float:
     }
     return multipliers.get(activity_level.lower(), 1.2)
 
+def calculate_age(birthday, today: Optional[datetime] = None) -> int:
+    """
+    Age in whole years on `today` (defaults to now); 30 if no birthday is set
+    """
+    if not birthday:
+        return 30  # default
+    if isinstance(birthday, str):
+        birthdate = datetime.strptime(birthday[:10], "%Y-%m-%d")
+    else:
+        birthdate = birthday
+    today = today or datetime.today()
+    return today.year - birthdate.year - ((today.month, today.day) < (birthdate.month, birthdate.day))
+
 def calculate_energy_target_from_profile(user_profile: Dict) -> int:
     """
     Calculate daily energy target from user profile data
-    Similar to the existing get_energy_target endpoint logic
+
+    Callers serving requests should read the cached value through
+    user_targets.get_targets instead of calling this directly.
     """
     sex = user_profile.get("sex", "male")
     weight_lbs = user_profile.get("weight", 150)
@@ -47,16 +62,7 @@ def calculate_energy_target_from_profile(user_profile: Dict) -> int:
     weight_kg = float(weight_lbs) * 0.453592
     height_cm = float(height_in) * 2.54
 
-    # Calculate age
-    if birthday:
-        if isinstance(birthday, str):
-            birthdate = datetime.strptime(birthday[:10], "%Y-%m-%d")
-        else:
-            birthdate = birthday
-        today = datetime.today()
-        age = today.year - birthdate.year - ((today.month, today.day) < (birthdate.month, birthdate.day))
-    else:
-        age = 30  # default
+    age = calculate_age(birthday)
 
     # Calculate BMR and TDEE
     bmr = calculate_bmr(sex, weight_kg, height_cm, age)
@@ -125,17 +131,27 @@ def validate_macro_percentages(protein_pct: float, carbs_pct: float, fat_pct: fl
     total = protein_pct + carbs_pct + fat_pct
     return abs(total - 100.0) <= 0.01  # Allow small floating point errors
 
-def get_user_targets(request, user_profile: Dict) -> Tuple[int, Dict[str, float]]:
+def get_user_targets(request, user_profile: Dict, profile_targets: Optional[Dict] = None) -> Tuple[int, Dict[str, float]]:
     """
     Get target calories and macros based on request preferences
 
+    Args:
+        request: Meal plan request
+        user_profile: User's profile
+        profile_targets: Cached targets from user_targets.get_targets; computed
+            from the profile if not given
+
     Returns:
         Tuple of (target_calories, target_macros_dict)
     """
     if request.use_profile_data:
         # Get from user profile
-        target_calories = calculate_energy_target_from_profile(user_profile)
-        target_macros = get_macro_targets_from_profile(user_profile)
+        if profile_targets:
+            target_calories = profile_targets["daily_calories"]
+            target_macros = dict(profile_targets["macro_percentages"])
+        else:
+            target_calories = calculate_energy_target_from_profile(user_profile)
+            target_macros = get_macro_targets_from_profile(user_profile)
 
         # Log profile data being used
         logger.info(f"Profile data - weight: {user_profile.get('weight')}, height: {user_profile.get('height')}, activity: {user_profile.get('activity_level')}")
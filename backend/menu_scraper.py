@@ -7,7 +7,9 @@ import logging
 import traceback
 import re
 import os
-from typing import Dict, List, Optional, Any
+import argparse
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Any
 from contextlib import contextmanager
 
 # Selenium imports
@@ -41,12 +43,19 @@ from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from fake_useragent import UserAgent
 
+from scrape_coverage import campus_from_url, refresh_coverage
+from food_catalog import USE_FOOD_CATALOG, menu_collection, record_foods
+from scrape_checkpoint import CheckpointLog
+from allergens import annotate_allergens
+
 
 class DiningHallScraper:
     """A robust web scraper for dining hall menu data with null handling for missing nutrition data."""
     
-    def __init__(self, target_url: str, mongodb_uri: Optional[str] = None, max_retries: int = 3, headless: bool = False):
+    def __init__(self, target_url: str, mongodb_uri: Optional[str] = None, max_retries: int = 3, headless: bool = False,
+                 campus: Optional[str] = None):
         self.target_url = target_url
+        self.campus = campus or campus_from_url(target_url)
         self.mongodb_uri = mongodb_uri or os.getenv("MONGODB_URI")
         self.max_retries = max_retries
         self.headless = headless
@@ -81,6 +90,9 @@ class DiningHallScraper:
         
         # Track failed items to avoid infinite loops
         self.failed_items = set()
+        
+        # Append-only checkpoint log for the current run (see scrape_checkpoint.py)
+        self.checkpoint: Optional[CheckpointLog] = None
     
     def _setup_logging(self):
         """Configure logging with both file and console output."""
@@ -742,14 +754,28 @@ class DiningHallScraper:
         self.logger.error(f"All attempts failed for {dining_hall_name}")
         return []
     
-    def scrape_all_dining_halls(self) -> Dict[str, Any]:
-        """Main scraping method with simple crash recovery."""
+    def scrape_all_dining_halls(self, checkpoint: Optional[CheckpointLog] = None) -> Dict[str, Any]:
+        """
+        Main scraping method with simple crash recovery.
+        
+        Every scraped meal is appended to the checkpoint log as soon as it is
+        extracted; halls already completed in the log (when resuming) are skipped.
+        
+        Args:
+            checkpoint: Log to append to (default: a fresh log for today)
+        
+        Returns:
+            {"date": str, "dining_halls": [completed hall names], "checkpoint": CheckpointLog}
+        """
         self.logger.info(f"Starting scrape of {self.target_url} (headless={self.headless})")
         
+        today = datetime.date.today().isoformat()
+        self.checkpoint = checkpoint or CheckpointLog.open("menu_scraper", today, self.campus)
         self.driver = None
         all_dining_hall_data = {
-            "date": datetime.date.today().isoformat(),
-            "dining_halls": []
+            "date": today,
+            "dining_halls": self.checkpoint.completed_halls(),
+            "checkpoint": self.checkpoint
         }
         
         try:
@@ -776,23 +802,23 @@ class DiningHallScraper:
             # Process each dining hall with recovery
             for idx, dining_hall_name in enumerate(dining_hall_names):
                 try:
+                    if self.checkpoint.is_hall_complete(dining_hall_name):
+                        self.logger.info(f"Skipping dining hall {idx + 1}/{len(dining_hall_names)}: {dining_hall_name} - already in checkpoint")
+                        continue
+                    
                     self.logger.info(f"Processing dining hall {idx + 1}/{len(dining_hall_names)}: {dining_hall_name}")
                     
                     # Clear failed items for each dining hall
                     self.failed_items.clear()
                     
-                    # Use recovery version
+                    # Use recovery version (meals are checkpointed as they are scraped)
                     meals_data = self._process_dining_hall_with_recovery(dining_hall_name)
                     
-                    if meals_data:
-                        all_dining_hall_data["dining_halls"].append({
-                            "name": dining_hall_name,
-                            "meals": meals_data
-                        })
-                        self.logger.info(f"✓ Successfully processed {dining_hall_name}")
-                        
-                        # Save progress checkpoint
-                        self._save_progress_checkpoint(all_dining_hall_data, idx + 1)
+                    if meals_data or self.checkpoint.has_meals(dining_hall_name):
+                        self.checkpoint.mark_hall_complete(dining_hall_name)
+                        all_dining_hall_data["dining_halls"].append(dining_hall_name)
+                        self.logger.info(f"✓ Successfully processed {dining_hall_name} "
+                                         f"({len(all_dining_hall_data['dining_halls'])}/{len(dining_hall_names)} halls checkpointed)")
                     else:
                         self.logger.warning(f"✗ No meals found for {dining_hall_name}")
                     
@@ -833,35 +859,6 @@ class DiningHallScraper:
                     pass
                 self.logger.info("Driver session closed")
     
-    def _save_progress_checkpoint(self, data: Dict[str, Any], hall_number: int):
-        """Save progress after each dining hall."""
-        try:
-            filename = f"progress_after_{hall_number}_halls.json"
-            with open(filename, "w") as f:
-                json.dump(data, f, indent=2)
-            
-            # Also save a summary
-            summary = {
-                "completed_halls": len(data["dining_halls"]),
-                "total_items": sum(
-                    len(item) 
-                    for hall in data["dining_halls"] 
-                    for meal in hall["meals"] 
-                    for station in meal["stations"] 
-                    for item in station["items"]
-                ),
-                "last_completed": data["dining_halls"][-1]["name"] if data["dining_halls"] else None,
-                "timestamp": datetime.datetime.now().isoformat()
-            }
-            
-            with open("scrape_progress_summary.json", "w") as f:
-                json.dump(summary, f, indent=2)
-                
-            self.logger.info(f"✓ Progress saved: {summary['completed_halls']} halls, {summary['total_items']} items")
-            
-        except Exception as e:
-            self.logger.warning(f"Failed to save progress: {e}")
-    
     def _get_dining_hall_names(self) -> List[str]:
         """Get list of all available dining halls."""
         try:
@@ -918,6 +915,10 @@ class DiningHallScraper:
             # Process each meal
             for meal_name in meal_tabs:
                 try:
+                    if self.checkpoint and self.checkpoint.is_meal_complete(dining_hall_name, meal_name):
+                        self.logger.info(f"Skipping meal: {meal_name} - already in checkpoint")
+                        continue
+                    
                     if not self.is_driver_alive():
                         self.logger.error("Driver died during meal processing")
                         break
@@ -932,6 +933,8 @@ class DiningHallScraper:
                                 "meal_name": meal_name,
                                 "stations": stations_data
                             })
+                            if self.checkpoint:
+                                self.checkpoint.append_meal(dining_hall_name, meal_name, stations_data)
                 
                 except Exception as e:
                     self.logger.error(f"Error processing meal {meal_name}: {e}")
@@ -1036,7 +1039,8 @@ class DiningHallScraper:
                             "meal_name": meal["meal_name"],
                             "station": station["name"],
                             "station_id": station_id,
-                            "date": date
+                            "date": date,
+                            "campus": self.campus
                         })
                         
                         
@@ -1049,8 +1053,19 @@ class DiningHallScraper:
         self.logger.info(f"Saved {len(foods)} foods to {filename}")
         return foods
     
-    def upload_to_mongodb(self, foods: List[Dict[str, Any]]) -> bool:
-        """Upload foods data to MongoDB."""
+    def upload_to_mongodb(self, foods: Iterable[Dict[str, Any]], replace_all_today: bool = True) -> bool:
+        """
+        Upload foods data to MongoDB.
+        
+        Foods are consumed in batches, so a generator (e.g. CheckpointLog.iter_foods())
+        is uploaded without materializing the whole scrape.
+        
+        Args:
+            foods: Food documents produced by save_to_json or a checkpoint log
+            replace_all_today: Delete all of today's items first (full scrape). When False
+                only the dining hall / meal combinations present in foods are replaced,
+                so incremental and concurrent scrapes leave other halls untouched.
+        """
         if not self.mongodb_uri:
             self.logger.warning("MongoDB URI not provided")
             return False
@@ -1058,23 +1073,60 @@ class DiningHallScraper:
         try:
             client = MongoClient(self.mongodb_uri, server_api=ServerApi('1'), tlsCAFile=certifi.where())
             db = client["nutritionapp"]
-            collection = db["foods"]
+            collection = menu_collection(db)
             
-            # Clear existing data for today
+            # Clear existing data for today (or, below, just for the combinations being uploaded)
             today = datetime.date.today().isoformat()
-            collection.delete_many({"date": today})
+            if replace_all_today:
+                collection.delete_many({"date": today, "campus": self.campus})
+            replaced = set()
+            # (dining hall, meal) combinations uploaded in this run, fresh as of now
+            uploaded = set()
             
             # Insert new data in batches to avoid memory issues
             batch_size = 100
             total_inserted = 0
+            foods = iter(foods)
+            batch_number = 0
             
-            for i in range(0, len(foods), batch_size):
-                batch = foods[i:i + batch_size]
-                result = collection.insert_many(batch)
-                total_inserted += len(result.inserted_ids)
-                self.logger.info(f"Uploaded batch {i//batch_size + 1}: {len(result.inserted_ids)} documents")
+            while True:
+                batch = list(islice(foods, batch_size))
+                if not batch:
+                    break
+                batch_number += 1
+                # Allergen flags are derived once here so queries can filter on them
+                annotate_allergens(batch)
+                uploaded |= {(food["dining_hall"], food["meal_name"]) for food in batch}
+                
+                if not replace_all_today:
+                    # Replace each combination the first time it shows up, before inserting it
+                    combinations = {(food["dining_hall"], food["meal_name"]) for food in batch} - replaced
+                    if combinations:
+                        collection.delete_many({
+                            "date": today,
+                            "campus": self.campus,
+                            "$or": [{"dining_hall": hall, "meal_name": meal} for hall, meal in combinations]
+                        })
+                        replaced |= combinations
+                
+                if USE_FOOD_CATALOG:
+                    # Unique foods go to the catalog once; today's menu is stored as slim occurrences
+                    stats = record_foods(db, batch, batch_size=batch_size)
+                    total_inserted += stats["menu_items"]
+                    self.logger.info(f"Recorded batch {batch_number}: {stats['foods']} foods as {stats['menu_items']} menu items")
+                else:
+                    result = collection.insert_many(batch)
+                    total_inserted += len(result.inserted_ids)
+                    self.logger.info(f"Uploaded batch {batch_number}: {len(result.inserted_ids)} documents")
             
             self.logger.info(f"Total uploaded: {total_inserted} documents to MongoDB")
+            
+            # Keep the persisted coverage document in sync with the new data
+            try:
+                refresh_coverage(db, today, self.campus, scraped=uploaded)
+            except Exception as e:
+                self.logger.warning(f"Failed to refresh scrape coverage: {e}")
+            
             return True
         
         except Exception as e:
@@ -1084,6 +1136,11 @@ class DiningHallScraper:
 
 def main():
     """Main execution function with improved error handling."""
+    parser = argparse.ArgumentParser(description="Campus Nutrition Menu Scraper")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue today's interrupted run from its checkpoint log")
+    args = parser.parse_args()
+    
     load_dotenv()
     
     # Configuration
@@ -1119,18 +1176,21 @@ def main():
                         scraper.logger.info("Continuing with JSON-only output...")
                         MONGODB_URI = None
         
-        # Scrape data
-        scraped_data = scraper.scrape_all_dining_halls()
+        # Scrape data (meals are appended to the checkpoint log as they are scraped)
+        checkpoint = CheckpointLog.open("menu_scraper", datetime.date.today().isoformat(), scraper.campus,
+                                        resume=args.resume)
+        scraped_data = scraper.scrape_all_dining_halls(checkpoint)
         
         if scraped_data.get("dining_halls"):
-            # Save to JSON
-            foods = scraper.save_to_json(scraped_data)
+            # Save to JSON, streaming from the checkpoint log
+            food_count = checkpoint.export_json("foods.json")
+            scraper.logger.info(f"Saved {food_count} foods to foods.json")
             
             # Upload to MongoDB
-            if MONGODB_URI and foods:
-                scraper.upload_to_mongodb(foods)
+            if MONGODB_URI and food_count:
+                scraper.upload_to_mongodb(checkpoint.iter_foods())
             
-            scraper.logger.info(f"Scraping process completed successfully - {len(foods)} items processed")
+            scraper.logger.info(f"Scraping process completed successfully - {food_count} items processed")
         else:
             scraper.logger.warning("No data was scraped")
     
@@ -0,0 +1,156 @@
+"""
+Lightweight in-process metrics.
+
+Counters, gauges and latency histograms kept in memory per worker process
+and exposed as JSON by the /api/metrics endpoint. There is no external
+metrics dependency; each uvicorn worker reports its own numbers.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+# Latency bucket upper bounds in milliseconds
+DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_lock = threading.Lock()
+
+
+class Counter:
+    """Monotonically increasing count."""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        with _lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """Value that goes up and down (queue depth, in-flight work)."""
+
+    def __init__(self):
+        self.value = 0
+        self.max = 0
+
+    def inc(self, amount: int = 1):
+        with _lock:
+            self.value += amount
+            self.max = max(self.max, self.value)
+
+    def dec(self, amount: int = 1):
+        with _lock:
+            self.value -= amount
+
+    def snapshot(self):
+        return {"value": self.value, "max": self.max}
+
+
+class Histogram:
+    """Latency distribution in milliseconds with fixed buckets."""
+
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float):
+        index = len(self.buckets_ms)
+        for i, bound in enumerate(self.buckets_ms):
+            if value_ms <= bound:
+                index = i
+                break
+        with _lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ms += value_ms
+            self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, fraction: float) -> float:
+        """Approximate percentile (upper bound of the bucket it falls in)."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return float(self.buckets_ms[i]) if i < len(self.buckets_ms) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 2)
+        }
+
+
+_counters: Dict[str, Counter] = {}
+_gauges: Dict[str, Gauge] = {}
+_histograms: Dict[str, Histogram] = {}
+
+
+def counter(name: str) -> Counter:
+    with _lock:
+        return _counters.setdefault(name, Counter())
+
+
+def gauge(name: str) -> Gauge:
+    with _lock:
+        return _gauges.setdefault(name, Gauge())
+
+
+def histogram(name: str, buckets_ms=DEFAULT_BUCKETS_MS) -> Histogram:
+    with _lock:
+        return _histograms.setdefault(name, Histogram(buckets_ms))
+
+
+@contextmanager
+def timed(name: str):
+    """Record the duration of the with-block in the named histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram(name).observe((time.perf_counter() - start) * 1000)
+
+
+def hit_rates() -> Dict[str, float]:
+    """Hit rate of every cache counted as <name>_hits / <name>_misses, as <name>_hit_rate."""
+    rates = {}
+    for name, hits in _counters.items():
+        if not name.endswith("_hits"):
+            continue
+        prefix = name[:-len("_hits")]
+        misses = _counters.get(f"{prefix}_misses")
+        total = hits.value + (misses.value if misses else 0)
+        rates[f"{prefix}_hit_rate"] = round(hits.value / total, 4) if total else 0.0
+    return rates
+
+
+def snapshot() -> Dict[str, Dict]:
+    """All metrics of this process as a JSON-friendly dict."""
+    return {
+        "counters": {name: c.snapshot() for name, c in sorted(_counters.items())},
+        "gauges": {name: g.snapshot() for name, g in sorted(_gauges.items())},
+        "histograms": {name: h.snapshot() for name, h in sorted(_histograms.items())},
+        "hit_rates": dict(sorted(hit_rates().items()))
+    }
+
+
+def reset():
+    """Forget every metric (used by benchmarks)."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
@@ -0,0 +1,204 @@
+"""
+Pure-ASGI middleware for the API.
+
+These replace the BaseHTTPMiddleware classes that used to live in main.py.
+BaseHTTPMiddleware runs every request through an extra task plus a memory
+stream per layer and re-wraps streaming bodies (such as the AI chat SSE
+endpoint). The classes here only look at the http.response.start message:
+
+- header lists are encoded to bytes once, at startup
+- path rules are resolved by prefix when the request arrives
+- http.response.body messages are forwarded unchanged (zero-copy)
+
+benchmarks/bench_middleware.py compares the per-request overhead of this
+stack with the previous BaseHTTPMiddleware one.
+"""
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from rate_limiter import SlidingWindowLimiter
+
+logger = logging.getLogger(__name__)
+
+RawHeaders = List[Tuple[bytes, bytes]]
+
+
+def encode_headers(headers: Iterable[Tuple[str, str]]) -> RawHeaders:
+    """Encode (name, value) pairs into ASGI raw headers."""
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+
+def get_header(scope, name: bytes) -> Optional[str]:
+    """Read a request header from the ASGI scope (name must be lowercase bytes)."""
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def get_client_ip(scope) -> str:
+    """Get client IP from proxy headers or the connection."""
+    # Check for forwarded headers first (behind proxy)
+    forwarded_for = get_header(scope, b"x-forwarded-for")
+    if forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+
+    real_ip = get_header(scope, b"x-real-ip")
+    if real_ip:
+        return real_ip
+
+    # Fallback to client host
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class PrefixRules:
+    """Maps request paths to values by exact path or longest matching prefix."""
+
+    def __init__(self, exact: Optional[Dict[str, object]] = None, prefixes: Optional[Dict[str, object]] = None):
+        self.exact = dict(exact or {})
+        # Longest prefix first so "/api/auth/" wins over "/api/"
+        self.prefixes = sorted((prefixes or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def match(self, path: str):
+        value = self.exact.get(path)
+        if value is not None:
+            return value
+        for prefix, value in self.prefixes:
+            if path.startswith(prefix):
+                return value
+        return None
+
+
+class ResponseHeadersMiddleware:
+    """
+    Add fixed headers to every response, plus extra headers for path prefixes.
+
+    Replaces SecurityHeadersMiddleware and CacheControlMiddleware. Headers the
+    app already set with the same name are overridden, as before.
+    """
+
+    def __init__(self, app, headers: Sequence[Tuple[str, str]] = (),
+                 prefix_headers: Optional[Dict[str, Sequence[Tuple[str, str]]]] = None):
+        self.app = app
+        self.headers = encode_headers(headers)
+        self.rules = PrefixRules(prefixes={
+            prefix: encode_headers(extra) for prefix, extra in (prefix_headers or {}).items()
+        })
+        # Precomputed header names for requests without prefix headers
+        self.names = frozenset(name for name, _ in self.headers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        extra = self.rules.match(scope["path"])
+        if extra:
+            added = self.headers + extra
+            names = self.names | {name for name, _ in extra}
+        else:
+            added = self.headers
+            names = self.names
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    header for header in message.get("headers", ()) if header[0] not in names
+                ] + added
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class RequestLogMiddleware:
+    """Log method, path, status and duration for each HTTP request."""
+
+    def __init__(self, app, log: logging.Logger = logger):
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        self.log.info(f"Request: {scope['method']} {scope['path']}")
+
+        async def send_logging_status(message):
+            if message["type"] == "http.response.start":
+                duration_ms = (time.perf_counter() - start) * 1000
+                self.log.info(f"Response: {message['status']} ({duration_ms:.1f} ms)")
+            await send(message)
+
+        await self.app(scope, receive, send_logging_status)
+
+
+async def send_json_error(send, status: int, body: bytes, headers: RawHeaders = ()):
+    """Send a complete JSON error response without entering the app."""
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1"))
+        ] + list(headers)
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitRule:
+    """A request limit applied per client IP to matching paths."""
+
+    def __init__(self, name: str, limit: int, period_seconds: int, detail: str,
+                 paths: Iterable[str] = (), prefixes: Iterable[str] = ()):
+        self.name = name
+        self.limit = limit
+        self.period_seconds = period_seconds
+        self.paths = frozenset(paths)
+        self.prefixes = tuple(prefixes)
+        self.body = ('{"detail": "%s"}' % detail).encode("utf-8")
+
+    def applies_to(self, path: str) -> bool:
+        return path in self.paths or path.startswith(self.prefixes)
+
+
+class RateLimitMiddleware:
+    """
+    Per-IP rate limiting for one or more path rules.
+
+    Replaces RateLimitMiddleware and AuthRateLimitMiddleware: rules are
+    checked in order and a request counts against every rule it matches.
+    Counting is delegated to a SlidingWindowLimiter (see rate_limiter.py),
+    which is per-process by default or shared through MongoDB.
+    """
+
+    def __init__(self, app, rules: Sequence[RateLimitRule], enabled: bool = True,
+                 limiter: Optional[SlidingWindowLimiter] = None):
+        self.app = app
+        self.rules = tuple(rules)
+        self.enabled = enabled
+        self.limiter = limiter or SlidingWindowLimiter()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        client_ip = None
+        for rule in self.rules:
+            if not rule.applies_to(path):
+                continue
+            client_ip = client_ip or get_client_ip(scope)
+            allowed, retry_after = await self.limiter.allow(
+                f"{rule.name}:{client_ip}", rule.limit, rule.period_seconds
+            )
+            if not allowed:
+                logger.warning(f"Rate limit '{rule.name}' exceeded for IP: {client_ip} on endpoint: {path}")
+                await send_json_error(send, 429, rule.body, encode_headers([("Retry-After", str(retry_after))]))
+                return
+
+        await self.app(scope, receive, send)
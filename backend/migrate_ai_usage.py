@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Move AI meal plan usage off the user documents.
+
+Rate limiting now keeps usage in the ai_meal_plan_usage collection (see
+rate_limiting.py). This copies requests from the last 24 hours out of the
+old users.ai_meal_plan_usage arrays, so limits keep counting them, and
+removes the field from every user. Safe to re-run.
+
+Usage:
+    python migrate_ai_usage.py
+"""
+import os
+import sys
+import argparse
+
+from pymongo import MongoClient
+from dotenv import load_dotenv
+import certifi
+
+from rate_limiting import AI_USAGE_COLLECTION, ensure_usage_indexes, migrate_legacy_usage
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Move AI meal plan usage from user documents to its own collection")
+    parser.parse_args()
+
+    load_dotenv()
+    mongodb_uri = os.getenv("MONGODB_URI")
+    if not mongodb_uri:
+        print("ERROR: MONGODB_URI environment variable is required", flush=True)
+        sys.exit(1)
+
+    try:
+        client = MongoClient(mongodb_uri, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=5000)
+        client.server_info()
+    except Exception as e:
+        print(f"ERROR: Failed to connect to MongoDB: {e}", flush=True)
+        sys.exit(1)
+
+    db = client["nutritionapp"]
+    usage_collection = db[AI_USAGE_COLLECTION]
+    ensure_usage_indexes(usage_collection)
+    migrated = migrate_legacy_usage(db["users"], usage_collection)
+    print(f"users: {migrated} users migrated, ai_meal_plan_usage removed", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Backfill allergen flags on foods stored before they were derived at ingest.
+
+Computes the `allergens` array (see allergens.py) for every document in the
+legacy foods collection and in food_catalog, writing only documents whose
+flags changed, and makes sure the allergens index exists. Safe to re-run,
+e.g. after the keyword lists in allergens.py are extended.
+
+Allergy filters exclude foods without an `allergens` field, so run this
+once on databases with foods stored before flags were derived at ingest
+(or copied by older versions of populate_future_foods.py).
+
+Usage:
+    python migrate_allergens.py
+    python migrate_allergens.py --batch-size 1000
+"""
+import os
+import sys
+import argparse
+
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+import certifi
+
+from allergens import derive_allergens
+from food_catalog import CATALOG_COLLECTION, LEGACY_FOODS_COLLECTION
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def backfill_collection(collection, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Derive allergen flags for every food in a collection.
+
+    Returns:
+        Number of documents updated
+    """
+    updated = 0
+    operations = []
+    projection = {"name": 1, "description": 1, "ingredients": 1, "labels": 1, "allergens": 1}
+    for food in collection.find({}, projection):
+        allergens = derive_allergens(food)
+        if food.get("allergens") != allergens:
+            operations.append(UpdateOne({"_id": food["_id"]}, {"$set": {"allergens": allergens}}))
+        if len(operations) >= batch_size:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+            print(f"{collection.name}: {updated} updated so far", flush=True)
+    if operations:
+        updated += collection.bulk_write(operations, ordered=False).modified_count
+    collection.create_index("allergens", background=True)
+    return updated
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Backfill allergen flags on foods and catalog entries")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Bulk write batch size (default: {DEFAULT_BATCH_SIZE})")
+    args = parser.parse_args()
+
+    load_dotenv()
+    mongodb_uri = os.getenv("MONGODB_URI")
+    if not mongodb_uri:
+        print("ERROR: MONGODB_URI environment variable is required", flush=True)
+        sys.exit(1)
+
+    try:
+        client = MongoClient(mongodb_uri, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=5000)
+        client.server_info()
+    except Exception as e:
+        print(f"ERROR: Failed to connect to MongoDB: {e}", flush=True)
+        sys.exit(1)
+
+    db = client["nutritionapp"]
+    for name in (LEGACY_FOODS_COLLECTION, CATALOG_COLLECTION):
+        updated = backfill_collection(db[name], args.batch_size)
+        print(f"{name}: {updated} foods updated", flush=True)
+
+
+if __name__ == "__main__":
+    main()
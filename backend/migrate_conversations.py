@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Backfill expiry dates on AI conversation exchanges saved before they had one.
+
+Exchanges now carry an `expires_at` date and are removed by a TTL index
+CONVERSATION_TTL_DAYS after they were saved (see
+ai_agent/services/conversation_store.py). Older exchanges have no
+`expires_at` and would be kept forever; this sets it from their timestamp
+and creates the history and TTL indexes. Exchanges already past their
+expiry are removed by MongoDB shortly after the script runs. Safe to re-run.
+
+Usage:
+    python migrate_conversations.py
+    python migrate_conversations.py --ttl-days 365
+"""
+import os
+import sys
+import argparse
+
+from pymongo import MongoClient
+from dotenv import load_dotenv
+import certifi
+
+from ai_agent.services.conversation_store import CONVERSATION_TTL_DAYS, ConversationStore
+
+
+def backfill_expiry(store: ConversationStore, ttl_days: float) -> int:
+    """
+    Set expires_at = timestamp + ttl_days on exchanges without one.
+
+    Returns:
+        Number of documents updated
+    """
+    ttl_ms = int(ttl_days * 24 * 3600 * 1000)
+    result = store.collection.update_many(
+        {"expires_at": {"$exists": False}, "timestamp": {"$type": "date"}},
+        [{"$set": {"expires_at": {"$add": ["$timestamp", ttl_ms]}}}]
+    )
+    return result.modified_count
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Backfill expiry dates on AI conversation exchanges")
+    parser.add_argument("--ttl-days", type=float, default=CONVERSATION_TTL_DAYS,
+                        help=f"Days to keep an exchange (default: {CONVERSATION_TTL_DAYS:g})")
+    args = parser.parse_args()
+    if args.ttl_days <= 0:
+        print("ERROR: --ttl-days must be positive (conversations are kept forever without it)", flush=True)
+        sys.exit(1)
+
+    load_dotenv()
+    mongodb_uri = os.getenv("MONGODB_URI")
+    if not mongodb_uri:
+        print("ERROR: MONGODB_URI environment variable is required", flush=True)
+        sys.exit(1)
+
+    try:
+        client = MongoClient(mongodb_uri, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=5000)
+        client.server_info()
+    except Exception as e:
+        print(f"ERROR: Failed to connect to MongoDB: {e}", flush=True)
+        sys.exit(1)
+
+    store = ConversationStore(client["nutritionapp"], ttl_days=args.ttl_days)
+    store.ensure_indexes()
+    updated = backfill_expiry(store, args.ttl_days)
+    print(f"conversations: {updated} exchanges given an expiry date", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Backfill the canonical food catalog from the legacy foods collection.
+
+Every document in foods is fingerprinted, unique foods are upserted into
+food_catalog and each (date, dining hall, meal, station) appearance becomes a
+slim menu_items document pointing at its catalog entry. The foods collection
+is streamed in batches and every write is an idempotent upsert, so the
+migration can be re-run or resumed at any time (e.g. once more right before
+switching USE_FOOD_CATALOG=true to pick up the latest scrape).
+
+Older deployments keyed menu occurrences on (date, hall, meal, station,
+catalog_id) without the campus, which let one campus's menu overwrite
+another's; the old menu_occurrence_idx is dropped once the campus-keyed
+index exists. Run migrate_scrape_campus.py first so existing occurrences
+carry their campus.
+
+Plates keep working without --remap-plates because food lookups fall back to
+the legacy foods collection; remapping points plate items at catalog IDs so
+foods can eventually be dropped.
+
+Usage:
+    python migrate_food_catalog.py                        # Backfill everything
+    python migrate_food_catalog.py --since 2025-01-01     # Only dates >= since
+    python migrate_food_catalog.py --remap-plates         # Also rewrite plate food_ids
+"""
+
+import os
+import sys
+import argparse
+from typing import Dict
+
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+import certifi
+
+from food_catalog import (
+    CATALOG_COLLECTION, LEGACY_FOODS_COLLECTION, MENU_ITEMS_COLLECTION,
+    MENU_OCCURRENCE_INDEX, ensure_catalog_indexes, food_fingerprint, record_foods, split_food_ids
+)
+
+DEFAULT_BATCH_SIZE = 500
+LEGACY_OCCURRENCE_INDEX = "menu_occurrence_idx"
+
+
+def rebuild_occurrence_index(db) -> bool:
+    """
+    Replace the campus-less occurrence index with the campus-keyed one.
+
+    Returns:
+        True if the legacy index was dropped
+    """
+    menu_items = db[MENU_ITEMS_COLLECTION]
+    # ensure_catalog_indexes has already built the new unique index, so
+    # occurrences stay unique while the old one goes away
+    if MENU_OCCURRENCE_INDEX not in menu_items.index_information():
+        raise RuntimeError(f"{MENU_OCCURRENCE_INDEX} is missing, run ensure_catalog_indexes first")
+    if LEGACY_OCCURRENCE_INDEX not in menu_items.index_information():
+        return False
+    menu_items.drop_index(LEGACY_OCCURRENCE_INDEX)
+    return True
+
+
+def backfill(db, since: str = None, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+    """Stream the foods collection into food_catalog + menu_items."""
+    query = {"date": {"$gte": since}} if since else {}
+    cursor = db[LEGACY_FOODS_COLLECTION].find(query, {"_id": 0}, batch_size=batch_size)
+    return record_foods(db, cursor, batch_size=batch_size)
+
+
+def remap_plates(db, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Point plate items at catalog IDs instead of legacy foods IDs.
+
+    Returns:
+        Number of plates updated
+    """
+    foods = db[LEGACY_FOODS_COLLECTION]
+    catalog = db[CATALOG_COLLECTION]
+    updated = 0
+    operations = []
+
+    def flush():
+        nonlocal updated
+        if operations:
+            updated += db["plates"].bulk_write(operations, ordered=False).modified_count
+            operations.clear()
+
+    for plate in db["plates"].find({"items.food_id": {"$exists": True}}, {"items": 1}, batch_size=batch_size):
+        items = plate.get("items", [])
+        legacy_ids = [
+            item["food_id"] for item in items
+            if item.get("food_id") and "custom_macros" not in item
+        ]
+        if not legacy_ids:
+            continue
+
+        object_ids, str_ids = split_food_ids(legacy_ids)
+        fingerprints = {
+            str(food["_id"]): food_fingerprint(food)
+            for food in foods.find({"_id": {"$in": object_ids + str_ids}})
+        }
+        if not fingerprints:
+            continue
+        catalog_ids = {
+            doc["fingerprint"]: str(doc["_id"])
+            for doc in catalog.find({"fingerprint": {"$in": list(fingerprints.values())}}, {"fingerprint": 1})
+        }
+
+        changed = False
+        for item in items:
+            fingerprint = fingerprints.get(str(item.get("food_id")))
+            catalog_id = catalog_ids.get(fingerprint)
+            if catalog_id and item["food_id"] != catalog_id:
+                item["food_id"] = catalog_id
+                changed = True
+
+        if changed:
+            operations.append(UpdateOne({"_id": plate["_id"]}, {"$set": {"items": items}}))
+            if len(operations) >= batch_size:
+                flush()
+
+    flush()
+    return updated
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Backfill food_catalog and menu_items from foods")
+    parser.add_argument("--since", help="Only migrate foods with date >= this date (YYYY-MM-DD)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Bulk write batch size (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--remap-plates", action="store_true",
+                        help="Rewrite plate item food_ids to catalog IDs after the backfill")
+    args = parser.parse_args()
+
+    load_dotenv()
+    mongodb_uri = os.getenv("MONGODB_URI")
+    if not mongodb_uri:
+        print("ERROR: MONGODB_URI environment variable is required", flush=True)
+        sys.exit(1)
+
+    try:
+        client = MongoClient(mongodb_uri, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=5000)
+        client.server_info()
+    except Exception as e:
+        print(f"ERROR: Failed to connect to MongoDB: {e}", flush=True)
+        sys.exit(1)
+
+    db = client["nutritionapp"]
+    ensure_catalog_indexes(db)
+    try:
+        if rebuild_occurrence_index(db):
+            print(f"Dropped {LEGACY_OCCURRENCE_INDEX}, occurrences are now unique per campus", flush=True)
+    except RuntimeError as e:
+        print(f"ERROR: {e}", flush=True)
+        sys.exit(1)
+
+    print("Backfilling food catalog...", flush=True)
+    stats = backfill(db, since=args.since, batch_size=args.batch_size)
+    print(f"Processed {stats['foods']} foods, created {stats['menu_items']} menu items", flush=True)
+    print(f"Catalog size: {db[CATALOG_COLLECTION].estimated_document_count()} unique foods, "
+          f"{db[MENU_ITEMS_COLLECTION].estimated_document_count()} menu items", flush=True)
+
+    if args.remap_plates:
+        print("Remapping plate items to catalog IDs...", flush=True)
+        print(f"Updated {remap_plates(db, args.batch_size)} plates", flush=True)
+
+    print("\n✅ Migration complete. Set USE_FOOD_CATALOG=true to serve reads from the catalog.", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Record the campus on menu data and scrape coverage stored before campuses were tracked.
+
+Menu documents (legacy foods or menu_items, depending on USE_FOOD_CATALOG)
+without a `campus` field get the given campus, and coverage documents keyed
+by date alone are re-keyed to (campus, date) as scrape_coverage.py expects.
+Coverage is then recomputed for every date that had untagged rows.
+
+Scrapes uploaded from a checkpoint log before it recorded the campus wrote
+untagged rows that the campus-scoped replace never matched, so each run
+added another copy of the day's menu. In the legacy foods collection those
+copies are removed first: one document per (date, dining hall, meal,
+station, name) is kept, preferring one a saved plate refers to.
+
+Run once after upgrading, before the next scrape. Safe to re-run.
+
+Usage:
+    python migrate_scrape_campus.py
+    python migrate_scrape_campus.py --campus utah
+"""
+import os
+import sys
+import argparse
+
+from pymongo import MongoClient
+from dotenv import load_dotenv
+import certifi
+
+from food_catalog import USE_FOOD_CATALOG, menu_collection
+from scrape_coverage import COVERAGE_COLLECTION, DEFAULT_CAMPUS, coverage_id, refresh_coverage
+
+DUPLICATE_KEY_FIELDS = ("date", "dining_hall", "meal_name", "station", "name")
+
+
+def remove_untagged_duplicates(db, foods_collection) -> int:
+    """
+    Delete repeated copies of untagged legacy foods.
+
+    Returns:
+        Number of documents deleted
+    """
+    pipeline = [
+        {"$match": {"campus": {"$exists": False}}},
+        {"$group": {
+            "_id": {field: f"${field}" for field in DUPLICATE_KEY_FIELDS},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    deleted = 0
+    for group in foods_collection.aggregate(pipeline, allowDiskUse=True):
+        ids = sorted(group["ids"])
+        referenced = db["plates"].find_one(
+            {"items.food_id": {"$in": [str(i) for i in ids]}}, {"items.food_id": 1}
+        )
+        keep = ids[-1]
+        if referenced:
+            plate_ids = {str(item.get("food_id")) for item in referenced.get("items", [])}
+            keep = next((i for i in ids if str(i) in plate_ids), keep)
+        deleted += foods_collection.delete_many({"_id": {"$in": [i for i in ids if i != keep]}}).deleted_count
+    return deleted
+
+
+def rekey_coverage(coverage_collection, campus: str) -> int:
+    """
+    Move coverage documents without a campus to their (campus, date) key.
+
+    Returns:
+        Number of documents moved
+    """
+    moved = 0
+    for doc in coverage_collection.find({"campus": {"$exists": False}}):
+        date = doc.get("date") or doc["_id"]
+        new_doc = {**doc, "_id": coverage_id(campus, date), "campus": campus, "date": date}
+        coverage_collection.replace_one({"_id": new_doc["_id"]}, new_doc, upsert=True)
+        coverage_collection.delete_one({"_id": doc["_id"]})
+        moved += 1
+    return moved
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Record the campus on existing menu data and scrape coverage")
+    parser.add_argument("--campus", default=DEFAULT_CAMPUS,
+                        help=f"Campus the existing data belongs to (default: {DEFAULT_CAMPUS})")
+    args = parser.parse_args()
+
+    load_dotenv()
+    mongodb_uri = os.getenv("MONGODB_URI")
+    if not mongodb_uri:
+        print("ERROR: MONGODB_URI environment variable is required", flush=True)
+        sys.exit(1)
+
+    try:
+        client = MongoClient(mongodb_uri, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=5000)
+        client.server_info()
+    except Exception as e:
+        print(f"ERROR: Failed to connect to MongoDB: {e}", flush=True)
+        sys.exit(1)
+
+    db = client["nutritionapp"]
+    menus = menu_collection(db)
+    if not USE_FOOD_CATALOG:
+        deleted = remove_untagged_duplicates(db, menus)
+        print(f"{menus.name}: {deleted} duplicate menu documents removed", flush=True)
+    dates = [d for d in menus.distinct("date", {"campus": {"$exists": False}}) if d]
+    result = menus.update_many({"campus": {"$exists": False}}, {"$set": {"campus": args.campus}})
+    print(f"{menus.name}: {result.modified_count} menu documents assigned to {args.campus}", flush=True)
+
+    moved = rekey_coverage(db[COVERAGE_COLLECTION], args.campus)
+    print(f"{COVERAGE_COLLECTION}: {moved} coverage documents re-keyed", flush=True)
+
+    for date in sorted(dates):
+        refresh_coverage(db, date, args.campus)
+    print(f"{COVERAGE_COLLECTION}: coverage recomputed for {len(dates)} dates", flush=True)
+
+
+if __name__ == "__main__":
+    main()
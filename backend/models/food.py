@@ -15,6 +15,7 @@ class Food(BaseModel):
     station: Optional[str] = None
     station_id: Optional[str] = None
     portion_size: Optional[str] = None
+    allergens: Optional[List[str]] = None  # Allergen IDs derived from name/ingredients at ingest
     trackable: Optional[bool] = None  # Whether food can be tracked (has complete macros)
 
     class Config:
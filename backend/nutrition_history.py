@@ -0,0 +1,214 @@
+"""
+Time-bucketed nutrition history.
+
+Each plate carries a small `totals` rollup (calories, protein, net carbs, fat,
+fiber for that day) that is written when the plate is saved. History queries
+then run one aggregation pipeline over the plates in range and group the daily
+rollups into daily, weekly (ISO week) or monthly buckets, so a one-year chart
+is a few dozen small documents instead of thousands of item rows.
+
+Plates saved before rollups existed are backfilled on first read.
+"""
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from food_catalog import get_foods_by_ids
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("calories", "protein", "carbs", "fat", "fiber")
+GRANULARITIES = ("daily", "weekly", "monthly")
+
+# Plates per food lookup when backfilling rollups
+BACKFILL_BATCH_SIZE = 200
+
+
+def _number(value: Any, field: str) -> float:
+    """A nutrient value as a float; values that can't be parsed ("", "12g", None) count as 0."""
+    if value is None or value == "":
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        logger.warning(f"Ignoring unparseable {field} value: {value!r}")
+        return 0.0
+
+
+def item_macros(item: Dict[str, Any], food: Optional[Dict[str, Any]]) -> Optional[Dict[str, float]]:
+    """
+    Macros of one plate item, multiplied by its quantity.
+
+    Same rules as /api/plate/food-macros: carbs are net carbs (total minus
+    fiber), custom foods use their own custom_macros. Values that can't be
+    parsed count as 0, so a bad user-entered or scraped value never fails
+    saving a plate.
+
+    Returns:
+        Dict of METRICS, or None if the item has no nutrition data
+    """
+    quantity = _number(item.get("quantity", 1), "quantity")
+    if "custom_macros" in item:
+        n = item["custom_macros"]
+        if n is None:
+            return None
+        total_carbs = _number(n.get("carbs", n.get("total_carbohydrates", 0)), "carbs")
+        fat = _number(n.get("totalFat", n.get("total_fat", 0)), "fat")
+    else:
+        if not food or food.get("nutrients") is None:
+            return None
+        n = food["nutrients"]
+        total_carbs = _number(n.get("total_carbohydrates", 0), "total_carbohydrates")
+        fat = _number(n.get("total_fat", 0), "total_fat")
+    fiber = _number(n.get("dietary_fiber", 0), "dietary_fiber")
+    return {
+        "calories": int(_number(n.get("calories", 0), "calories")) * quantity,
+        "protein": _number(n.get("protein", 0), "protein") * quantity,
+        "carbs": (total_carbs - fiber) * quantity,
+        "fat": fat * quantity,
+        "fiber": fiber * quantity
+    }
+
+
+def plate_totals(items: Iterable[Dict[str, Any]], foods_map: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+    """Sum the macros of a plate's items into its daily rollup."""
+    totals = {metric: 0.0 for metric in METRICS}
+    for item in items:
+        macros = item_macros(item, foods_map.get(str(item.get("food_id"))))
+        if macros:
+            for metric in METRICS:
+                totals[metric] += macros[metric]
+    return {metric: round(value, 2) for metric, value in totals.items()}
+
+
+def standard_food_ids(items: Iterable[Dict[str, Any]]) -> set:
+    return {
+        item.get("food_id")
+        for item in items
+        if "custom_macros" not in item and item.get("food_id")
+    }
+
+
+def backfill_plate_totals(db, user_id: str, start_date: str, end_date: str) -> int:
+    """
+    Compute and store `totals` for plates in range that don't have them yet.
+
+    Returns:
+        Number of plates updated
+    """
+    plates = db["plates"]
+    cursor = plates.find(
+        {"user_id": user_id, "date": {"$gte": start_date, "$lte": end_date}, "totals": {"$exists": False}},
+        {"items": 1}
+    )
+    updated = 0
+    batch: List[Dict[str, Any]] = []
+
+    def flush():
+        food_ids = set()
+        for plate in batch:
+            food_ids |= standard_food_ids(plate.get("items", []))
+        foods_map = get_foods_by_ids(db, food_ids, {"nutrients": 1}) if food_ids else {}
+        plates.bulk_write([
+            UpdateOne({"_id": plate["_id"]}, {"$set": {"totals": plate_totals(plate.get("items", []), foods_map)}})
+            for plate in batch
+        ], ordered=False)
+        return len(batch)
+
+    for plate in cursor:
+        batch.append(plate)
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            updated += flush()
+            batch = []
+    if batch:
+        updated += flush()
+    if updated:
+        logger.info(f"Backfilled nutrition totals for {updated} plates of user {user_id}")
+    return updated
+
+
+def invalidate_plate_totals(db, food_id: str) -> int:
+    """Drop the rollups of plates containing a food whose nutrients changed (recomputed on next read)."""
+    result = db["plates"].update_many({"items.food_id": str(food_id)}, {"$unset": {"totals": ""}})
+    return result.modified_count
+
+
+def bucket_key(granularity: str) -> Dict[str, Any]:
+    """
+    Aggregation expression naming the bucket a plate's date falls in.
+
+    Keys match the nutrition history charts: YYYY-MM-DD, YYYY-W<iso week>
+    (not zero padded) and YYYY-MM.
+    """
+    if granularity == "daily":
+        return "$date"
+    if granularity == "monthly":
+        return {"$substrCP": ["$date", 0, 7]}
+    day = {"$dateFromString": {"dateString": "$date", "format": "%Y-%m-%d"}}
+    return {"$concat": [
+        {"$toString": {"$isoWeekYear": day}},
+        "-W",
+        {"$toString": {"$isoWeek": day}}
+    ]}
+
+
+def history_pipeline(user_id: str, start_date: str, end_date: str, granularity: str) -> List[Dict[str, Any]]:
+    group: Dict[str, Any] = {
+        "_id": bucket_key(granularity),
+        "start_date": {"$min": "$date"},
+        "end_date": {"$max": "$date"},
+        "days_tracked": {"$sum": 1}
+    }
+    for metric in METRICS:
+        value = {"$ifNull": [f"$totals.{metric}", 0]}
+        group[f"{metric}_sum"] = {"$sum": value}
+        group[f"{metric}_min"] = {"$min": value}
+        group[f"{metric}_max"] = {"$max": value}
+    return [
+        {"$match": {"user_id": user_id, "date": {"$gte": start_date, "$lte": end_date}}},
+        {"$project": {"_id": 0, "date": 1, "totals": 1}},
+        {"$group": group},
+        {"$sort": {"start_date": 1}}
+    ]
+
+
+def get_nutrition_history(db, user_id: str, start_date: str, end_date: str,
+                          granularity: str = "daily") -> List[Dict[str, Any]]:
+    """
+    Nutrition totals for a date range grouped into buckets.
+
+    Args:
+        db: Database handle
+        user_id: User id as stored on plates
+        start_date: First day (YYYY-MM-DD), inclusive
+        end_date: Last day (YYYY-MM-DD), inclusive
+        granularity: "daily", "weekly" or "monthly"
+
+    Returns:
+        One entry per bucket with logged plates, in date order:
+        {name, start_date, end_date, days_tracked,
+         calories: {sum, mean, min, max}, protein: {...}, carbs, fat, fiber}
+        Means, minimums and maximums are over tracked days.
+    """
+    backfill_plate_totals(db, user_id, start_date, end_date)
+
+    buckets = []
+    for row in db["plates"].aggregate(history_pipeline(user_id, start_date, end_date, granularity)):
+        days = row["days_tracked"]
+        bucket = {
+            "name": row["_id"],
+            "start_date": row["start_date"],
+            "end_date": row["end_date"],
+            "days_tracked": days
+        }
+        for metric in METRICS:
+            total = row[f"{metric}_sum"]
+            bucket[metric] = {
+                "sum": round(total, 1),
+                "mean": round(total / days, 1) if days else 0.0,
+                "min": round(row[f"{metric}_min"], 1),
+                "max": round(row[f"{metric}_max"], 1)
+            }
+        buckets.append(bucket)
+    return buckets
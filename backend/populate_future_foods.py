@@ -1,127 +1,242 @@
 #!/usr/bin/env python3
 """
-Script to populate food data for the next 90 days.
-This script reads all existing food data from MongoDB and creates duplicate entries
-for the next 90 days, incrementing the date field for each day.
+Script to populate food data for future dates.
+
+Distinct food templates (one per name / dining hall / meal / station) are
+pulled with a server-side aggregation and streamed into the target dates with
+unordered bulk upserts, so memory stays bounded by the batch size no matter
+how large the foods collection is. Each item is upserted on
+(date, campus, dining_hall, meal_name, station, name), which makes re-running the
+script for the same dates a no-op and lets an interrupted run be resumed.
+
+With USE_FOOD_CATALOG=true the templates come from menu_items and only slim
+occurrences (date, dining hall, meal, station, catalog_id) are written; the
+food itself stays in food_catalog and is never copied.
+
+Usage:
+    python populate_future_foods.py                                  # 90 days after the latest date
+    python populate_future_foods.py --days 30                        # 30 days after the latest date
+    python populate_future_foods.py --start-date 2025-01-10 --end-date 2025-01-20
+    python populate_future_foods.py --source-date 2025-01-09         # Templates from one day only
+    python populate_future_foods.py --overwrite                      # Replace existing items on target dates
 """
 
 import os
 import sys
+import argparse
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+from typing import Dict, Iterator, List, Optional
+
+from pymongo import MongoClient, UpdateOne
 from dotenv import load_dotenv
 import certifi
-from bson import ObjectId
 
-# Load environment variables
-print("Loading environment variables...", flush=True)
-load_dotenv()
+from allergens import derive_allergens
+from food_catalog import USE_FOOD_CATALOG, menu_collection
+
+DEFAULT_DAYS = 90
+DEFAULT_BATCH_SIZE = 1000
+
+# Fields that identify a food template / menu occurrence
+TEMPLATE_KEY_FIELDS = (
+    ("campus", "catalog_id", "dining_hall", "meal_name", "station") if USE_FOOD_CATALOG
+    else ("campus", "name", "dining_hall", "meal_name", "station")
+)
 
-# MongoDB connection
-MONGODB_URI = os.getenv("MONGODB_URI")
-if not MONGODB_URI:
-    print("ERROR: MONGODB_URI environment variable is required", flush=True)
-    sys.exit(1)
 
-print("Connecting to MongoDB...", flush=True)
-try:
+def connect(mongodb_uri: str):
+    """Connect to MongoDB and return the collection holding per-date menu rows."""
+    print("Connecting to MongoDB...", flush=True)
     client = MongoClient(
-        MONGODB_URI,
+        mongodb_uri,
         tlsCAFile=certifi.where(),
         serverSelectionTimeoutMS=5000  # 5 second timeout
     )
     # Test the connection
     client.server_info()
-    db = client["nutritionapp"]
-    foods_collection = db["foods"]
     print("Connected successfully!", flush=True)
-except Exception as e:
-    print(f"ERROR: Failed to connect to MongoDB: {e}", flush=True)
-    sys.exit(1)
-
-# Get all unique food items (excluding the _id and date fields)
-print("\nFetching existing food data...", flush=True)
-existing_foods = list(foods_collection.find({}))
-print(f"Found {len(existing_foods)} existing food items", flush=True)
-
-if len(existing_foods) == 0:
-    print("No food data found in the database. Exiting...", flush=True)
-    sys.exit(0)
-
-# Get the latest date in the database
-print("Finding latest date...", flush=True)
-latest_date_str = None
-for food in existing_foods:
-    if food.get("date"):
-        if latest_date_str is None or food["date"] > latest_date_str:
-            latest_date_str = food["date"]
-
-if latest_date_str:
-    print(f"Latest date in database: {latest_date_str}", flush=True)
-    # Parse the latest date
-    latest_date = datetime.strptime(latest_date_str, "%Y-%m-%d")
-    start_date = latest_date + timedelta(days=1)
-else:
-    # If no dates found, start from tomorrow
-    print("No dates found in existing data, starting from tomorrow", flush=True)
-    start_date = datetime.now() + timedelta(days=1)
-
-print(f"Will populate data starting from: {start_date.strftime('%Y-%m-%d')}", flush=True)
-
-# Group foods by their unique characteristics (excluding _id and date)
-# We'll use a combination of name, dining_hall, meal_name as the key
-print("Grouping food templates...", flush=True)
-food_templates = {}
-for food in existing_foods:
-    key = (
-        food.get("name", ""),
-        food.get("dining_hall", ""),
-        food.get("meal_name", ""),
-        food.get("station", "")
-    )
-
-    # Store this as a template (we'll remove _id and update date)
-    if key not in food_templates:
-        food_templates[key] = food
+    return menu_collection(client["nutritionapp"])
 
-print(f"Found {len(food_templates)} unique food templates", flush=True)
 
-# Create new food entries for the next 90 days
-print(f"\nGenerating food data for the next 90 days...", flush=True)
-new_foods = []
-batch_size = 1000  # Insert in batches to avoid memory issues
-total_inserted = 0
-
-for day_offset in range(90):
-    current_date = start_date + timedelta(days=day_offset)
-    date_str = current_date.strftime("%Y-%m-%d")
-
-    for template in food_templates.values():
-        # Create a copy of the template
-        new_food = template.copy()
+def get_latest_date(foods_collection) -> Optional[str]:
+    """Find the latest menu date using the date index (no collection scan)."""
+    latest = foods_collection.find_one(
+        {"date": {"$type": "string"}},
+        {"date": 1, "_id": 0},
+        sort=[("date", -1)]
+    )
+    return latest["date"] if latest else None
+
+
+def template_pipeline(source_date: Optional[str] = None) -> List[Dict]:
+    """
+    Aggregation returning one template per TEMPLATE_KEY_FIELDS combination.
+
+    The most recent version of each food wins. Only the fields that get copied
+    are returned, so _id and date never travel over the wire.
+    """
+    pipeline = []
+    if source_date:
+        pipeline.append({"$match": {"date": source_date}})
+    pipeline.extend([
+        {"$sort": {"date": -1}},
+        {"$group": {
+            "_id": {field: f"${field}" for field in TEMPLATE_KEY_FIELDS},
+            "template": {"$first": "$$ROOT"}
+        }},
+        {"$replaceRoot": {"newRoot": "$template"}},
+        {"$project": {"_id": 0, "date": 0}}
+    ])
+    return pipeline
+
+
+def iter_templates(foods_collection, source_date: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Dict]:
+    """Stream food templates from the server-side aggregation."""
+    return foods_collection.aggregate(
+        template_pipeline(source_date),
+        allowDiskUse=True,
+        batchSize=batch_size
+    )
 
-        # Remove the _id field (MongoDB will generate a new one)
-        if "_id" in new_food:
-            del new_food["_id"]
 
-        # Update the date
-        new_food["date"] = date_str
+def build_target_dates(start_date: datetime, end_date: datetime) -> List[str]:
+    """List every date from start_date to end_date (inclusive) as YYYY-MM-DD."""
+    dates = []
+    current = start_date
+    while current <= end_date:
+        dates.append(current.strftime("%Y-%m-%d"))
+        current += timedelta(days=1)
+    return dates
+
+
+def occurrence_upsert(template: Dict, date_str: str) -> UpdateOne:
+    """Build an idempotent upsert placing a template on a date."""
+    key = {field: template.get(field) for field in TEMPLATE_KEY_FIELDS}
+    key["date"] = date_str
+    return UpdateOne(key, {"$setOnInsert": {**template, "date": date_str}}, upsert=True)
+
+
+def populate(foods_collection, target_dates: List[str], source_date: Optional[str] = None,
+             batch_size: int = DEFAULT_BATCH_SIZE, overwrite: bool = False, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Copy every food template onto each target date.
+
+    Returns:
+        Counts of templates read, items inserted and items that already existed
+    """
+    stats = {"templates": 0, "inserted": 0, "existing": 0}
+
+    if overwrite and not dry_run:
+        result = foods_collection.delete_many({"date": {"$in": target_dates}})
+        print(f"Removed {result.deleted_count} existing items on target dates", flush=True)
+
+    operations = []
+
+    def flush():
+        if not operations:
+            return
+        result = foods_collection.bulk_write(operations, ordered=False)
+        stats["inserted"] += result.upserted_count
+        stats["existing"] += result.matched_count
+        print(f"Wrote batch: {stats['inserted']} inserted, {stats['existing']} already present", flush=True)
+        operations.clear()
+
+    for template in iter_templates(foods_collection, source_date, batch_size):
+        stats["templates"] += 1
+        if dry_run:
+            continue
+        if not USE_FOOD_CATALOG:
+            # Copies must carry allergen flags, or allergy filters exclude them
+            template["allergens"] = derive_allergens(template)
+        for date_str in target_dates:
+            operations.append(occurrence_upsert(template, date_str))
+            if len(operations) >= batch_size:
+                flush()
+
+    flush()
+    return stats
+
+
+def parse_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Populate food data for future dates")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS,
+                        help=f"Number of days to populate when --end-date is not given (default: {DEFAULT_DAYS})")
+    parser.add_argument("--start-date", type=parse_date,
+                        help="First date to populate (default: day after the latest date in the database)")
+    parser.add_argument("--end-date", type=parse_date,
+                        help="Last date to populate (inclusive)")
+    parser.add_argument("--source-date",
+                        help="Only use templates from this date (default: latest version of every food)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Bulk write batch size (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Delete existing items on the target dates before populating")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Count templates and show the date range without writing")
+    args = parser.parse_args()
+
+    # Load environment variables
+    print("Loading environment variables...", flush=True)
+    load_dotenv()
+
+    mongodb_uri = os.getenv("MONGODB_URI")
+    if not mongodb_uri:
+        print("ERROR: MONGODB_URI environment variable is required", flush=True)
+        sys.exit(1)
+
+    try:
+        foods_collection = connect(mongodb_uri)
+    except Exception as e:
+        print(f"ERROR: Failed to connect to MongoDB: {e}", flush=True)
+        sys.exit(1)
+
+    # Work out the date range
+    start_date = args.start_date
+    if start_date is None:
+        print("Finding latest date...", flush=True)
+        latest_date_str = get_latest_date(foods_collection)
+        if latest_date_str:
+            print(f"Latest date in database: {latest_date_str}", flush=True)
+            start_date = parse_date(latest_date_str) + timedelta(days=1)
+        else:
+            # If no dates found, start from tomorrow
+            print("No dates found in existing data, starting from tomorrow", flush=True)
+            start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    end_date = args.end_date or (start_date + timedelta(days=args.days - 1))
+    if end_date < start_date:
+        print("ERROR: --end-date must not be before the start date", flush=True)
+        sys.exit(1)
+
+    target_dates = build_target_dates(start_date, end_date)
+    print(f"Will populate {len(target_dates)} days: {target_dates[0]} to {target_dates[-1]}", flush=True)
+
+    stats = populate(
+        foods_collection,
+        target_dates,
+        source_date=args.source_date,
+        batch_size=args.batch_size,
+        overwrite=args.overwrite,
+        dry_run=args.dry_run
+    )
 
-        new_foods.append(new_food)
+    print(f"\nFound {stats['templates']} unique food templates", flush=True)
+    if stats["templates"] == 0:
+        print("No food data found in the database. Nothing to populate.", flush=True)
+        return
+    if args.dry_run:
+        print(f"Dry run: would write up to {stats['templates'] * len(target_dates)} items", flush=True)
+        return
 
-        # Insert in batches
-        if len(new_foods) >= batch_size:
-            foods_collection.insert_many(new_foods)
-            total_inserted += len(new_foods)
-            print(f"Inserted batch: {total_inserted} total items (current date: {date_str})", flush=True)
-            new_foods = []
+    print(f"\n✅ Successfully populated food data for {len(target_dates)} days!", flush=True)
+    print(f"Date range: {target_dates[0]} to {target_dates[-1]}", flush=True)
+    print(f"Total items created: {stats['inserted']} ({stats['existing']} already present)", flush=True)
 
-# Insert any remaining items
-if new_foods:
-    foods_collection.insert_many(new_foods)
-    total_inserted += len(new_foods)
-    print(f"Inserted final batch: {len(new_foods)} items", flush=True)
 
-print(f"\n✅ Successfully populated food data for the next 90 days!", flush=True)
-print(f"Date range: {start_date.strftime('%Y-%m-%d')} to {(start_date + timedelta(days=89)).strftime('%Y-%m-%d')}", flush=True)
-print(f"Total items created: {total_inserted}", flush=True)
+if __name__ == "__main__":
+    main()
@@ -21,7 +21,10 @@ Environment Variables:
 import os
 import multiprocessing
 import uvicorn
-from main import app
+
+# The app is passed to uvicorn by import string, never imported here: the
+# password hashing pool (auth_util) spawns processes that re-import this
+# __main__ module, and importing main would boot the whole app in each one.
 
 def get_worker_count():
     """Calculate optimal number of workers based on CPU cores"""
@@ -0,0 +1,176 @@
+"""
+Sliding-window rate limiting engine.
+
+Uses the sliding window counter algorithm: each key keeps the request count
+of the current fixed window and of the previous one, and the number of
+requests in the last `period` seconds is estimated as
+
+    previous * (1 - elapsed_fraction_of_current_window) + current
+
+so every check is O(1) time and O(1) memory per key, instead of a list of
+timestamps per client. Attempts are counted even when rejected, so a client
+that keeps hammering a limited endpoint stays limited.
+
+Storage is pluggable:
+- InMemoryStore: per-process, LRU bounded with idle-key expiry (default;
+  also the local stand-in for tests and benchmarks)
+- MongoStore: one small document per key in a shared collection, updated
+  atomically in a single round trip, so limits hold across all uvicorn
+  workers; expired keys are removed by a TTL index
+
+Select the store with RATE_LIMIT_STORE=memory|mongo.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Tuple
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory").lower()
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_COLLECTION = "rate_limits"
+
+
+def window_position(now: float, period_seconds: int) -> Tuple[int, float]:
+    """Return (window index, fraction of the current window already elapsed)."""
+    index = int(now // period_seconds)
+    return index, (now - index * period_seconds) / period_seconds
+
+
+def estimate(previous: int, current: int, elapsed_fraction: float) -> float:
+    """Estimated request count over the last full period."""
+    return previous * (1.0 - elapsed_fraction) + current
+
+
+class InMemoryStore:
+    """
+    Per-process counter store.
+
+    Keys are kept in least-recently-used order. Each hit drops idle keys
+    (untouched for two periods) from the cold end and the store never grows
+    past max_keys, so memory stays bounded no matter how many distinct
+    clients show up.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._counters = OrderedDict()  # key -> [window index, previous count, current count, expires at]
+        self._lock = threading.Lock()
+
+    def hit_sync(self, key: str, period_seconds: int, now: float) -> float:
+        index, elapsed = window_position(now, period_seconds)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or counter[0] < index - 1:
+                # New or idle for over a full window - nothing left to remember
+                counter = [index, 0, 0, 0.0]
+                self._counters[key] = counter
+            elif counter[0] == index - 1:
+                # Roll the window over
+                counter[0], counter[1], counter[2] = index, counter[2], 0
+            counter[2] += 1
+            counter[3] = now + 2 * period_seconds
+            self._counters.move_to_end(key)
+
+            # Evict idle keys from the cold end, then enforce the size bound
+            while self._counters:
+                oldest = next(iter(self._counters.values()))
+                if oldest[3] >= now and len(self._counters) <= self.max_keys:
+                    break
+                self._counters.popitem(last=False)
+            return estimate(counter[1], counter[2], elapsed)
+
+    async def hit(self, key: str, period_seconds: int, now: float) -> float:
+        return self.hit_sync(key, period_seconds, now)
+
+    def __len__(self):
+        return len(self._counters)
+
+
+class MongoStore:
+    """
+    Counter store shared by every worker through a MongoDB collection.
+
+    Each key is one document {_id, window, previous, current, expires_at};
+    the window roll-over and the increment happen in a single atomic
+    pipeline update. If MongoDB is unreachable requests are allowed (fail
+    open) rather than taking the API down with it.
+    """
+
+    def __init__(self, collection_factory: Callable):
+        self._collection_factory = collection_factory
+        self._collection = None
+        self._index_ready = False
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = self._collection_factory()
+        if not self._index_ready:
+            self._collection.create_index("expires_at", expireAfterSeconds=0, background=True)
+            self._index_ready = True
+        return self._collection
+
+    def hit_sync(self, key: str, period_seconds: int, now: float) -> float:
+        index, elapsed = window_position(now, period_seconds)
+        same_window = {"$eq": ["$window", index]}
+        previous_window = {"$eq": ["$window", index - 1]}
+        doc = self.collection.find_one_and_update(
+            {"_id": key},
+            [{"$set": {
+                # All expressions in one $set see the document as it was before the update
+                "previous": {"$cond": [same_window, "$previous", {"$cond": [previous_window, "$current", 0]}]},
+                "current": {"$cond": [same_window, {"$add": ["$current", 1]}, 1]},
+                "window": index,
+                "expires_at": datetime.utcfromtimestamp(now) + timedelta(seconds=2 * period_seconds)
+            }}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return estimate(doc.get("previous", 0), doc.get("current", 1), elapsed)
+
+    async def hit(self, key: str, period_seconds: int, now: float) -> float:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, self.hit_sync, key, period_seconds, now)
+        except Exception as e:
+            logger.warning(f"Shared rate limit store unavailable, allowing request: {e}")
+            return 0.0
+
+
+class SlidingWindowLimiter:
+    """Checks keys against a limit per period using a counter store."""
+
+    def __init__(self, store=None):
+        self.store = store or InMemoryStore()
+
+    async def allow(self, key: str, limit: int, period_seconds: int) -> Tuple[bool, int]:
+        """
+        Record an attempt and decide whether it is within the limit.
+
+        Returns:
+            (allowed, retry_after_seconds)
+        """
+        now = time.time()
+        count = await self.store.hit(key, period_seconds, now)
+        if count <= limit:
+            return True, 0
+        _, elapsed = window_position(now, period_seconds)
+        return False, max(1, math.ceil((1.0 - elapsed) * period_seconds))
+
+
+def create_store(collection_factory: Callable = None):
+    """Build the store selected by RATE_LIMIT_STORE."""
+    if RATE_LIMIT_STORE == "mongo":
+        if collection_factory is None:
+            raise ValueError("RATE_LIMIT_STORE=mongo needs a collection")
+        return MongoStore(collection_factory)
+    return InMemoryStore()
@@ -1,10 +1,25 @@
 """
 Rate limiting for AI meal plan generation
+
+Usage lives in its own small collection (one document per user) instead of an
+ever-growing array on the user document:
+
+    {_id: <user ObjectId>, requests: [<datetime>, ...], last_request, expires_at}
+
+`requests` only ever holds the timestamps of the last 24 hours, capped at the
+daily limit, so documents stay tiny. The limit check and the recording of a
+new request are a single conditional update, which means two concurrent
+requests can't both pass. Documents of users that stop generating plans are
+removed by a TTL index on `expires_at`.
+
+Usage used to be stored in `users.ai_meal_plan_usage`; migrate_ai_usage.py
+moves what is still relevant over and removes the old field.
 """
 from datetime import datetime, timedelta
-from typing import Dict, Tuple
+from typing import Dict, List
 from fastapi import HTTPException
 from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 import logging
 
@@ -16,154 +31,195 @@ RATE_LIMITS = {
     "meal_plan_per_day": 3,        # Max 3 meal plans per day
 }
 
-def check_rate_limit(user_id: str, users_collection: Collection) -> Tuple[bool, str]:
+AI_USAGE_COLLECTION = "ai_meal_plan_usage"
+
+
+def ensure_usage_indexes(usage_collection: Collection) -> None:
+    """Create the TTL index that removes usage documents of inactive users"""
+    usage_collection.create_index("expires_at", expireAfterSeconds=0, background=True)
+
+
+def _count_since(since: datetime) -> Dict:
+    """Aggregation expression counting request timestamps newer than `since`"""
+    return {"$size": {"$filter": {
+        "input": {"$ifNull": ["$requests", []]},
+        "cond": {"$gt": ["$$this", since]}
+    }}}
+
+
+def reserve_meal_plan_request(user_id: str, usage_collection: Collection) -> datetime:
     """
-    Check if user has exceeded rate limits for AI meal plan generation
+    Check the rate limits and record a meal plan request in one atomic update
 
     Args:
         user_id: User's MongoDB ObjectId as string
-        users_collection: MongoDB users collection
+        usage_collection: AI meal plan usage collection
 
     Returns:
-        (is_allowed, error_message) - True if allowed, False with error message if exceeded
+        Timestamp of the recorded request (pass it to release_meal_plan_request
+        if generation fails)
 
     Raises:
         HTTPException: If rate limit is exceeded
     """
-    try:
-        user_doc = users_collection.find_one({"_id": ObjectId(user_id)})
-        if not user_doc:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        # Get or initialize usage tracking
-        usage = user_doc.get("ai_meal_plan_usage", {
-            "requests": [],
-            "last_reset": datetime.utcnow()
-        })
-
-        # Clean up old requests (keep only last 24 hours)
-        now = datetime.utcnow()
-        one_hour_ago = now - timedelta(hours=1)
-        one_day_ago = now - timedelta(days=1)
-
-        # Filter to keep only recent requests
-        recent_requests = [
-            req for req in usage.get("requests", [])
-            if isinstance(req, datetime) and req > one_day_ago
-        ]
-
-        # Count requests in the last hour and day
-        requests_last_hour = sum(1 for req in recent_requests if req > one_hour_ago)
-        requests_last_day = len(recent_requests)
-
-        # Check limits
-        if requests_last_hour >= RATE_LIMITS["meal_plan_per_hour"]:
-            logger.warning(f"User {user_id} exceeded hourly rate limit: {requests_last_hour}/{RATE_LIMITS['meal_plan_per_hour']}")
-            raise HTTPException(
-                status_code=429,
-                detail=f"Rate limit exceeded. You can generate {RATE_LIMITS['meal_plan_per_hour']} meal plan per hour. Please try again later."
-            )
-
-        if requests_last_day >= RATE_LIMITS["meal_plan_per_day"]:
-            logger.warning(f"User {user_id} exceeded daily rate limit: {requests_last_day}/{RATE_LIMITS['meal_plan_per_day']}")
-            raise HTTPException(
-                status_code=429,
-                detail=f"Rate limit exceeded. You can generate {RATE_LIMITS['meal_plan_per_day']} meal plans per day. Please try again tomorrow."
-            )
-
-        return True, ""
+    now = datetime.utcnow()
+    one_hour_ago = now - timedelta(hours=1)
+    one_day_ago = now - timedelta(days=1)
+    daily_limit = RATE_LIMITS["meal_plan_per_day"]
 
+    try:
+        for attempt in range(2):
+            try:
+                # Only matches while both limits have room. If the user's document exists
+                # but is over a limit, the upsert tries to insert a second document with
+                # the same _id and fails with DuplicateKeyError.
+                usage_collection.update_one(
+                    {
+                        "_id": ObjectId(user_id),
+                        "$expr": {"$and": [
+                            {"$lt": [_count_since(one_hour_ago), RATE_LIMITS["meal_plan_per_hour"]]},
+                            {"$lt": [_count_since(one_day_ago), daily_limit]}
+                        ]}
+                    },
+                    [{"$set": {
+                        # Drop timestamps older than a day and append this request
+                        "requests": {"$slice": [
+                            {"$concatArrays": [
+                                {"$filter": {
+                                    "input": {"$ifNull": ["$requests", []]},
+                                    "cond": {"$gt": ["$$this", one_day_ago]}
+                                }},
+                                [now]
+                            ]},
+                            -daily_limit
+                        ]},
+                        "last_request": now,
+                        "expires_at": now + timedelta(days=1)
+                    }}],
+                    upsert=True
+                )
+                logger.info(f"Recorded meal plan request for user {user_id}")
+                return now
+            except DuplicateKeyError:
+                status = get_rate_limit_status(user_id, usage_collection)
+                if attempt == 0 and status["remaining_hour"] > 0 and status["remaining_day"] > 0:
+                    # Lost the race to create the user's document (MongoDB doesn't retry
+                    # upserts with $expr filters); it exists now, so the update can match
+                    continue
+                _raise_limit_exceeded(user_id, status)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error checking rate limit for user {user_id}: {e}")
         # In case of error, allow the request (fail open)
-        return True, ""
+        return now
+
 
-def record_meal_plan_request(user_id: str, users_collection: Collection) -> None:
+def _raise_limit_exceeded(user_id: str, status: Dict) -> None:
+    if status["remaining_hour"] == 0:
+        logger.warning(f"User {user_id} exceeded hourly rate limit: {status['requests_last_hour']}/{RATE_LIMITS['meal_plan_per_hour']}")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded. You can generate {RATE_LIMITS['meal_plan_per_hour']} meal plan per hour. Please try again later."
+        )
+    logger.warning(f"User {user_id} exceeded daily rate limit: {status['requests_last_day']}/{RATE_LIMITS['meal_plan_per_day']}")
+    raise HTTPException(
+        status_code=429,
+        detail=f"Rate limit exceeded. You can generate {RATE_LIMITS['meal_plan_per_day']} meal plans per day. Please try again tomorrow."
+    )
+
+
+def release_meal_plan_request(user_id: str, requested_at: datetime, usage_collection: Collection) -> None:
     """
-    Record a successful meal plan generation request for rate limiting
+    Give back a reserved request when meal plan generation failed
 
     Args:
         user_id: User's MongoDB ObjectId as string
-        users_collection: MongoDB users collection
+        requested_at: Timestamp returned by reserve_meal_plan_request
+        usage_collection: AI meal plan usage collection
     """
     try:
-        now = datetime.utcnow()
-
-        # Add current timestamp to requests array
-        users_collection.update_one(
+        usage_collection.update_one(
             {"_id": ObjectId(user_id)},
-            {
-                "$push": {
-                    "ai_meal_plan_usage.requests": now
-                },
-                "$set": {
-                    "ai_meal_plan_usage.last_request": now
-                }
-            },
-            upsert=True
+            {"$pull": {"requests": requested_at}}
         )
-
-        logger.info(f"Recorded meal plan request for user {user_id}")
-
     except Exception as e:
-        logger.error(f"Error recording meal plan request for user {user_id}: {e}")
-        # Don't fail the request if we can't record it
+        logger.error(f"Error releasing meal plan request for user {user_id}: {e}")
+        # Don't fail the request if we can't release it
+
 
-def get_rate_limit_status(user_id: str, users_collection: Collection) -> Dict:
+def get_rate_limit_status(user_id: str, usage_collection: Collection) -> Dict:
     """
     Get current rate limit status for a user
 
     Args:
         user_id: User's MongoDB ObjectId as string
-        users_collection: MongoDB users collection
+        usage_collection: AI meal plan usage collection
 
     Returns:
         Dict with rate limit information
     """
+    requests_last_hour = 0
+    requests_last_day = 0
     try:
-        user_doc = users_collection.find_one({"_id": ObjectId(user_id)})
-        if not user_doc:
-            return {
-                "requests_last_hour": 0,
-                "requests_last_day": 0,
-                "hourly_limit": RATE_LIMITS["meal_plan_per_hour"],
-                "daily_limit": RATE_LIMITS["meal_plan_per_day"]
-            }
-
-        usage = user_doc.get("ai_meal_plan_usage", {})
-        recent_requests = usage.get("requests", [])
+        usage = usage_collection.find_one({"_id": ObjectId(user_id)}, {"requests": 1, "_id": 0}) or {}
 
         now = datetime.utcnow()
         one_hour_ago = now - timedelta(hours=1)
         one_day_ago = now - timedelta(days=1)
 
-        requests_last_hour = sum(
-            1 for req in recent_requests
-            if isinstance(req, datetime) and req > one_hour_ago
-        )
-        requests_last_day = sum(
-            1 for req in recent_requests
-            if isinstance(req, datetime) and req > one_day_ago
-        )
-
-        return {
-            "requests_last_hour": requests_last_hour,
-            "requests_last_day": requests_last_day,
-            "hourly_limit": RATE_LIMITS["meal_plan_per_hour"],
-            "daily_limit": RATE_LIMITS["meal_plan_per_day"],
-            "remaining_hour": max(0, RATE_LIMITS["meal_plan_per_hour"] - requests_last_hour),
-            "remaining_day": max(0, RATE_LIMITS["meal_plan_per_day"] - requests_last_day)
-        }
+        for req in usage.get("requests", []):
+            if req > one_day_ago:
+                requests_last_day += 1
+                if req > one_hour_ago:
+                    requests_last_hour += 1
 
     except Exception as e:
         logger.error(f"Error getting rate limit status for user {user_id}: {e}")
-        return {
-            "requests_last_hour": 0,
-            "requests_last_day": 0,
-            "hourly_limit": RATE_LIMITS["meal_plan_per_hour"],
-            "daily_limit": RATE_LIMITS["meal_plan_per_day"],
-            "remaining_hour": RATE_LIMITS["meal_plan_per_hour"],
-            "remaining_day": RATE_LIMITS["meal_plan_per_day"]
-        }
+
+    return {
+        "requests_last_hour": requests_last_hour,
+        "requests_last_day": requests_last_day,
+        "hourly_limit": RATE_LIMITS["meal_plan_per_hour"],
+        "daily_limit": RATE_LIMITS["meal_plan_per_day"],
+        "remaining_hour": max(0, RATE_LIMITS["meal_plan_per_hour"] - requests_last_hour),
+        "remaining_day": max(0, RATE_LIMITS["meal_plan_per_day"] - requests_last_day)
+    }
+
+
+def migrate_legacy_usage(users_collection: Collection, usage_collection: Collection) -> int:
+    """
+    Move request timestamps from users.ai_meal_plan_usage into the usage collection and drop the old field
+
+    Only requests from the last 24 hours still count towards a limit, so
+    older ones are discarded. Safe to re-run.
+
+    Args:
+        users_collection: MongoDB users collection
+        usage_collection: AI meal plan usage collection
+
+    Returns:
+        Number of users migrated
+    """
+    now = datetime.utcnow()
+    one_day_ago = now - timedelta(days=1)
+    daily_limit = RATE_LIMITS["meal_plan_per_day"]
+    migrated = 0
+    for user in users_collection.find({"ai_meal_plan_usage": {"$exists": True}}, {"ai_meal_plan_usage": 1}):
+        legacy = (user.get("ai_meal_plan_usage") or {}).get("requests") or []
+        recent: List[datetime] = [r for r in legacy if isinstance(r, datetime) and r > one_day_ago]
+        if recent:
+            current = usage_collection.find_one({"_id": user["_id"]}, {"requests": 1}) or {}
+            requests = sorted(set(recent) | {r for r in current.get("requests", []) if r > one_day_ago})[-daily_limit:]
+            usage_collection.update_one(
+                {"_id": user["_id"]},
+                {"$set": {
+                    "requests": requests,
+                    "last_request": requests[-1],
+                    "expires_at": requests[-1] + timedelta(days=1)
+                }},
+                upsert=True
+            )
+        users_collection.update_one({"_id": user["_id"]}, {"$unset": {"ai_meal_plan_usage": ""}})
+        migrated += 1
+    return migrated
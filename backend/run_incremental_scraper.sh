@@ -35,6 +35,10 @@ python3 incremental_scraper.py 2>&1 | tee -a "$LOG_FILE"
 # Capture exit code
 EXIT_CODE=${PIPESTATUS[0]}
 
+# Log today's recorded coverage (reads the scrape_coverage document, no scan)
+echo "Coverage after run:" | tee -a "$LOG_FILE"
+python3 incremental_scraper.py --check-coverage 2>&1 | tee -a "$LOG_FILE"
+
 echo "===============================================" | tee -a "$LOG_FILE"
 echo "Incremental Menu Scraper Finished: $(date)" | tee -a "$LOG_FILE"
 echo "Exit Code: $EXIT_CODE" | tee -a "$LOG_FILE"
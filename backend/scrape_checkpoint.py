@@ -0,0 +1,173 @@
+"""
+Append-only scrape checkpoints.
+
+A scrape run writes one JSON line per scraped meal (and one per finished
+dining hall) to checkpoints/<scraper>_<campus>_<date>.jsonl. Each line is flushed as
+soon as the meal is extracted, so a crash loses at most the meal in progress,
+and writing a checkpoint costs O(meal) instead of re-serializing everything
+scraped so far.
+
+With --resume the scrapers reopen the same log, skip halls and meals that are
+already in it and continue appending. The final JSON export and the MongoDB
+upload stream food documents straight from the log, so the full scrape never
+has to be held in memory.
+"""
+import datetime
+import json
+import logging
+import os
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.getenv("SCRAPE_CHECKPOINT_DIR", "checkpoints")
+
+MEAL_RECORD = "meal"
+HALL_DONE_RECORD = "hall_done"
+
+
+class CheckpointLog:
+    """Append-only JSONL log of the meals scraped in one run."""
+
+    def __init__(self, path: str, date: str, campus: str):
+        self.path = path
+        self.date = date
+        self.campus = campus
+        self._completed_halls: Set[str] = set()
+        self._completed_meals: Set[Tuple[str, str]] = set()
+
+    @classmethod
+    def open(cls, scraper_name: str, date: str, campus: str, resume: bool = False,
+             directory: str = CHECKPOINT_DIR) -> "CheckpointLog":
+        """
+        Open the checkpoint log for a scraper, campus and date.
+
+        Args:
+            scraper_name: Prefix identifying the scraper (e.g. "menu_scraper")
+            date: Menu date in YYYY-MM-DD format
+            campus: Campus being scraped (stored on every food document)
+            resume: Keep and load an existing log instead of starting a new one
+
+        Returns:
+            CheckpointLog ready for appending
+        """
+        os.makedirs(directory, exist_ok=True)
+        log = cls(os.path.join(directory, f"{scraper_name}_{campus}_{date}.jsonl"), date, campus)
+
+        if resume and os.path.exists(log.path):
+            log._load_progress()
+            logger.info(f"Resuming from {log.path}: {len(log._completed_halls)} halls, "
+                        f"{len(log._completed_meals)} meals already scraped")
+        else:
+            open(log.path, "w").close()
+        return log
+
+    def _records(self) -> Iterator[Dict[str, Any]]:
+        """Read records, skipping a partially written last line after a crash."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping truncated checkpoint line in {self.path}")
+
+    def _load_progress(self):
+        for record in self._records():
+            if record["type"] == MEAL_RECORD:
+                self._completed_meals.add((record["dining_hall"], record["meal_name"]))
+            elif record["type"] == HALL_DONE_RECORD:
+                self._completed_halls.add(record["dining_hall"])
+
+    def _append(self, record: Dict[str, Any]):
+        record["timestamp"] = datetime.datetime.now().isoformat()
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append_meal(self, dining_hall: str, meal_name: str, stations: List[Dict[str, Any]]):
+        """Record one scraped meal."""
+        self._append({
+            "type": MEAL_RECORD,
+            "dining_hall": dining_hall,
+            "meal_name": meal_name,
+            "stations": stations
+        })
+        self._completed_meals.add((dining_hall, meal_name))
+
+    def mark_hall_complete(self, dining_hall: str):
+        """Record that every meal of a dining hall has been processed."""
+        self._append({"type": HALL_DONE_RECORD, "dining_hall": dining_hall})
+        self._completed_halls.add(dining_hall)
+
+    def is_hall_complete(self, dining_hall: str) -> bool:
+        return dining_hall in self._completed_halls
+
+    def is_meal_complete(self, dining_hall: str, meal_name: str) -> bool:
+        return (dining_hall, meal_name) in self._completed_meals
+
+    def has_meals(self, dining_hall: Optional[str] = None) -> bool:
+        """Whether any meal (optionally of one dining hall) has been recorded."""
+        if dining_hall is None:
+            return bool(self._completed_meals)
+        return any(hall == dining_hall for hall, _ in self._completed_meals)
+
+    def completed_halls(self) -> List[str]:
+        return sorted(self._completed_halls)
+
+    def iter_meals(self) -> Iterator[Dict[str, Any]]:
+        """
+        Stream meal records in log order.
+
+        If a meal was scraped twice (e.g. retried after a crash), only its
+        last record is returned.
+        """
+        last_seen: Dict[Tuple[str, str], int] = {}
+        for index, record in enumerate(self._records()):
+            if record["type"] == MEAL_RECORD:
+                last_seen[(record["dining_hall"], record["meal_name"])] = index
+
+        for index, record in enumerate(self._records()):
+            if record["type"] == MEAL_RECORD and last_seen[(record["dining_hall"], record["meal_name"])] == index:
+                yield record
+
+    def iter_foods(self) -> Iterator[Dict[str, Any]]:
+        """Stream food documents in the shape stored in MongoDB (same as save_to_json)."""
+        hall_ids: Dict[str, str] = {}
+        for meal in self.iter_meals():
+            dining_hall = meal["dining_hall"]
+            dining_hall_id = hall_ids.setdefault(dining_hall, str(uuid.uuid4()))
+            for station in meal.get("stations", []):
+                station_id = str(uuid.uuid4())
+                for item in station.get("items", []):
+                    food_doc = item.copy()
+                    food_doc.update({
+                        "dining_hall": dining_hall,
+                        "dining_hall_id": dining_hall_id,
+                        "meal_name": meal["meal_name"],
+                        "station": station["name"],
+                        "station_id": station_id,
+                        "date": self.date,
+                        "campus": self.campus
+                    })
+                    yield food_doc
+
+    def export_json(self, filename: str) -> int:
+        """
+        Stream the food documents into a JSON array file.
+
+        Returns:
+            Number of foods written
+        """
+        count = 0
+        with open(filename, "w") as f:
+            f.write("[")
+            for food in self.iter_foods():
+                f.write(",\n" if count else "\n")
+                f.write(json.dumps(food))
+                count += 1
+            f.write("\n]\n")
+        return count
@@ -0,0 +1,211 @@
+"""
+Scrape coverage tracking for dining hall menus.
+
+Computes which dining hall / meal combinations have food data for a campus
+and date using a single aggregation that is covered by the
+campus_date_hall_meal_idx index, and persists the result as one document per
+(campus, date) in the scrape_coverage collection. The incremental scraper,
+the scrape scheduler and the API read that document to check completeness
+without scanning the foods collection. Campuses are kept apart because the
+scheduler scrapes several of them and hall names can repeat across campuses.
+"""
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+from food_catalog import menu_collection
+
+logger = logging.getLogger(__name__)
+
+COVERAGE_COLLECTION = "scrape_coverage"
+COVERING_INDEX = "campus_date_hall_meal_idx"
+DATE_COVERING_INDEX = "date_hall_meal_idx"
+
+# Campus of menu data scraped without an explicit campus (and of data stored before campuses were recorded)
+DEFAULT_CAMPUS = os.getenv("SCRAPE_CAMPUS", "utah")
+
+_CAMPUS_URL_RE = re.compile(r"dineoncampus\.com/([^/?#]+)")
+
+
+def campus_from_url(url: str) -> str:
+    """Campus slug of a dineoncampus.com menu URL (DEFAULT_CAMPUS for other URLs)."""
+    match = _CAMPUS_URL_RE.search(url or "")
+    return match.group(1).lower() if match else DEFAULT_CAMPUS
+
+
+def coverage_id(campus: str, date: str) -> str:
+    return f"{campus}:{date}"
+
+
+def coverage_pipeline(date: str, campus: Optional[str] = None) -> List[Dict]:
+    """
+    Build the aggregation that counts items per dining hall and meal for a date.
+
+    The $project only keeps fields that live in the covering index (and drops
+    _id), so MongoDB answers the whole pipeline from the index. Without a
+    campus, every campus's menus for the date are counted together.
+    """
+    match = {"campus": campus, "date": date} if campus else {"date": date}
+    return [
+        {"$match": match},
+        {"$project": {"_id": 0, "dining_hall": 1, "meal_name": 1}},
+        {"$group": {
+            "_id": {"dining_hall": "$dining_hall", "meal_name": "$meal_name"},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id.dining_hall": 1, "_id.meal_name": 1}}
+    ]
+
+
+def compute_coverage(foods_collection, date: str, campus: Optional[str] = None) -> List[Dict]:
+    """
+    Compute the coverage rows for a date (of one campus, or of all) in one round trip.
+
+    Returns:
+        [{"dining_hall": str, "meal_name": str, "count": int}, ...]
+    """
+    pipeline = coverage_pipeline(date, campus)
+    try:
+        cursor = foods_collection.aggregate(pipeline, hint=COVERING_INDEX if campus else DATE_COVERING_INDEX)
+    except OperationFailure:
+        # Index not created yet (fresh database) - let the planner choose
+        cursor = foods_collection.aggregate(pipeline)
+
+    rows = []
+    for row in cursor:
+        dining_hall = row["_id"].get("dining_hall")
+        meal_name = row["_id"].get("meal_name")
+        if dining_hall and meal_name:
+            rows.append({
+                "dining_hall": dining_hall,
+                "meal_name": meal_name,
+                "count": row["count"]
+            })
+    return rows
+
+
+def refresh_coverage(db, date: str, campus: str = DEFAULT_CAMPUS,
+                     expected_halls: Optional[List[str]] = None,
+                     scraped: Optional[Iterable[Tuple[str, str]]] = None) -> Dict:
+    """
+    Recompute a campus's coverage for a date and persist it to the scrape_coverage collection.
+
+    last_update is when a meal was last (re)scraped: it is set for the
+    combinations in `scraped`, and for combinations whose item count
+    changed; every other combination keeps its previous value. The scrape
+    scheduler judges freshness by it, so an unchanged menu that was just
+    re-scraped must count as fresh.
+
+    Args:
+        db: MongoDB database handle
+        date: Date in YYYY-MM-DD format
+        campus: Campus whose menus are counted
+        expected_halls: Optional list of dining halls listed on the menu site
+        scraped: (dining_hall, meal_name) combinations uploaded by the caller
+
+    Returns:
+        The persisted coverage document
+    """
+    coverage_collection = db[COVERAGE_COLLECTION]
+    now = datetime.utcnow()
+
+    combinations = compute_coverage(menu_collection(db), date, campus)
+
+    previous = coverage_collection.find_one({"_id": coverage_id(campus, date)}, {"combinations": 1}) or {}
+    previous_by_key = {
+        (c["dining_hall"], c["meal_name"]): c
+        for c in previous.get("combinations", [])
+    }
+
+    scraped = set(scraped or ())
+    for combination in combinations:
+        key = (combination["dining_hall"], combination["meal_name"])
+        prior = previous_by_key.get(key)
+        if (key not in scraped and prior and prior.get("count") == combination["count"]
+                and prior.get("last_update")):
+            combination["last_update"] = prior["last_update"]
+        else:
+            combination["last_update"] = now
+
+    doc = {
+        "campus": campus,
+        "date": date,
+        "combinations": combinations,
+        "dining_halls": sorted({c["dining_hall"] for c in combinations}),
+        "total_items": sum(c["count"] for c in combinations),
+        "updated_at": now
+    }
+    if expected_halls is not None:
+        doc["expected_halls"] = sorted(expected_halls)
+
+    return coverage_collection.find_one_and_update(
+        {"_id": coverage_id(campus, date)},
+        {"$set": doc},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def set_expected_halls(db, date: str, expected_halls: List[str], campus: str = DEFAULT_CAMPUS) -> None:
+    """Record the dining halls a campus's menu site lists for a date."""
+    db[COVERAGE_COLLECTION].update_one(
+        {"_id": coverage_id(campus, date)},
+        {"$set": {"campus": campus, "date": date, "expected_halls": sorted(expected_halls)}},
+        upsert=True
+    )
+
+
+def get_coverage(db, date: str, campus: str = DEFAULT_CAMPUS) -> Optional[Dict]:
+    """Read a campus's persisted coverage document for a date (None if never computed)."""
+    return db[COVERAGE_COLLECTION].find_one({"_id": coverage_id(campus, date)})
+
+
+def meals_by_hall(coverage: Optional[Dict]) -> Dict[str, Set[str]]:
+    """Convert a coverage document into {dining_hall: {meal1, meal2, ...}}."""
+    result: Dict[str, Set[str]] = {}
+    if not coverage:
+        return result
+    for combination in coverage.get("combinations", []):
+        result.setdefault(combination["dining_hall"], set()).add(combination["meal_name"])
+    return result
+
+
+def missing_halls(coverage: Optional[Dict]) -> Optional[List[str]]:
+    """
+    List expected dining halls that have no data yet.
+
+    Returns:
+        Sorted list of missing halls, or None when the expected halls are unknown
+    """
+    if not coverage or "expected_halls" not in coverage:
+        return None
+    covered = set(coverage.get("dining_halls", []))
+    return sorted(hall for hall in coverage["expected_halls"] if hall not in covered)
+
+
+def serialize_coverage(coverage: Optional[Dict]) -> Optional[Dict]:
+    """Make a coverage document JSON friendly for API responses."""
+    if not coverage:
+        return None
+
+    def iso(value):
+        return value.isoformat() if isinstance(value, datetime) else value
+
+    return {
+        "campus": coverage.get("campus"),
+        "date": coverage.get("date"),
+        "dining_halls": coverage.get("dining_halls", []),
+        "expected_halls": coverage.get("expected_halls"),
+        "missing_halls": missing_halls(coverage),
+        "total_items": coverage.get("total_items", 0),
+        "updated_at": iso(coverage.get("updated_at")),
+        "combinations": [
+            {**c, "last_update": iso(c.get("last_update"))}
+            for c in coverage.get("combinations", [])
+        ]
+    }
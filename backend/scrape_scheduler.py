@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Scrape scheduler for multiple campuses.
+
+Replaces "cron guesses when meals appear" with freshness targets: every pass
+reads the persisted scrape coverage for today and only schedules work for
+dining halls / meals that are stale:
+
+- a hall with no data, or one that has not been checked for new meals within
+  its check interval, is scraped for its missing meals
+- a meal whose items are older than its freshness target is re-scraped
+  (only with USE_FOOD_CATALOG=true, where catalog IDs stay stable across
+  re-scrapes; legacy foods IDs referenced by plates would otherwise change)
+
+Work items run concurrently across all campuses, but at most
+SCRAPE_BROWSER_BUDGET browsers are open at once. Failed items are retried
+with exponential backoff (without holding a browser slot while waiting), and
+every item is recorded in the scrape_runs collection with its duration for
+capacity planning.
+
+Targets come from SCRAPE_TARGETS, a JSON list such as:
+    [{"campus": "utah", "url": "https://dineoncampus.com/utah/whats-on-the-menu",
+      "check_interval_minutes": 60, "stale_after_minutes": 720,
+      "meal_stale_after_minutes": {"Breakfast": 240}}]
+
+Usage:
+    python scrape_scheduler.py              # One scheduling pass
+    python scrape_scheduler.py --loop       # Run a pass every SCRAPE_POLL_INTERVAL_SECONDS
+    python scrape_scheduler.py --dry-run    # Show the plan without scraping
+    python scrape_scheduler.py --history    # Run statistics for the last 7 days
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, DESCENDING
+from pymongo.server_api import ServerApi
+import certifi
+
+from food_catalog import USE_FOOD_CATALOG
+from scrape_coverage import get_coverage, set_expected_halls
+from incremental_scraper import IncrementalScraper
+
+load_dotenv()
+
+DEFAULT_TARGETS = [{"campus": "utah", "url": "https://dineoncampus.com/utah/whats-on-the-menu"}]
+
+MONGODB_URI = os.getenv("MONGODB_URI")
+BROWSER_BUDGET = int(os.getenv("SCRAPE_BROWSER_BUDGET", "2"))
+CHECK_INTERVAL_MINUTES = int(os.getenv("SCRAPE_CHECK_INTERVAL_MINUTES", "60"))
+STALE_AFTER_MINUTES = int(os.getenv("SCRAPE_STALE_AFTER_MINUTES", "720"))
+MAX_ATTEMPTS = int(os.getenv("SCRAPE_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE_SECONDS = float(os.getenv("SCRAPE_BACKOFF_BASE_SECONDS", "30"))
+POLL_INTERVAL_SECONDS = int(os.getenv("SCRAPE_POLL_INTERVAL_SECONDS", "900"))
+
+SCHEDULE_COLLECTION = "scrape_schedule"
+RUNS_COLLECTION = "scrape_runs"
+
+logger = logging.getLogger("scrape_scheduler")
+
+
+def load_targets() -> List[Dict[str, Any]]:
+    """Read campus targets from SCRAPE_TARGETS (defaults to the Utah menu)."""
+    raw = os.getenv("SCRAPE_TARGETS")
+    if not raw:
+        return DEFAULT_TARGETS
+    targets = json.loads(raw)
+    for target in targets:
+        if not target.get("campus") or not target.get("url"):
+            raise ValueError(f"Scrape target needs 'campus' and 'url': {target}")
+    return targets
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given (1-based) failed attempt."""
+    return BACKOFF_BASE_SECONDS * (2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+
+
+class ScrapeScheduler:
+    """Plans and runs freshness-driven scrapes for several campuses."""
+
+    def __init__(self, mongodb_uri: str, targets: List[Dict[str, Any]], browser_budget: int = BROWSER_BUDGET,
+                 headless: bool = True, dry_run: bool = False):
+        self.mongodb_uri = mongodb_uri
+        self.targets = targets
+        self.headless = headless
+        self.dry_run = dry_run
+        self.browser_slots = threading.BoundedSemaphore(max(1, browser_budget))
+        self.browser_budget = max(1, browser_budget)
+
+        self.client = MongoClient(mongodb_uri, server_api=ServerApi('1'), tlsCAFile=certifi.where())
+        self.db = self.client["nutritionapp"]
+        self.schedule = self.db[SCHEDULE_COLLECTION]
+        self.runs = self.db[RUNS_COLLECTION]
+        self.runs.create_index([("campus", 1), ("started_at", DESCENDING)], background=True)
+
+    def _scraper(self, target: Dict[str, Any]) -> IncrementalScraper:
+        return IncrementalScraper(
+            target_url=target["url"],
+            mongodb_uri=self.mongodb_uri,
+            headless=self.headless,
+            dry_run=self.dry_run,
+            campus=target["campus"]
+        )
+
+    def _state(self, campus: str, date: str) -> Dict[str, Any]:
+        return self.schedule.find_one({"_id": f"{campus}:{date}"}) or {}
+
+    def discover_halls(self, target: Dict[str, Any], date: str) -> List[str]:
+        """Dining halls the campus lists today (cached per campus and date)."""
+        state = self._state(target["campus"], date)
+        if state.get("halls"):
+            return state["halls"]
+
+        with self.browser_slots:
+            halls = self._scraper(target).get_available_dining_halls()
+
+        if halls and not self.dry_run:
+            self.schedule.update_one(
+                {"_id": f"{target['campus']}:{date}"},
+                {"$set": {"campus": target["campus"], "date": date, "halls": halls}},
+                upsert=True
+            )
+            set_expected_halls(self.db, date, halls, target["campus"])
+        return halls
+
+    def plan(self, target: Dict[str, Any], date: str, now: datetime.datetime) -> List[Dict[str, Any]]:
+        """
+        Work out which halls / meals of a campus are stale.
+
+        Returns:
+            [{"campus", "url", "dining_hall", "meals"}, ...] where meals is None
+            for "scrape missing meals" and a list for "re-scrape these meals"
+        """
+        halls = self.discover_halls(target, date)
+        coverage = get_coverage(self.db, date, target["campus"]) or {}
+        last_checked = self._state(target["campus"], date).get("last_checked", {})
+
+        check_interval = datetime.timedelta(minutes=target.get("check_interval_minutes", CHECK_INTERVAL_MINUTES))
+        stale_after = target.get("stale_after_minutes", STALE_AFTER_MINUTES)
+        meal_stale_after = target.get("meal_stale_after_minutes", {})
+
+        combinations_by_hall: Dict[str, List[Dict[str, Any]]] = {}
+        for combination in coverage.get("combinations", []):
+            combinations_by_hall.setdefault(combination["dining_hall"], []).append(combination)
+
+        work = []
+        for hall in halls:
+            combinations = combinations_by_hall.get(hall, [])
+            item = {"campus": target["campus"], "url": target["url"], "dining_hall": hall}
+
+            stale_meals = []
+            if USE_FOOD_CATALOG:
+                for combination in combinations:
+                    limit = datetime.timedelta(minutes=meal_stale_after.get(combination["meal_name"], stale_after))
+                    updated = combination.get("last_update")
+                    if updated and now - updated > limit:
+                        stale_meals.append(combination["meal_name"])
+
+            checked = last_checked.get(hall)
+            if not combinations or not checked or now - checked > check_interval:
+                work.append({**item, "meals": None})
+            if stale_meals:
+                work.append({**item, "meals": stale_meals})
+        return work
+
+    def _run_item(self, item: Dict[str, Any], date: str) -> Dict[str, Any]:
+        """Run one work item with retries; record it in scrape_runs."""
+        target = {"campus": item["campus"], "url": item["url"]}
+        started = datetime.datetime.utcnow()
+        record = {
+            **item,
+            "date": date,
+            "mode": "rescrape" if item["meals"] else "missing",
+            "started_at": started,
+            "attempts": 0,
+            "success": False,
+            "items": 0,
+            "errors": []
+        }
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            record["attempts"] = attempt
+            try:
+                with self.browser_slots:
+                    attempt_started = time.monotonic()
+                    record["items"] = self._scraper(target).scrape_hall(item["dining_hall"], item["meals"])
+                    record["browser_seconds"] = round(time.monotonic() - attempt_started, 2)
+                record["success"] = True
+                break
+            except Exception as e:
+                record["errors"].append(str(e))
+                logger.warning(f"{item['campus']}/{item['dining_hall']} attempt {attempt} failed: {e}")
+                if attempt < MAX_ATTEMPTS:
+                    # Wait outside the browser slot so other halls can use it
+                    time.sleep(backoff_delay(attempt))
+
+        finished = datetime.datetime.utcnow()
+        record["finished_at"] = finished
+        record["duration_seconds"] = round((finished - started).total_seconds(), 2)
+
+        self.runs.insert_one(record)
+        if record["success"] and item["meals"] is None:
+            self.schedule.update_one(
+                {"_id": f"{item['campus']}:{date}"},
+                {"$set": {f"last_checked.{item['dining_hall']}": finished}},
+                upsert=True
+            )
+        return record
+
+    def run_pass(self) -> bool:
+        """
+        Plan every campus and run the stale work concurrently.
+
+        Returns:
+            True if every scheduled item succeeded
+        """
+        date = datetime.date.today().isoformat()
+        now = datetime.datetime.utcnow()
+
+        work = []
+        for target in self.targets:
+            try:
+                work.extend(self.plan(target, date, now))
+            except Exception as e:
+                logger.error(f"Could not plan {target['campus']}: {e}")
+
+        if not work:
+            logger.info("Everything is fresh - nothing to scrape")
+            return True
+
+        for item in work:
+            what = ", ".join(item["meals"]) if item["meals"] else "missing meals"
+            logger.info(f"Scheduled {item['campus']}/{item['dining_hall']}: {what}")
+
+        if self.dry_run:
+            return True
+
+        ok = True
+        # More threads than browsers so retry backoff never blocks a free slot
+        with ThreadPoolExecutor(max_workers=min(len(work), self.browser_budget * 2)) as executor:
+            futures = [executor.submit(self._run_item, item, date) for item in work]
+            for future in as_completed(futures):
+                record = future.result()
+                ok = ok and record["success"]
+                status = "✓" if record["success"] else "✗"
+                logger.info(f"{status} {record['campus']}/{record['dining_hall']}: {record['items']} items "
+                            f"in {record['duration_seconds']}s ({record['attempts']} attempts)")
+        return ok
+
+    def history(self, days: int = 7) -> List[Dict[str, Any]]:
+        """Per campus / hall run statistics for capacity planning."""
+        since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+        return list(self.runs.aggregate([
+            {"$match": {"started_at": {"$gte": since}}},
+            {"$group": {
+                "_id": {"campus": "$campus", "dining_hall": "$dining_hall"},
+                "runs": {"$sum": 1},
+                "failures": {"$sum": {"$cond": ["$success", 0, 1]}},
+                "avg_duration_seconds": {"$avg": "$duration_seconds"},
+                "max_duration_seconds": {"$max": "$duration_seconds"},
+                "avg_browser_seconds": {"$avg": "$browser_seconds"},
+                "items": {"$sum": "$items"}
+            }},
+            {"$sort": {"_id.campus": 1, "_id.dining_hall": 1}}
+        ]))
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Freshness-driven scrape scheduler")
+    parser.add_argument("--loop", action="store_true",
+                        help=f"Keep running, one pass every {POLL_INTERVAL_SECONDS} seconds")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show the scheduled work without scraping")
+    parser.add_argument("--history", action="store_true",
+                        help="Print run statistics for the last 7 days and exit")
+    parser.add_argument("--browser-budget", type=int, default=BROWSER_BUDGET,
+                        help=f"Maximum concurrent browsers (default: {BROWSER_BUDGET})")
+    parser.add_argument("--no-headless", action="store_false", dest="headless",
+                        help="Run browsers in non-headless mode for debugging")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    if not MONGODB_URI:
+        logger.error("MONGODB_URI environment variable is required")
+        sys.exit(1)
+
+    scheduler = ScrapeScheduler(
+        MONGODB_URI,
+        load_targets(),
+        browser_budget=args.browser_budget,
+        headless=args.headless,
+        dry_run=args.dry_run
+    )
+
+    if args.history:
+        for row in scheduler.history():
+            key = row["_id"]
+            logger.info(f"{key['campus']}/{key['dining_hall']}: {row['runs']} runs, {row['failures']} failed, "
+                        f"avg {row['avg_duration_seconds'] or 0:.1f}s, max {row['max_duration_seconds'] or 0:.1f}s, "
+                        f"{row['items']} items")
+        return
+
+    if not args.loop:
+        sys.exit(0 if scheduler.run_pass() else 1)
+
+    while True:
+        try:
+            scheduler.run_pass()
+        except Exception as e:
+            logger.error(f"Scheduler pass failed: {e}")
+        time.sleep(POLL_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Per-user daily energy and macro targets.
+
+Targets are computed once from the profile (Mifflin-St Jeor BMR, activity
+multiplier, weight goal adjustment and macro ratios, see
+meal_planning/target_calculation.py) and stored on the user document under
+`targets`. They are recomputed when the profile changes (update_profile
+writes them together with the profile) and on the first read of a new day,
+so a birthday rolls the age over without any profile change.
+
+The profile endpoints, the meal planner and the AI agent all read targets
+through get_targets.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from auth_util import invalidate_user_cache
+from meal_planning.target_calculation import (
+    calculate_age, calculate_energy_target_from_profile, get_macro_targets_from_profile
+)
+
+logger = logging.getLogger(__name__)
+
+# Bump when the target formulas change so stored targets are recomputed
+TARGETS_VERSION = 1
+
+
+def compute_targets(profile: Dict[str, Any], today: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Daily targets for a profile.
+
+    Returns:
+        {daily_calories, macro_percentages: {protein, carbs, fat},
+         protein_grams, carb_grams, fat_grams, age, computed_on, version}
+    """
+    today = today or datetime.today()
+    daily_calories = calculate_energy_target_from_profile(profile)
+    macro_percentages = get_macro_targets_from_profile(profile)
+    return {
+        "daily_calories": daily_calories,
+        "macro_percentages": macro_percentages,
+        "protein_grams": round((daily_calories * (macro_percentages["protein"] / 100)) / 4),
+        "carb_grams": round((daily_calories * (macro_percentages["carbs"] / 100)) / 4),
+        "fat_grams": round((daily_calories * (macro_percentages["fat"] / 100)) / 9),
+        "age": calculate_age(profile.get("birthday"), today),
+        "computed_on": today.strftime("%Y-%m-%d"),
+        "version": TARGETS_VERSION
+    }
+
+
+def targets_are_current(targets: Optional[Dict[str, Any]], today: Optional[datetime] = None) -> bool:
+    """Whether stored targets were computed today with the current formulas."""
+    if not targets:
+        return False
+    today = today or datetime.today()
+    return (targets.get("version") == TARGETS_VERSION
+            and targets.get("computed_on") == today.strftime("%Y-%m-%d"))
+
+
+def get_targets(users_collection, user: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Cached targets of a user, recomputed and stored if they are stale.
+
+    Args:
+        users_collection: Users collection
+        user: User document (as returned by get_current_user)
+
+    Returns:
+        Targets as described in compute_targets
+    """
+    targets = user.get("targets")
+    if targets_are_current(targets):
+        return targets
+
+    targets = compute_targets(user.get("profile") or {})
+    try:
+        users_collection.update_one({"_id": user["_id"]}, {"$set": {"targets": targets}})
+        if user.get("email"):
+            invalidate_user_cache(user["email"])
+    except Exception as e:
+        # Serving the freshly computed targets is still correct
+        logger.warning(f"Failed to store targets for user {user.get('_id')}: {e}")
+    user["targets"] = targets
+    return targets
+
+
+def profile_with_targets(profile: Dict[str, Any], targets: Dict[str, Any]) -> Dict[str, Any]:
+    """Profile copy with the calculated fields the profile page displays."""
+    return {
+        **profile,
+        "daily_calorie_target": targets["daily_calories"],
+        "protein_grams": targets["protein_grams"],
+        "carb_grams": targets["carb_grams"],
+        "fat_grams": targets["fat_grams"]
+    }
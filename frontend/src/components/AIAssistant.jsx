@@ -25,6 +25,8 @@ const AIAssistant = ({
     const [isLoading, setIsLoading] = useState(false)
     const [isStreaming, setIsStreaming] = useState(false)
     const messagesEndRef = useRef(null)
+    // One agent session per conversation so follow-up questions keep their context
+    const sessionIdRef = useRef(`dashboard_${Date.now()}`)
 
     const scrollToBottom = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -68,7 +70,7 @@ const AIAssistant = ({
                 credentials: 'include',
                 body: JSON.stringify({
                     message: contextualMessage,
-                    session_id: `dashboard_${Date.now()}`
+                    session_id: sessionIdRef.current
                 })
             });
 
@@ -91,20 +93,26 @@ const AIAssistant = ({
             setChatHistory(prev => [...prev, assistantMessage]);
 
             let accumulatedContent = '';
+            // Token frames are small and can be split across reads; keep the incomplete tail
+            let buffer = '';
 
             while (true) {
                 const { done, value } = await reader.read();
                 if (done) break;
 
-                const chunk = decoder.decode(value);
-                const lines = chunk.split('\n');
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
 
                 for (const line of lines) {
                     if (line.startsWith('data: ')) {
                         try {
                             const data = JSON.parse(line.slice(6));
                             
-                            if (data.type === 'response' && data.content) {
+                            if (data.type === 'round_start') {
+                                // A new model round; text before a tool call isn't part of the answer
+                                accumulatedContent = '';
+                            } else if (data.type === 'response' && data.content) {
                                 accumulatedContent += data.content;
                                 setChatHistory(prev => prev.map(msg => 
                                     msg.id === assistantMessageId 
@@ -114,7 +122,7 @@ const AIAssistant = ({
                             } else if (data.type === 'complete') {
                                 setChatHistory(prev => prev.map(msg => 
                                     msg.id === assistantMessageId 
-                                        ? { ...msg, isStreaming: false }
+                                        ? { ...msg, content: data.full_response || msg.content, isStreaming: false }
                                         : msg
                                 ));
                                 setIsStreaming(false);
@@ -162,6 +170,7 @@ const AIAssistant = ({
     };
 
     const clearChat = () => {
+        sessionIdRef.current = `dashboard_${Date.now()}`;
         setChatHistory([
             {
                 id: '1',
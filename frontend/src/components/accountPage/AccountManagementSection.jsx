@@ -49,6 +49,32 @@ export const AccountManagementSection = () => {
     }
   };
 
+  const downloadBlob = (blob, filename) => {
+    const url = URL.createObjectURL(blob);
+    const a = document.createElement('a');
+    a.href = url;
+    a.download = filename;
+    document.body.appendChild(a);
+    a.click();
+    a.remove();
+    URL.revokeObjectURL(url);
+  };
+
+  // PDFs and very large exports are generated in the background; poll until the file is ready
+  const waitForExportJob = async (jobId) => {
+    for (;;) {
+      await new Promise(resolve => setTimeout(resolve, 2000));
+      const res = await fetch(`/api/export-jobs/${jobId}`, { credentials: 'include' });
+      if (!res.ok) return null;
+      const job = await res.json();
+      if (job.status === 'done') return job;
+      if (job.status !== 'queued' && job.status !== 'running') {
+        setExportError(job.error || 'Failed to export data.');
+        return null;
+      }
+    }
+  };
+
   const handleExport = async () => {
     setExportError("");
     try {
@@ -64,42 +90,26 @@ export const AccountManagementSection = () => {
         setExportError(err.error || 'Failed to export data.');
         return false;
       }
-      if (format === 'json') {
-        const blob = new Blob([JSON.stringify(await res.json(), null, 2)], { type: 'application/json' });
-        const url = URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = 'export.json';
-        document.body.appendChild(a);
-        a.click();
-        a.remove();
-        URL.revokeObjectURL(url);
-      } else if (format === 'csv') {
-        const text = await res.text();
-        const blob = new Blob([text], { type: 'text/csv' });
-        const url = URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = 'export.csv';
-        document.body.appendChild(a);
-        a.click();
-        a.remove();
-        URL.revokeObjectURL(url);
-      } else if (format === 'pdf') {
-        const blob = await res.blob();
-        if (blob.type !== 'application/pdf') {
-          setExportError('Failed to generate PDF.');
+      if (res.status === 202) {
+        const job = await waitForExportJob((await res.json()).job_id);
+        if (!job) {
+          setExportError(prev => prev || 'Failed to export data.');
+          return false;
+        }
+        const file = await fetch(`/api/export-jobs/${job.job_id}/download`, { credentials: 'include' });
+        if (!file.ok) {
+          setExportError('Failed to download export.');
           return false;
         }
-        const url = URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = 'export.pdf';
-        document.body.appendChild(a);
-        a.click();
-        a.remove();
-        URL.revokeObjectURL(url);
+        downloadBlob(await file.blob(), job.filename);
+        return true;
+      }
+      const blob = await res.blob();
+      if (format === 'pdf' && blob.type !== 'application/pdf') {
+        setExportError('Failed to generate PDF.');
+        return false;
       }
+      downloadBlob(blob, `export.${format}`);
       return true;
     } catch (err) {
       setExportError('Failed to export data.');
@@ -89,67 +89,16 @@ export default function NutritionHistory() {
     return { start: fmt(start), end: fmt(end) };
   }
 
-  // Helper to aggregate macros by day/week/month
-  function aggregateMacros(data, viewMode) {
-    if (!data || data.length === 0) {
-      return [];
-    }
-    
-    if (viewMode === 'daily') {
-      // Group by date
-      const grouped = {};
-      data.forEach(item => {
-        if (!grouped[item.date]) grouped[item.date] = [];
-        grouped[item.date].push(item);
-      });
-      
-      return Object.entries(grouped).map(([date, items]) => ({
-        name: date,
-        date,
-        calories: items.reduce((sum, i) => sum + ((i.calories || 0) * (i.quantity || 1)), 0),
-        protein: items.reduce((sum, i) => sum + ((i.protein || 0) * (i.quantity || 1)), 0),
-        carbs: items.reduce((sum, i) => sum + ((i.carbs || 0) * (i.quantity || 1)), 0),
-        fat: items.reduce((sum, i) => sum + ((i.fat || 0) * (i.quantity || 1)), 0),
-      })).sort((a, b) => a.date.localeCompare(b.date));
-    } else if (viewMode === 'weekly') {
-      // Group by ISO week
-      const grouped = {};
-      data.forEach(item => {
-        const d = new Date(item.date);
-        // Get ISO week number using proper algorithm
-        const thursday = new Date(d.getTime());
-        thursday.setDate(d.getDate() + 3 - (d.getDay() + 6) % 7);
-        const year = thursday.getFullYear();
-        const firstThursday = new Date(year, 0, 4);
-        const week = 1 + Math.round(((thursday.getTime() - firstThursday.getTime()) / 86400000 - 3 + (firstThursday.getDay() + 6) % 7) / 7);
-        const key = `${year}-W${week}`;
-        if (!grouped[key]) grouped[key] = [];
-        grouped[key].push(item);
-      });
-      return Object.entries(grouped).map(([week, items]) => ({
-        name: week,
-        calories: items.reduce((sum, i) => sum + ((i.calories || 0) * (i.quantity || 1)), 0),
-        protein: items.reduce((sum, i) => sum + ((i.protein || 0) * (i.quantity || 1)), 0),
-        carbs: items.reduce((sum, i) => sum + ((i.carbs || 0) * (i.quantity || 1)), 0),
-        fat: items.reduce((sum, i) => sum + ((i.fat || 0) * (i.quantity || 1)), 0),
-      })).sort((a, b) => a.name.localeCompare(b.name));
-    } else if (viewMode === 'monthly') {
-      // Group by month
-      const grouped = {};
-      data.forEach(item => {
-        const key = item.date.slice(0, 7);
-        if (!grouped[key]) grouped[key] = [];
-        grouped[key].push(item);
-      });
-      return Object.entries(grouped).map(([month, items]) => ({
-        name: month,
-        calories: items.reduce((sum, i) => sum + ((i.calories || 0) * (i.quantity || 1)), 0),
-        protein: items.reduce((sum, i) => sum + ((i.protein || 0) * (i.quantity || 1)), 0),
-        carbs: items.reduce((sum, i) => sum + ((i.carbs || 0) * (i.quantity || 1)), 0),
-        fat: items.reduce((sum, i) => sum + ((i.fat || 0) * (i.quantity || 1)), 0),
-      })).sort((a, b) => a.name.localeCompare(b.name));
-    }
-    return [];
+  // Map server-side history buckets to chart points (totals per day/week/month)
+  function bucketsToChartData(buckets) {
+    return (buckets || []).map(bucket => ({
+      name: bucket.name,
+      date: bucket.start_date,
+      calories: bucket.calories.sum,
+      protein: bucket.protein.sum,
+      carbs: bucket.carbs.sum,
+      fat: bucket.fat.sum,
+    }));
   }
 
   // Helper to fill missing dates with zero values for daily view
@@ -373,16 +322,15 @@ export default function NutritionHistory() {
       updateLoadingState('insights', 'loading');
       setMacroError(null);
       try {
-        const { data, error } = await fetchWithAuth(`/api/plate/food-macros?start_date=${start}&end_date=${end}`);
+        const { data, error } = await fetchWithAuth(`/api/plate/history?start_date=${start}&end_date=${end}&granularity=daily`);
         if (error) throw new Error(error);
         if (!data) {
           console.warn('No macro data received from API');
           setMacroData([]);
           return;
         }
-        const foodMacros = data;
-        // Always use daily aggregation for nutrition insights
-        const aggregated = aggregateMacros(foodMacros, 'daily');
+        // Always use daily buckets for nutrition insights
+        const aggregated = bucketsToChartData(data);
         setMacroData(fillMissingDates(aggregated, start, end));
         updateLoadingState('insights', 'loaded');
       } catch (err) {
@@ -402,15 +350,14 @@ export default function NutritionHistory() {
       updateLoadingState('energyChart', 'loading');
       setEnergyChartError(null);
       try {
-        const { data, error } = await fetchWithAuth(`/api/plate/food-macros?start_date=${start}&end_date=${end}`);
+        const { data, error } = await fetchWithAuth(`/api/plate/history?start_date=${start}&end_date=${end}&granularity=${viewMode}`);
         if (error) throw new Error(error);
         if (!data) {
           console.warn('No energy chart data received from API');
           setEnergyChartData([]);
           return;
         }
-        const foodMacros = data;
-        const aggregated = aggregateMacros(foodMacros, viewMode);
+        const aggregated = bucketsToChartData(data);
         
         if (viewMode === 'daily') {
           setEnergyChartData(fillMissingDates(aggregated, start, end));